@@ -0,0 +1,320 @@
+# async_services.py
+# Phiên bản async (AsyncSession + asyncpg) của các hàm CRUD trong services.py.
+# Tên hàm giữ GIỐNG HỆT services.py để main có thể gọi qua dispatch().
+from models import Book, User, Category, Product, ProductImage
+from schemas import BookCreate, UserCreate, CategoryCreate, ProductCreate
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import UploadFile, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+import inspect
+import os
+import secrets
+import time
+import auth
+import services
+import category_tree
+import pagination
+import image_io
+from image_pipeline import pipeline as image_pipeline
+import cache
+import listing
+import search
+import uow
+import principal_cache
+import popularity
+
+# --- BOOK ---
+
+@cache.invalidates("books")
+async def create_book(db: AsyncSession, data: BookCreate):
+    book_instance = Book(**data.model_dump())
+    db.add(book_instance)
+    await uow.commit_async(db)
+    return book_instance
+
+async def get_all_book(db: AsyncSession, limit: int = 50, cursor: str | None = None,
+                       sort: str = "id", order: str = "asc"):
+    """Lấy sách theo trang (keyset pagination, xem pagination.py)."""
+    stmt = pagination.keyset_paginate(select(Book), Book, sort, order, cursor, limit)
+    result = await db.execute(stmt)
+    return pagination.build_page(result.scalars().all(), sort, order, limit)
+
+async def estimate_total(db: AsyncSession, table_name: str) -> int:
+    """Ước lượng số dòng của bảng (không COUNT(*) trên Postgres)."""
+    stmt = pagination.estimate_count_stmt(db.get_bind().dialect.name, table_name)
+    total = (await db.execute(stmt)).scalar()
+    if total is None or total < 0:
+        total = (await db.execute(pagination.estimate_count_stmt("", table_name))).scalar()
+    return total
+
+async def get_book(db: AsyncSession, book_id: int):
+    return await db.get(Book, book_id)
+
+@cache.invalidates("books")
+async def update_book(db: AsyncSession, book: BookCreate, book_id: int):
+    result = await db.execute(services.update_book_stmt(book_id, book.model_dump()))
+    book_queryset = result.scalars().first()
+    if book_queryset:
+        search.track(db.sync_session, "books", [book_id])
+        await uow.commit_async(db)
+    return book_queryset
+
+@cache.invalidates("books")
+async def delete_book(db: AsyncSession, id: int):
+    result = await db.execute(services.delete_book_stmt(id))
+    book_queryset = result.scalars().first()
+    if book_queryset:
+        search.track(db.sync_session, "books", [id])
+        await uow.commit_async(db)
+    return book_queryset
+
+# --- CATEGORY ---
+
+# Các thao tác ghi trên cây category (duy trì materialized path) dùng lại
+# logic của services.py qua run_sync: IO vẫn đi qua asyncpg trong greenlet.
+
+async def create_category(db: AsyncSession, data: CategoryCreate):
+    return await db.run_sync(services.create_category, data)
+
+async def get_root_categories(db: AsyncSession, view: str = "detail"):
+    """Chỉ lấy các category gốc; cả cây lấy bằng 1 câu SELECT rồi ghép trong bộ nhớ."""
+    if view == "summary":
+        result = await db.execute(category_tree.subtree_rows_stmt())
+        return category_tree.assemble_rows(result.all())
+    result = await db.execute(category_tree.subtree_stmt())
+    return category_tree.assemble(result.unique().scalars().all())
+
+async def get_all_category(db: AsyncSession):
+    result = await db.execute(select(Category))
+    return result.scalars().all()
+
+async def get_category(db: AsyncSession, category_id: int):
+    return await db.get(Category, category_id)
+
+async def category_path(db: AsyncSession, category_id: int) -> str | None:
+    """Path của category (None nếu không tồn tại), xem services.category_path."""
+    return await db.scalar(category_tree.paths_stmt(category_id))
+
+async def get_category_tree(db: AsyncSession, category_id: int, view: str = "detail"):
+    """Lấy một category kèm toàn bộ cây con (tra path rồi 1 câu SELECT theo path)."""
+    path = await category_path(db, category_id)
+    if path is None:
+        return None
+    if view == "summary":
+        result = await db.execute(category_tree.subtree_rows_stmt(path))
+        roots = category_tree.assemble_rows(result.all(), root_id=category_id)
+        return roots[0] if roots else None
+    result = await db.execute(category_tree.subtree_stmt(path))
+    roots = category_tree.assemble(result.unique().scalars().all(), root_id=category_id)
+    return roots[0] if roots else None
+
+async def get_category_ancestors(db: AsyncSession, category_id: int):
+    """Breadcrumb: các tổ tiên từ gốc xuống tới chính category đó."""
+    path = await category_path(db, category_id)
+    if path is None:
+        return []
+    result = await db.execute(category_tree.ancestors_stmt(path))
+    return result.scalars().all()
+
+async def get_category_products(db: AsyncSession, category_id: int, skip: int = 0, limit: int = 10,
+                                view: str = "detail"):
+    """Sản phẩm thuộc category HOẶC bất kỳ category con cháu nào (có phân trang)."""
+    path = await category_path(db, category_id)
+    if path is None:
+        return []
+    result = await db.execute(services.category_products_stmt(path, skip, limit, view))
+    return services.product_rows(result, services.PRODUCT_SUMMARY_FIELDS if view == "summary" else None)
+
+async def update_category(db: AsyncSession, category: CategoryCreate, category_id: int):
+    return await db.run_sync(services.update_category, category, category_id)
+
+async def delete_category(db: AsyncSession, category_id: int):
+    return await db.run_sync(services.delete_category, category_id)
+
+@cache.invalidates("categories", "products")
+async def save_category_image(db: AsyncSession, category_id: int, file: UploadFile) -> Category:
+    """Lưu ảnh và cập nhật đường dẫn cho category."""
+    db_category = await get_category(db, category_id)
+    if not db_category:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Category not found")
+
+    file_name = f"{category_id}_{file.filename}"
+    file_path = os.path.join(services.UPLOAD_DIRECTORY, file_name)
+
+    await image_io.save_upload(file, file_path)
+
+    db_category.image_url = os.path.join("images", "categories", file_name).replace("\\", "/")
+    await uow.commit_async(db)
+    return db_category
+
+# --- USER ---
+
+async def get_user_by_email(db: AsyncSession, email: str) -> User | None:
+    """Tìm user bằng email."""
+    result = await db.execute(select(User).where(User.email == email))
+    return result.scalars().first()
+
+async def create_user(db: AsyncSession, user: UserCreate, hashed_password: str | None = None) -> User:
+    """Tạo user mới (cho chức năng signup)."""
+    db_user = User(
+        email=user.email,
+        hashed_password=hashed_password or auth.get_password_hash(user.password)
+    )
+    db.add(db_user)
+    await uow.commit_async(db)
+    return db_user
+
+async def update_password_hash(db: AsyncSession, user_id: int, hashed_password: str):
+    """Lưu hash mới của mật khẩu (rehash-on-login khi tham số bcrypt thay đổi)."""
+    email = (await db.execute(services.update_password_hash_stmt(user_id, hashed_password))).scalar()
+    principal_cache.track(db.sync_session, email)
+    await uow.commit_async(db)
+
+# --- PRODUCT ---
+
+async def get_product(db: AsyncSession, product_id: int) -> Product | None:
+    """Lấy một sản phẩm bằng ID (kèm images + categories)."""
+    return await db.get(Product, product_id, options=services.product_load_options())
+
+async def get_product_image(db: AsyncSession, product_id: int, image_id: int) -> ProductImage | None:
+    """Lấy một ảnh của sản phẩm (để client poll trạng thái xử lý)."""
+    result = await db.execute(
+        select(ProductImage).where(ProductImage.id == image_id, ProductImage.product_id == product_id)
+    )
+    return result.scalars().first()
+
+async def add_product_views(db: AsyncSession, counts: dict[int, int]):
+    """Cộng lượt xem (Products + ProductListing + bucket giờ / ngày), xem services.add_product_views."""
+    if counts:
+        await db.execute(services._add_product_views_stmt(counts))
+        await db.execute(listing.add_views_stmt(counts))
+        await db.execute(popularity.upsert_views_stmt(db.get_bind().dialect.name), popularity.view_rows(counts))
+        await db.commit()
+
+async def get_all_products(db: AsyncSession, limit: int = 10, cursor: str | None = None,
+                           sort: str = "id", order: str = "asc", fields: tuple[str, ...] | None = None,
+                           **filter_args):
+    """Lấy tất cả sản phẩm VỚI PHÂN TRANG (keyset / cursor), có lọc + chọn trường."""
+    category_ids = filter_args.pop("category_ids", None)
+    if category_ids:
+        filter_args["category_paths"] = (await db.scalars(category_tree.paths_stmt(*category_ids))).all()
+    stmt = services.products_page_stmt(limit, cursor, sort, order, fields, **filter_args)
+    result = await db.execute(stmt)
+    return services.products_page(result, sort, order, limit, fields)
+
+# Tìm kiếm: cùng logic với services.py (backend Postgres hoặc index trong bộ nhớ) qua run_sync
+
+async def search_products(db: AsyncSession, q: str, **kwargs) -> dict:
+    return await db.run_sync(services.search_products, q, **kwargs)
+
+async def get_popular_products(db: AsyncSession, window: str, category_id: int | None = None,
+                               limit: int = 20) -> dict:
+    """Sản phẩm xem nhiều nhất trong `window` (đọc bảng xếp hạng tính sẵn)."""
+    result = await db.execute(services.popular_products_stmt(window, category_id, limit))
+    return services.popular_products(result, window, category_id)
+
+async def search_books(db: AsyncSession, q: str, **kwargs) -> dict:
+    return await db.run_sync(services.search_books, q, **kwargs)
+
+@cache.invalidates("products", "categories")
+async def create_product(db: AsyncSession, data: ProductCreate) -> Product:
+    """Tạo một sản phẩm mới và liên kết nó với các category."""
+    category_ids = data.categories
+    product_instance = Product(**data.model_dump(exclude={"categories"}), images=[])
+
+    if category_ids:
+        result = await db.execute(select(Category).where(Category.id.in_(category_ids)))
+        product_instance.categories = list(result.scalars().all())
+    else:
+        product_instance.categories = []
+
+    db.add(product_instance)
+    await uow.commit_async(db)
+    return product_instance
+
+@cache.invalidates("products", "categories")
+async def save_product_image(db: AsyncSession, product_id: int, file: UploadFile) -> ProductImage:
+    """Lưu ảnh gốc cho sản phẩm (status="pending"); rendition được tạo nền."""
+    db_product = await get_product(db, product_id)
+    if not db_product:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
+
+    image_pipeline.admit()
+
+    file_extension = os.path.splitext(file.filename)[1]
+    file_name = secrets.token_hex(16) + file_extension
+
+    full_path_on_disk = os.path.join(services.UPLOAD_DIRECTORY_FULL, file_name)
+    relative_path_full = os.path.join("images", "products", "full", file_name).replace("\\", "/")
+
+    await image_io.save_upload(file, full_path_on_disk)
+
+    db_image = ProductImage(image_url=relative_path_full, product_id=product_id, status="pending",
+                            claimed_at=time.time())
+    db.add(db_image)
+    await uow.commit_async(db)
+
+    image_pipeline.submit(db_image.id, db_image.image_url)
+    return db_image
+
+@cache.invalidates("products", "categories")
+async def finish_product_image(db: AsyncSession, image_id: int, status: str,
+                               renditions: dict | None) -> ProductImage | None:
+    """Ghi kết quả xử lý nền của ảnh (xem services.finish_product_image)."""
+    result = await db.execute(services.finish_image_stmt(image_id, status, renditions))
+    db_image = result.scalars().first()
+    if db_image is None:
+        return None
+    thumbnail_url = services._thumbnail_from(renditions)
+    if thumbnail_url:
+        await db.execute(services.set_thumbnail_stmt(db_image.product_id, thumbnail_url))
+    listing.track(db.sync_session, [db_image.product_id])
+    await uow.commit_async(db)
+    return db_image
+
+
+# --- BULK: logic dùng chung với services.py (Session sync qua run_sync) ---
+
+async def bulk_write(db: AsyncSession, entity: str, op: str, items: list, commit: bool = True) -> dict:
+    return await db.run_sync(services.bulk_write, entity, op, items, commit)
+
+async def bulk_finish(db: AsyncSession, entity: str, commit: bool):
+    return await db.run_sync(services.bulk_finish, entity, commit)
+
+
+# ===================================================================
+# --- DISPATCH: gọi service theo chế độ DB (sync / async) ---
+# ===================================================================
+
+async def dispatch(db: Session | AsyncSession, name: str, *args, schema=None, **kwargs):
+    """
+    Gọi hàm service `name` với session hiện tại mà KHÔNG chặn event loop.
+
+    - AsyncSession: gọi hàm cùng tên trong file này.
+    - Session (sync): gọi hàm trong services.py bên trong threadpool.
+
+    Nếu truyền `schema` (vd: schemas.Product, list[schemas.Category]) thì kết quả
+    được validate NGAY trong ngữ cảnh của session (greenlet / thread), nên các
+    relationship lazy được tải ở đó chứ không phải trên event loop.
+    """
+    adapter = cache.type_adapter(schema) if schema is not None else None
+
+    def _dump(result):
+        if adapter is None or result is None:
+            return result
+        return adapter.validate_python(result, from_attributes=True)
+
+    if isinstance(db, AsyncSession):
+        result = await globals()[name](db, *args, **kwargs)
+        return await db.run_sync(lambda _: _dump(result))
+
+    fn = getattr(services, name)
+    if inspect.iscoroutinefunction(fn):
+        result = await fn(db, *args, **kwargs)
+        return await run_in_threadpool(_dump, result)
+    return await run_in_threadpool(lambda: _dump(fn(db, *args, **kwargs)))
+
+
+# Tác dụng chính: Bản async của services.py, dùng khi settings.USE_ASYNC_DB = True.
@@ -2,18 +2,21 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
-from jose import JWTError, jwt
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime, timedelta, timezone
 
-from passlib.context import CryptContext
 
 import schemas, services, models
-from db import get_db
+import async_services
+from db import get_session
+from principal_cache import principal_cache
+from password_hasher import pwd_context
+import tokens
 from config import settings
 
-# 1. Cấu hình Passlib (dùng để băm mật khẩu)
-# Chúng ta chọn bcrypt làm thuật toán băm
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# 1. Cấu hình Passlib (dùng để băm mật khẩu): pwd_context nằm trong
+# password_hasher.py; các endpoint dùng password_hasher.hash_password /
+# verify_password (process pool riêng) thay vì 2 hàm sync bên dưới.
 
 # 2. Cấu hình OAuth2
 # "tokenUrl" trỏ đến endpoint /signin (chúng ta sẽ tạo ở main.py)
@@ -29,7 +32,7 @@ def get_password_hash(password: str) -> str:
     """Băm mật khẩu."""
     return pwd_context.hash(password)
 
-# 4. Các hàm xử lý JWT
+# 4. Các hàm xử lý JWT (ký / xác thực nằm trong tokens.py)
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     """Tạo ra một JWT Access Token mới."""
     to_encode = data.copy()
@@ -40,23 +43,25 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
         # Mặc định token hết hạn sau 15 phút nếu không truyền
         expire = datetime.now(timezone.utc) + timedelta(minutes=15)
         
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "type": "access"})
     
-    # Lấy SECRET_KEY từ config và encode
-    encoded_jwt = jwt.encode(
-        to_encode, 
-        settings.SECRET_KEY.get_secret_value(), 
-        algorithm=settings.ALGORITHM
-    )
-    return encoded_jwt
+    # Ký bằng khóa đang hoạt động (JWT_ACTIVE_KID, hoặc SECRET_KEY)
+    return tokens.encode(to_encode)
+
+def create_refresh_token(email: str, hashed_password: str) -> str:
+    """Refresh token (sống lâu) để đổi lấy access token mới mà không cần /signin."""
+    return tokens.create_refresh_token(email, hashed_password)
 
 # 5. Hàm quan trọng: Lấy user hiện tại từ Token
 async def get_current_user(
-    token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)
-) -> models.User:
+    token: str = Depends(oauth2_scheme), db: Session | AsyncSession = Depends(get_session)
+) -> schemas.User:
     """
     Giải mã token, lấy email từ payload, và truy vấn user từ DB.
     Đây là Dependency sẽ được dùng để bảo vệ các endpoint.
+
+    Kết quả (schemas.User, không gắn với session nào) được cache theo token
+    (xem principal_cache.py): token đã gặp thì không decode lại, không query DB.
     """
     
     # Thông tin lỗi chuẩn
@@ -65,33 +70,35 @@ async def get_current_user(
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    
-    try:
-        # Giải mã JWT
-        payload = jwt.decode(
-            token, 
-            settings.SECRET_KEY.get_secret_value(),
-            algorithms=[settings.ALGORITHM]
-        )
-        
-        # Lấy email từ payload (chúng ta đã đặt nó trong "sub")
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
+
+    async def load_principal():
+        try:
+            # Xác thực JWT (chữ ký + exp; claims đã xác thực được nhớ trong LRU)
+            payload = tokens.decode(token, "access")
+            
+            # Lấy email từ payload (chúng ta đã đặt nó trong "sub")
+            email: str = payload.get("sub")
+            if email is None:
+                raise credentials_exception
+                
+            # Validate schema của payload
+            token_data = schemas.TokenData(email=email)
             
-        # Validate schema của payload
-        token_data = schemas.TokenData(email=email)
+        except tokens.TokenError:
+            # Nếu token không hợp lệ hoặc hết hạn
+            raise credentials_exception
         
-    except JWTError:
-        # Nếu token không hợp lệ hoặc hết hạn
-        raise credentials_exception
-    
-    # Lấy user từ DB
-    user = services.get_user_by_email(db, email=token_data.email)
+        # Lấy user từ DB (không chặn event loop: threadpool hoặc asyncpg)
+        user = await async_services.dispatch(
+            db, "get_user_by_email", email=token_data.email, schema=schemas.User
+        )
+        return user, payload.get("exp")
+
+    user = await principal_cache.get_or_load(token, load_principal)
     
     if user is None:
         # Nếu user không tồn tại trong DB (ví dụ: user đã bị xóa)
         raise credentials_exception
         
-    # Trả về instance User (model của SQLAlchemy)
-    return user
\ No newline at end of file
+    # Trả về principal (schemas.User: id + email)
+    return user
@@ -0,0 +1,80 @@
+# benchmarks/compare.py
+# So sánh 2 file kết quả JSON của benchmarks.load / benchmarks.micro (vd: của
+# 2 commit) và đánh dấu các chỉ số tệ đi quá ngưỡng.
+#
+#   python -m benchmarks.compare results/old.json results/new.json
+#   python -m benchmarks.compare old.json new.json --threshold 15 --fail   (exit 1 nếu chậm đi -> CI)
+#
+# Chỉ số *_ms / *_us: càng nhỏ càng tốt; rps / ops: càng lớn càng tốt;
+# queries_per_request.mean: số câu SQL (tăng = tệ đi, so sánh tuyệt đối).
+import argparse
+import json
+import sys
+
+LOWER_IS_BETTER = ("p50_ms", "p95_ms", "p99_ms", "median_us", "mean_us")
+HIGHER_IS_BETTER = ("rps", "ops")
+
+
+def _entries(report: dict) -> dict:
+    return report.get("scenarios") or report.get("benchmarks") or {}
+
+
+def compare(old: dict, new: dict, threshold: float) -> tuple[list[str], list[str]]:
+    """Trả về (các dòng báo cáo, các dòng bị coi là regression)."""
+    lines, regressions = [], []
+    old_entries, new_entries = _entries(old), _entries(new)
+    for name in new_entries:
+        if name not in old_entries:
+            lines.append(f"{name:>32}: (mới)")
+            continue
+        before, after = old_entries[name], new_entries[name]
+        cells = []
+        for metric in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            if before.get(metric) is None or after.get(metric) is None or not before[metric]:
+                continue
+            change = (after[metric] - before[metric]) / before[metric] * 100
+            worse = change > threshold if metric in LOWER_IS_BETTER else change < -threshold
+            cell = f"{metric} {before[metric]} -> {after[metric]} ({change:+.1f}%)"
+            cells.append(cell + (" !" if worse else ""))
+            if worse:
+                regressions.append(f"{name}: {cell}")
+        queries_before = (before.get("queries_per_request") or {}).get("mean")
+        queries_after = (after.get("queries_per_request") or {}).get("mean")
+        if queries_before is not None and queries_after is not None and queries_before != queries_after:
+            cell = f"queries {queries_before} -> {queries_after}"
+            cells.append(cell + (" !" if queries_after > queries_before else ""))
+            if queries_after > queries_before:
+                regressions.append(f"{name}: {cell}")
+        lines.append(f"{name:>32}: " + ", ".join(cells))
+    for name in old_entries:
+        if name not in new_entries:
+            lines.append(f"{name:>32}: (không còn)")
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="So sánh 2 file kết quả benchmark")
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10, help="%% thay đổi coi là regression")
+    parser.add_argument("--fail", action="store_true", help="exit 1 nếu có regression")
+    args = parser.parse_args()
+
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    print(f"{(old.get('meta') or {}).get('commit')} -> {(new.get('meta') or {}).get('commit')}")
+    lines, regressions = compare(old, new, args.threshold)
+    print("\n".join(lines))
+    if regressions:
+        print(f"\n{len(regressions)} chỉ số tệ đi hơn {args.threshold}%:")
+        print("\n".join("  " + line for line in regressions))
+    sys.exit(1 if regressions and args.fail else 0)
+
+
+if __name__ == "__main__":
+    main()
+
+
+# Tác dụng chính: So sánh 2 lần chạy benchmark (p50/p95/p99, throughput, số câu SQL) và báo regression.
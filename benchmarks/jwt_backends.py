@@ -0,0 +1,68 @@
+# benchmarks/jwt_backends.py
+# So sánh tốc độ các backend JWT trong tokens.py (cùng interface encode/decode).
+#
+#   python -m benchmarks.jwt_backends                 (chạy từ thư mục gốc)
+#   python -m benchmarks.jwt_backends -n 50000 --json
+#
+# Đo 3 thứ cho mỗi backend: encode, decode (xác thực chữ ký + exp), và decode
+# qua tokens.decode() khi token đã nằm trong LRU claims (đường nhanh thực tế).
+import argparse
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+import tokens
+
+KEYS = {"k1": b"benchmark-secret-k1", tokens.LEGACY_KID: b"benchmark-secret-legacy"}
+
+
+def _ops_per_second(fn, n: int) -> float:
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return n / (time.perf_counter() - start)
+
+
+def run(n: int, algorithm: str = "HS256") -> dict:
+    claims = {
+        "sub": "bench@example.com",
+        "type": "access",
+        "exp": int((datetime.now(timezone.utc) + timedelta(hours=1)).timestamp()),
+    }
+    results = {}
+    for name, backend_class in tokens.BACKENDS.items():
+        backend = backend_class()
+        token = backend.encode(claims, KEYS["k1"], "k1", algorithm)
+        assert backend.decode(token, KEYS, algorithm)["sub"] == claims["sub"]
+        results[name] = {
+            "encode_ops_s": round(_ops_per_second(lambda: backend.encode(claims, KEYS["k1"], "k1", algorithm), n)),
+            "decode_ops_s": round(_ops_per_second(lambda: backend.decode(token, KEYS, algorithm), n)),
+        }
+
+    # Đường nhanh: claims đã xác thực nằm trong LRU (không parse, không HMAC)
+    token = tokens.encode(claims)
+    tokens.decode(token)
+    results["cached_claims"] = {"decode_ops_s": round(_ops_per_second(lambda: tokens.decode(token), n))}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="So sánh tốc độ các backend JWT")
+    parser.add_argument("-n", type=int, default=20000, help="số lần lặp mỗi phép đo")
+    parser.add_argument("--json", action="store_true", help="in kết quả dạng JSON")
+    args = parser.parse_args()
+
+    results = run(args.n)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for name, numbers in results.items():
+        line = ", ".join(f"{metric}={value:,}" for metric, value in numbers.items())
+        print(f"{name:>14}: {line}")
+
+
+if __name__ == "__main__":
+    main()
+
+
+# Tác dụng chính: Micro-benchmark jose vs backend HMAC (stdlib) cho JWT.
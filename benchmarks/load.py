@@ -0,0 +1,303 @@
+# benchmarks/load.py
+# Load test cho mọi endpoint trong main.py: mỗi kịch bản được gọi N lần bởi C
+# client đồng thời, báo p50 / p95 / p99, throughput và số câu SQL mỗi request
+# (đọc từ header Server-Timing, xem instrumentation.py). Kết quả lưu JSON để
+# so sánh giữa các commit bằng `python -m benchmarks.compare`.
+#
+#   python -m benchmarks.load                       (trong process: SQLite tạm, tự seed, app qua ASGI)
+#   python -m benchmarks.load --groups read,write,auth -c 32 -n 500 --output results/$(git rev-parse --short HEAD).json
+#   python -m benchmarks.load --url http://localhost:8000 --products 100000 ...
+#
+# Với --url: server chạy với DEBUG=true (để có Server-Timing) trên DB đã seed
+# bằng `python -m benchmarks.seed` với CÙNG tham số kích thước catalog (id ngẫu
+# nhiên được chọn trong khoảng đó). Trong process, --database-url cho phép dùng
+# Postgres thay cho SQLite tạm (DB phải trống).
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+from benchmarks import seed as seeding
+
+GROUPS = ("read", "write", "auth", "heavy")
+_QUERIES = re.compile(r'db;dur=[\d.]+;desc="(\d+) queries"')
+
+
+# ===================================================================
+# --- KỊCH BẢN ---
+# ===================================================================
+
+class Context:
+    """Trạng thái dùng chung giữa các request: kích thước catalog, token, id đã tạo."""
+
+    def __init__(self, args, rng: random.Random):
+        self.args = args
+        self.rng = rng
+        self.headers: dict = {}
+        self.refresh_token: str | None = None
+        self.created_books: list[int] = []
+        self.jpeg = b""
+        self.sequence = 0
+
+    def next(self) -> int:
+        self.sequence += 1
+        return self.sequence
+
+    def book(self) -> int:
+        return self.rng.randint(1, max(self.args.books, 1))
+
+    def product(self) -> int:
+        return self.rng.randint(1, max(self.args.products, 1))
+
+    def category(self) -> int:
+        return self.rng.randint(1, max(self.args.categories, 1))
+
+    def word(self) -> str:
+        return self.rng.choice(seeding.WORDS)
+
+
+def _jpeg() -> bytes:
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new("RGB", (1600, 1200), (120, 80, 40)).save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def _product_body(ctx: Context) -> dict:
+    return {"name": f"load product {os.getpid()}-{ctx.next()}", "description": "load test", "price": 1000,
+            "stock_quantity": 3, "categories": [ctx.category()] if ctx.args.categories else []}
+
+
+def _delete_book(ctx: Context):
+    book_id = ctx.created_books.pop() if ctx.created_books else ctx.book()
+    return "DELETE", f"/books/{book_id}", {"headers": ctx.headers}
+
+
+# (tên, nhóm, hàm ctx -> (method, url, kwargs cho httpx))
+SCENARIOS = [
+    ("books_list", "read", lambda ctx: ("GET", f"/books/?limit=50&sort={ctx.rng.choice(['id', 'year'])}", {})),
+    ("book_get", "read", lambda ctx: ("GET", f"/books/{ctx.book()}", {})),
+    ("categories_tree", "read", lambda ctx: ("GET", "/categories/", {})),
+    ("categories_tree_summary", "read", lambda ctx: ("GET", "/categories/?view=summary", {})),
+    ("category_get", "read", lambda ctx: ("GET", f"/categories/{ctx.category()}", {})),
+    ("category_ancestors", "read", lambda ctx: ("GET", f"/categories/{ctx.category()}/ancestors", {})),
+    ("category_products", "read", lambda ctx: ("GET", f"/categories/{ctx.category()}/products?limit=20", {})),
+    ("products_list", "read", lambda ctx: ("GET", "/products/?limit=20", {})),
+    ("products_filtered", "read", lambda ctx: (
+        "GET", f"/products/?limit=20&sort=price&in_stock=true&category_ids={ctx.category()}", {})),
+    ("products_summary", "read", lambda ctx: ("GET", "/products/?limit=100&view=summary", {})),
+    ("product_get", "read", lambda ctx: ("GET", f"/products/{ctx.product()}", {})),
+    ("products_popular", "read", lambda ctx: (
+        "GET", f"/products/popular?window={ctx.rng.choice(['24h', '7d'])}&category_id={ctx.category()}", {})),
+    ("product_image_get", "read", lambda ctx: (
+        "GET", f"/products/{(pid := ctx.product())}/images/{(pid - 1) * ctx.args.images + 1}", {})),
+    ("search_products", "read", lambda ctx: ("GET", f"/search/products?q={ctx.word()}", {})),
+    ("search_books", "read", lambda ctx: ("GET", f"/search/books?q={ctx.word()}", {})),
+    ("users_me", "read", lambda ctx: ("GET", "/users/me", {"headers": ctx.headers})),
+    ("book_create", "write", lambda ctx: ("POST", "/books/", {"headers": ctx.headers, "json": {
+        "title": f"load book {ctx.next()}", "author": "load", "description": "load test", "year": 2024}})),
+    ("book_update", "write", lambda ctx: ("PUT", f"/books/{ctx.book()}", {"headers": ctx.headers, "json": {
+        "title": f"updated {ctx.next()}", "author": "load", "description": "load test", "year": 2024}})),
+    ("book_delete", "write", _delete_book),
+    ("category_create", "write", lambda ctx: ("POST", "/categories/", {"headers": ctx.headers, "json": {
+        "name": f"load category {os.getpid()}-{ctx.next()}",
+        "parent_id": ctx.category() if ctx.args.categories else None}})),
+    ("product_create", "write", lambda ctx: ("POST", "/products/", {"headers": ctx.headers, "json": _product_body(ctx)})),
+    ("bulk_products", "write", lambda ctx: ("POST", "/bulk/products", {
+        "headers": ctx.headers, "json": [_product_body(ctx) for _ in range(100)]})),
+    ("signup", "auth", lambda ctx: ("POST", "/signup", {"json": {
+        "email": f"load{os.getpid()}-{ctx.next()}@example.com", "password": "load-password"}})),
+    ("signin", "auth", lambda ctx: ("POST", "/signin", {"data": {
+        "username": seeding.BENCH_EMAIL, "password": seeding.BENCH_PASSWORD}})),
+    ("token_refresh", "auth", lambda ctx: ("POST", "/token/refresh", {"json": {"refresh_token": ctx.refresh_token}})),
+    ("export_products", "heavy", lambda ctx: ("GET", "/export/products?format=ndjson", {})),
+    ("product_upload_image", "heavy", lambda ctx: ("POST", f"/products/{ctx.product()}/upload-image/", {
+        "headers": ctx.headers, "files": {"file": ("load.jpg", ctx.jpeg, "image/jpeg")}})),
+]
+
+
+# ===================================================================
+# --- CHẠY ---
+# ===================================================================
+
+def percentiles(samples: list[float]) -> dict:
+    """p50 / p95 / p99 / max / mean (ms), percentile theo nearest-rank."""
+    ordered = sorted(samples)
+
+    def rank(p: float) -> float:
+        return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))]
+
+    return {
+        "p50_ms": round(rank(50) * 1000, 2), "p95_ms": round(rank(95) * 1000, 2),
+        "p99_ms": round(rank(99) * 1000, 2), "max_ms": round(ordered[-1] * 1000, 2),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 2),
+    }
+
+
+async def _scenario(client: httpx.AsyncClient, ctx: Context, name: str, build, requests: int,
+                    concurrency: int, warmup: int) -> dict:
+    latencies, queries, statuses = [], [], {}
+    remaining = warmup + requests
+    window = [float("inf"), 0.0]   # [bắt đầu request đo đầu tiên, kết thúc request đo cuối cùng]
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            measured = remaining < requests
+            method, url, kwargs = build(ctx)
+            start = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            await response.aread()
+            elapsed = time.perf_counter() - start
+            if not measured:
+                continue
+            latencies.append(elapsed)
+            window[0], window[1] = min(window[0], start), max(window[1], start + elapsed)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            match = _QUERIES.search(response.headers.get("server-timing", ""))
+            if match:
+                queries.append(int(match.group(1)))
+            if name == "book_create" and response.status_code == 200:
+                ctx.created_books.append(response.json()["id"])
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = window[1] - window[0]
+    result = {"requests": len(latencies), "errors": sum(n for code, n in statuses.items() if code >= 400),
+              "status": {str(code): n for code, n in sorted(statuses.items())}}
+    result.update(percentiles(latencies))
+    # throughput trong khoảng thời gian của các request được đo (không tính warmup)
+    result["rps"] = round(len(latencies) / wall, 1) if wall > 0 else None
+    result["queries_per_request"] = (
+        {"mean": round(statistics.fmean(queries), 2), "max": max(queries)} if queries else None
+    )
+    return result
+
+
+async def _login(client: httpx.AsyncClient, ctx: Context):
+    response = await client.post("/signin", data={"username": seeding.BENCH_EMAIL, "password": seeding.BENCH_PASSWORD})
+    response.raise_for_status()
+    ctx.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    ctx.refresh_token = response.json()["refresh_token"]
+
+
+async def run_scenarios(client: httpx.AsyncClient, args) -> dict:
+    ctx = Context(args, random.Random(args.seed))
+    ctx.jpeg = _jpeg()
+    await _login(client, ctx)
+    groups = set(args.groups.split(","))
+    selected = set(args.scenarios.split(",")) if args.scenarios else None
+    results = {}
+    for name, group, build in SCENARIOS:
+        if group not in groups or (selected is not None and name not in selected):
+            continue
+        # kịch bản nặng (bcrypt, export cả bảng, xử lý ảnh): ít request hơn
+        requests = args.requests if group in ("read", "write") else max(args.requests // 10, 1)
+        results[name] = await _scenario(client, ctx, name, build, requests, args.concurrency,
+                                        min(args.warmup, requests))
+        print(f"{name:>24}: " + ", ".join(
+            f"{k}={v}" for k, v in results[name].items() if k not in ("status",)
+        ), file=sys.stderr)
+    return results
+
+
+async def _run_in_process(args, workdir: str) -> dict:
+    # import SAU khi đã đặt biến môi trường (settings đọc lúc import)
+    import db
+    import main
+    # ảnh upload (static/...) ghi vào thư mục tạm thay vì thư mục của repo
+    os.chdir(workdir)
+    os.makedirs("static/images/products/full", exist_ok=True)
+    db.create_table()
+    catalog = seeding.seed_from_args(db.SessionLocal, args)
+    print(f"seed: {catalog}", file=sys.stderr)
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            return await run_scenarios(client, args)
+
+
+async def _run_remote(args) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, timeout=60, limits=limits) as client:
+        return await run_scenarios(client, args)
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test các endpoint của API")
+    parser.add_argument("--url", help="server đang chạy (mặc định: chạy app trong process)")
+    parser.add_argument("--database-url", help="DB cho chế độ trong process (mặc định: SQLite tạm)")
+    parser.add_argument("--async-db", action="store_true", help="trong process: USE_ASYNC_DB=true")
+    parser.add_argument("--no-cache", action="store_true", help="trong process: tắt cache response")
+    parser.add_argument("-c", "--concurrency", type=int, default=16, help="số client đồng thời")
+    parser.add_argument("-n", "--requests", type=int, default=200, help="số request đo cho mỗi kịch bản")
+    parser.add_argument("--warmup", type=int, default=10, help="số request khởi động (không tính)")
+    parser.add_argument("--groups", default="read,write", help=f"nhóm kịch bản: {','.join(GROUPS)}")
+    parser.add_argument("--scenarios", help="chỉ chạy các kịch bản này (tên, cách nhau bởi dấu phẩy)")
+    parser.add_argument("--output", help="ghi kết quả JSON vào file này")
+    seeding.add_arguments(parser)
+    args = parser.parse_args()
+    cwd = os.getcwd()
+
+    meta = {
+        "commit": _git_commit(), "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(), "target": args.url or "in-process",
+        "concurrency": args.concurrency, "requests": args.requests, "groups": args.groups,
+        "catalog": {k: getattr(args, k) for k in ("books", "products", "categories", "depth", "images",
+                                                   "categories_per_product", "seed")},
+    }
+    if args.url:
+        results = asyncio.run(_run_remote(args))
+    else:
+        workdir = tempfile.mkdtemp(prefix="bench-")
+        url = args.database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+        os.environ["DATABASE_URL"] = url
+        os.environ["ASYNC_DATABASE_URL"] = (
+            url.replace("sqlite://", "sqlite+aiosqlite://").replace("+psycopg2", "+asyncpg")
+        )
+        os.environ["USE_ASYNC_DB"] = "true" if args.async_db else "false"
+        os.environ["DEBUG"] = "true"   # header Server-Timing -> số câu SQL mỗi request
+        # không log request / câu SQL chậm: đã có số liệu trong kết quả
+        os.environ.setdefault("SLOW_REQUEST_MS", "0")
+        os.environ.setdefault("SLOW_QUERY_MS", "0")
+        if args.no_cache:
+            os.environ["CACHE_ENABLED"] = "false"
+        meta.update(database=url.split(":", 1)[0], async_db=args.async_db, cache=not args.no_cache)
+        results = asyncio.run(_run_in_process(args, workdir))
+
+    report = {"meta": meta, "scenarios": results}
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        os.chdir(cwd)
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"Đã ghi {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
+
+
+# Tác dụng chính: Load test đồng thời mọi endpoint, báo p50/p95/p99, throughput, số câu SQL, lưu JSON.
@@ -0,0 +1,168 @@
+# benchmarks/micro.py
+# Micro-benchmark (kiểu pytest-benchmark: hiệu chỉnh số lần lặp mỗi round,
+# báo min / mean / stddev / median / ops) cho các đoạn code nóng:
+#   - serialize Product: detail (ORM object, from_attributes) vs summary (dict);
+#   - xác thực JWT: verify chữ ký (không cache) vs claims đã nằm trong LRU;
+#   - tạo thumbnail / rendition bằng Pillow (image_io.render_renditions).
+#
+#   python -m benchmarks.micro                               (chạy từ thư mục gốc)
+#   python -m benchmarks.micro -k jwt --rounds 50 --output results/micro-$(git rev-parse --short HEAD).json
+#
+# Không cần DB. So sánh 2 file kết quả: python -m benchmarks.compare old.json new.json
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from pydantic import TypeAdapter
+
+from benchmarks.load import _git_commit
+
+ITEMS = 100   # số sản phẩm mỗi lần serialize
+
+
+def bench(fn, rounds: int = 20, min_round_time: float = 0.005) -> dict:
+    """
+    Chạy fn() theo `rounds` round; mỗi round lặp đủ số lần để dài ít nhất
+    `min_round_time` giây (giảm nhiễu của timer). Thống kê theo µs cho MỖI lần gọi.
+    """
+    fn()   # warmup
+    iterations = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        if time.perf_counter() - start >= min_round_time or iterations >= 1 << 20:
+            break
+        iterations *= 2
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        samples.append((time.perf_counter() - start) / iterations)
+    mean = statistics.fmean(samples)
+    return {
+        "rounds": rounds, "iterations": iterations,
+        "min_us": round(min(samples) * 1e6, 2), "max_us": round(max(samples) * 1e6, 2),
+        "mean_us": round(mean * 1e6, 2), "stddev_us": round(statistics.pstdev(samples) * 1e6, 2),
+        "median_us": round(statistics.median(samples) * 1e6, 2), "ops": round(1 / mean, 1),
+    }
+
+
+# ===================================================================
+# --- CÁC CASE ---
+# ===================================================================
+
+def case_serialization(rounds: int) -> dict:
+    from models import Category, Product, ProductImage
+    import schemas
+    import services
+
+    renditions = {size: {"jpeg": f"{size}.jpg", "webp": f"{size}.webp"} for size in ("150", "300", "800")}
+    categories = [Category(id=i, name=f"c{i}", parent_id=None, path=f"/{i}/") for i in range(1, 4)]
+    products = []
+    for i in range(1, ITEMS + 1):
+        product = Product(id=i, name=f"product {i}", description="mô tả " * 20, price=1000 * i,
+                          stock_quantity=i % 7, view_count=i, thumbnail_url=f"{i}.jpg")
+        product.images = [ProductImage(id=i * 2 + k, product_id=i, image_url=f"{i}-{k}.jpg", status="ready",
+                                       renditions=renditions) for k in range(2)]
+        product.categories = categories[: 1 + i % 3]
+        products.append(product)
+    # dòng của SELECT các cột summary (như services.products_page với view=summary)
+    rows = [{name: getattr(p, name) for name in services.PRODUCT_SUMMARY_FIELDS} for p in products]
+
+    detail = TypeAdapter(list[schemas.Product])
+    summary = TypeAdapter(list[schemas.ProductSummary])
+    return {
+        "serialize_product_detail_orm": bench(
+            lambda: detail.dump_json(detail.validate_python(products, from_attributes=True)), rounds),
+        "serialize_product_summary_orm": bench(
+            lambda: summary.dump_json(summary.validate_python(products, from_attributes=True)), rounds),
+        "serialize_product_summary_rows": bench(
+            lambda: summary.dump_json(summary.validate_python(rows, from_attributes=True)), rounds),
+    }
+
+
+def case_jwt(rounds: int) -> dict:
+    import auth
+    import tokens
+
+    claims = {"sub": "bench@example.com"}
+    token = auth.create_access_token(claims, timedelta(hours=1))
+    tokens.decode(token)
+    return {
+        "jwt_encode": bench(lambda: auth.create_access_token(claims, timedelta(hours=1)), rounds),
+        "jwt_verify": bench(lambda: tokens.decode(token, use_cache=False), rounds),
+        "jwt_verify_cached": bench(lambda: tokens.decode(token), rounds),
+    }
+
+
+def case_thumbnail(rounds: int) -> dict:
+    from PIL import Image
+    from config import settings
+    import image_io
+
+    workdir = tempfile.mkdtemp(prefix="bench-img-")
+    original = os.path.join(workdir, "original.jpg")
+    buffer = io.BytesIO()
+    # ảnh chụp điện thoại điển hình: 4000x3000
+    Image.radial_gradient("L").resize((4000, 3000)).convert("RGB").save(buffer, "JPEG", quality=90)
+    with open(original, "wb") as f:
+        f.write(buffer.getvalue())
+    out_root = os.path.join(workdir, "renditions")
+
+    def render(formats):
+        return lambda: image_io.render_renditions(original, out_root, "bench", settings.IMAGE_RENDITION_SIZES, formats)
+
+    # mỗi lần gọi mất hàng chục ms: ít round hơn
+    rounds = max(rounds // 4, 3)
+    return {
+        "thumbnail_jpeg": bench(render(["jpeg"]), rounds, min_round_time=0),
+        "thumbnail_all_formats": bench(render(settings.IMAGE_RENDITION_FORMATS), rounds, min_round_time=0),
+    }
+
+
+CASES = {"serialization": case_serialization, "jwt": case_jwt, "thumbnail": case_thumbnail}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark serialize / JWT / thumbnail")
+    parser.add_argument("-k", help=f"chỉ chạy các nhóm này: {','.join(CASES)}")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--output", help="ghi kết quả JSON vào file này")
+    args = parser.parse_args()
+
+    selected = args.k.split(",") if args.k else list(CASES)
+    results = {}
+    for name in selected:
+        for bench_name, stats in CASES[name](args.rounds).items():
+            results[bench_name] = stats
+            print(f"{bench_name:>32}: median={stats['median_us']:,} µs, mean={stats['mean_us']:,} µs "
+                  f"± {stats['stddev_us']:,}, ops={stats['ops']:,}", file=sys.stderr)
+
+    report = {
+        "meta": {"commit": _git_commit(), "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                 "python": platform.python_version(), "rounds": args.rounds},
+        "benchmarks": results,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
+
+
+# Tác dụng chính: Micro-benchmark serialize sản phẩm, xác thực JWT và tạo thumbnail, lưu JSON.
@@ -0,0 +1,104 @@
+# benchmarks/search.py
+# Đo độ trễ tìm kiếm của inverted index trong bộ nhớ (search.InvertedIndex)
+# trên catalog giả lập, không cần DB.
+#
+#   python -m benchmarks.search                       (chạy từ thư mục gốc)
+#   python -m benchmarks.search -n 1000000 --json
+#
+# Backend "postgres" đo trên DB thật bằng EXPLAIN ANALYZE với câu SQL trong
+# search.PostgresSearchBackend (mục tiêu: top-k < 20 ms với 1 triệu dòng).
+import argparse
+import itertools
+import json
+import random
+import statistics
+import time
+
+import search
+
+WORDS = [
+    "điện", "thoại", "laptop", "máy", "tính", "bảng", "tai", "nghe", "sạc", "cáp", "ốp", "lưng",
+    "đồng", "hồ", "thông", "minh", "camera", "loa", "bluetooth", "chuột", "bàn", "phím", "màn",
+    "hình", "ổ", "cứng", "usb", "pin", "dự", "phòng", "gaming", "văn", "phòng", "cao", "cấp",
+]
+QUERIES = ["điện thoại", "tai ngh", "laptop gaming", "sạc pin", "ma", "bàn phím cơ", "camera thông minh"]
+VOCABULARY_SIZE = 50000
+
+
+def _catalog(n: int, categories: int, seed: int = 42):
+    rng = random.Random(seed)
+    # từ điển phân bố Zipf như văn bản thật: vài từ rất phổ biến, đa số hiếm
+    vocabulary = WORDS + [f"{rng.choice(WORDS)}{i}" for i in range(VOCABULARY_SIZE)]
+    cumulative = list(itertools.accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+    rows, links = [], []
+    for doc_id in range(1, n + 1):
+        rows.append({
+            "id": doc_id,
+            "name": " ".join(rng.choices(vocabulary, cum_weights=cumulative, k=5)),
+            "description": " ".join(rng.choices(vocabulary, cum_weights=cumulative, k=30)),
+            "price": rng.randrange(10000, 20000000),
+            "stock_quantity": rng.randrange(0, 50),
+        })
+        links.append((doc_id, rng.randrange(1, categories + 1)))
+    # cây 2 cấp: 10 category gốc, mỗi category còn lại là con của 1 gốc
+    tree = [(cid, None if cid <= 10 else (cid % 10) + 1) for cid in range(1, categories + 1)]
+    snapshot = search.CategorySnapshot([
+        (cid, parent, f"/{cid}/" if parent is None else f"/{parent}/{cid}/", f"c{cid}") for cid, parent in tree
+    ])
+    return rows, links, snapshot
+
+
+def _percentiles(samples: list[float]) -> dict:
+    samples = sorted(samples)
+    return {
+        "p50_ms": round(statistics.median(samples) * 1000, 3),
+        "p95_ms": round(samples[int(len(samples) * 0.95) - 1] * 1000, 3),
+        "max_ms": round(samples[-1] * 1000, 3),
+    }
+
+
+def run(n: int, repeat: int = 20, categories: int = 200) -> dict:
+    rows, links, snapshot = _catalog(n, categories)
+    index = search.InvertedIndex("products")
+    start = time.perf_counter()
+    index.load(rows, links)
+    results = {"documents": n, "build_s": round(time.perf_counter() - start, 2)}
+    del rows
+
+    cases = {
+        "top20": {},
+        "top20_filtered": {"category_id": 1, "min_price": 1000000, "in_stock": True},
+    }
+    for name, filters in cases.items():
+        for with_facets in (False, True):
+            samples = []
+            for _ in range(repeat):
+                for q in QUERIES:
+                    t = time.perf_counter()
+                    index.search(search.tokenize(q), filters, 20, 0, snapshot, with_facets)
+                    samples.append(time.perf_counter() - t)
+            results[name + ("_facets" if with_facets else "")] = _percentiles(samples)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Độ trễ tìm kiếm của inverted index trong bộ nhớ")
+    parser.add_argument("-n", type=int, default=100000, help="số sản phẩm giả lập")
+    parser.add_argument("--repeat", type=int, default=20, help="số lần lặp mỗi truy vấn")
+    parser.add_argument("--json", action="store_true", help="in kết quả dạng JSON")
+    args = parser.parse_args()
+
+    results = run(args.n, args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for name, value in results.items():
+        line = ", ".join(f"{k}={v}" for k, v in value.items()) if isinstance(value, dict) else value
+        print(f"{name:>22}: {line}")
+
+
+if __name__ == "__main__":
+    main()
+
+
+# Tác dụng chính: Micro-benchmark độ trễ tìm kiếm (top-k, lọc, facet) của index trong bộ nhớ.
@@ -0,0 +1,159 @@
+# benchmarks/seed.py
+# Tạo dữ liệu giả lập cho benchmark: sách, cây category nhiều cấp, sản phẩm
+# kèm ảnh (có rendition) và nhiều category (bảng trung gian), và 1 user để
+# gọi các endpoint cần đăng nhập.
+#
+#   python -m benchmarks.seed                                   (dùng DATABASE_URL)
+#   python -m benchmarks.seed --products 100000 --categories 2000 --depth 6 --reset
+#
+# Dữ liệu sinh từ seed cố định -> cùng tham số cho cùng catalog, so sánh được
+# giữa các commit. Ghi bằng INSERT executemany theo lô (không qua ORM).
+import argparse
+import json
+import random
+import time
+
+from sqlalchemy import insert, delete, text
+
+# models / category_tree / password_hasher được import tại chỗ trong các hàm:
+# import chúng sẽ import db -> đọc settings (DATABASE_URL), mà benchmarks.load
+# chỉ đặt biến môi trường sau khi đã parse tham số dùng module này.
+
+BENCH_EMAIL = "bench@example.com"
+BENCH_PASSWORD = "bench-password"
+BATCH_SIZE = 5000
+
+WORDS = [
+    "điện", "thoại", "laptop", "máy", "tính", "bảng", "tai", "nghe", "sạc", "cáp", "ốp", "lưng",
+    "đồng", "hồ", "thông", "minh", "camera", "loa", "bluetooth", "chuột", "bàn", "phím", "màn",
+    "hình", "ổ", "cứng", "usb", "pin", "gaming", "văn", "phòng", "cao", "cấp", "sách", "truyện",
+]
+
+
+def _insert(db, table, rows: list[dict]):
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.execute(insert(table), rows[start:start + BATCH_SIZE])
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choices(WORDS, k=words))
+
+
+def _sync_sequences(db):
+    """Postgres: id được ghi thẳng nên phải đẩy sequence lên max(id), nếu không INSERT sau sẽ trùng khóa."""
+    from models import Book, Category, Product, ProductImage, User
+    if db.get_bind().dialect.name != "postgresql":
+        return
+    for model in (Book, Category, Product, ProductImage, User):
+        table = model.__tablename__
+        db.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), "
+            f"coalesce((SELECT max(id) FROM \"{table}\"), 0) + 1, false)"
+        ))
+
+
+def category_rows(n: int, depth: int, rng: random.Random) -> list[dict]:
+    """
+    n category trên `depth` cấp: category thứ i ở cấp i % depth, cha là một
+    category ngẫu nhiên của cấp trên -> cây sâu đúng `depth` cấp, nhánh không đều.
+    """
+    import category_tree
+    rows, by_level = [], [[] for _ in range(depth)]
+    for cid in range(1, n + 1):
+        level = (cid - 1) % depth
+        parent = rng.choice(by_level[level - 1]) if level > 0 else None
+        rows.append({
+            "id": cid,
+            "name": f"category {cid}",
+            "parent_id": parent["id"] if parent else None,
+            "path": category_tree.build_path(parent["path"] if parent else None, cid),
+        })
+        by_level[level].append(rows[-1])
+    return rows
+
+
+def seed(session_factory, books: int = 1000, products: int = 10000, categories: int = 200, depth: int = 4,
+         images: int = 2, categories_per_product: int = 2, seed_value: int = 42, reset: bool = False) -> dict:
+    """Ghi catalog giả lập qua `session_factory`; trả về số dòng và thời gian đã dùng."""
+    from models import Base, Book, Category, Product, ProductImage, User, product_category_table
+    import listing
+    import password_hasher
+    rng = random.Random(seed_value)
+    start = time.perf_counter()
+    with session_factory() as db:
+        if reset:
+            for table in reversed(Base.metadata.sorted_tables):
+                db.execute(delete(table))
+
+        _insert(db, Book, [
+            {"id": i, "title": f"book {i} {_text(rng, 3)}", "author": _text(rng, 2),
+             "description": _text(rng, 20), "year": rng.randrange(1900, 2025)}
+            for i in range(1, books + 1)
+        ])
+        _insert(db, Category, category_rows(categories, depth, rng) if categories else [])
+        _insert(db, Product, [
+            {"id": i, "name": f"product {i} {_text(rng, 3)}", "description": _text(rng, 30),
+             "price": rng.randrange(10000, 20000000), "stock_quantity": rng.choice((0, 1, 5, 20, 100)),
+             # vài sản phẩm rất nhiều lượt xem, đa số ít (gần Zipf)
+             "view_count": int(10000 / rng.randint(1, 1000)), "thumbnail_url": f"images/products/thumb/{i}.jpg"}
+            for i in range(1, products + 1)
+        ])
+        sizes = ("150", "300", "800")
+        _insert(db, ProductImage, [
+            {"product_id": i, "image_url": f"images/products/full/{i}-{k}.jpg", "status": "ready",
+             "renditions": {s: {"jpeg": f"images/products/renditions/{s}/{i}-{k}.jpg",
+                                "webp": f"images/products/renditions/{s}/{i}-{k}.webp"} for s in sizes}}
+            for i in range(1, products + 1) for k in range(images)
+        ])
+        if categories:
+            _insert(db, product_category_table, [
+                {"product_id": i, "category_id": cid}
+                for i in range(1, products + 1)
+                for cid in rng.sample(range(1, categories + 1), min(categories_per_product, categories))
+            ])
+        if db.query(User).filter(User.email == BENCH_EMAIL).first() is None:
+            db.add(User(email=BENCH_EMAIL, hashed_password=password_hasher.hash_sync(BENCH_PASSWORD)))
+        db.flush()
+        _sync_sequences(db)
+        db.commit()
+        # ghi bằng Core không qua ORM events -> dựng lại read model danh sách sản phẩm
+        listing.rebuild(db)
+    return {
+        "books": books, "categories": categories, "depth": depth, "products": products,
+        "images": products * images, "product_categories": products * min(categories_per_product, categories),
+        "seconds": round(time.perf_counter() - start, 2),
+    }
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """Tham số kích thước catalog (dùng chung với benchmarks.load)."""
+    parser.add_argument("--books", type=int, default=1000)
+    parser.add_argument("--products", type=int, default=10000)
+    parser.add_argument("--categories", type=int, default=200)
+    parser.add_argument("--depth", type=int, default=4, help="số cấp của cây category")
+    parser.add_argument("--images", type=int, default=2, help="số ảnh mỗi sản phẩm")
+    parser.add_argument("--categories-per-product", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=42, help="seed của bộ sinh ngẫu nhiên")
+
+
+def seed_from_args(session_factory, args, reset: bool = False) -> dict:
+    return seed(session_factory, args.books, args.products, args.categories, args.depth,
+                args.images, args.categories_per_product, args.seed, reset)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tạo catalog giả lập cho benchmark")
+    add_arguments(parser)
+    parser.add_argument("--reset", action="store_true", help="xóa dữ liệu cũ của mọi bảng trước")
+    args = parser.parse_args()
+
+    import db
+    db.create_table()
+    print(json.dumps(seed_from_args(db.SessionLocal, args, args.reset), indent=2))
+
+
+if __name__ == "__main__":
+    main()
+
+
+# Tác dụng chính: Sinh catalog giả lập (sách, cây category, sản phẩm, ảnh) có thể tái lập cho benchmark.
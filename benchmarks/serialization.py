@@ -0,0 +1,141 @@
+# benchmarks/serialization.py
+# So sánh thời gian serialize danh sách lớn: bản detail (ORM object + validate
+# from_attributes, kèm images / categories) với bản summary (SELECT thẳng cột
+# thành dict, validate từ dict) - xem schemas.ProductSummary / CategorySummary.
+#
+#   python -m benchmarks.serialization                 (chạy từ thư mục gốc)
+#   python -m benchmarks.serialization -n 5000 --json
+#
+# Dùng SQLite trong bộ nhớ (không cần DATABASE_URL). Kết quả tính theo ms cho
+# mỗi 1000 item; "query" là thời gian SELECT + tạo object/dòng, "serialize" là
+# validate theo schema + dump JSON (đúng việc dispatch() + cache.cached_response làm).
+import argparse
+import json
+import statistics
+import time
+
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from models import Base, Category, Product, ProductImage, product_category_table
+import listing
+import schemas
+import services
+
+try:
+    import orjson
+except ImportError:  # tùy chọn: chỉ để so sánh
+    orjson = None
+
+
+def _seed(session_factory, n: int, categories: int):
+    with session_factory() as db:
+        rows = []
+        for cid in range(1, categories + 1):
+            parent = None if cid <= 5 else (cid % 5) + 1
+            path = f"/{cid}/" if parent is None else f"/{parent}/{cid}/"
+            rows.append({"id": cid, "name": f"c{cid}", "parent_id": parent, "path": path})
+        db.execute(insert(Category), rows)
+        db.execute(insert(Product), [
+            {"id": i, "name": f"product {i}", "description": "mô tả " * 20, "price": 1000 * i,
+             "stock_quantity": i % 7, "view_count": i, "thumbnail_url": f"images/{i}.jpg"}
+            for i in range(1, n + 1)
+        ])
+        renditions = {size: {"jpeg": f"{size}.jpg", "webp": f"{size}.webp"} for size in ("150", "300", "800")}
+        db.execute(insert(ProductImage), [
+            {"product_id": i, "image_url": f"images/full/{i}-{k}.jpg", "status": "ready", "renditions": renditions}
+            for i in range(1, n + 1) for k in range(2)
+        ])
+        db.execute(insert(product_category_table), [
+            {"product_id": i, "category_id": cid}
+            for i in range(1, n + 1) for cid in {i % categories + 1, (i * 7) % categories + 1}
+        ])
+        db.commit()
+        # ghi bằng Core không qua ORM events -> dựng read model mà get_all_products đọc
+        listing.rebuild(db)
+
+
+def _timed(fn, repeat: int, per: int) -> float:
+    """Trung vị thời gian chạy fn(), quy về ms cho mỗi 1000 item."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return round(statistics.median(samples) * 1000 * 1000 / per, 2)
+
+
+def _case(session_factory, load, schema, repeat: int, per: int) -> dict:
+    """load(db) -> dữ liệu; đo query (mỗi lần session mới) và serialize (trên dữ liệu đã tải)."""
+    adapter = TypeAdapter(schema)
+
+    def query():
+        with session_factory() as db:
+            load(db)
+
+    with session_factory() as db:
+        data = load(db)
+        result = {
+            "query_ms": _timed(query, repeat, per),
+            "serialize_ms": _timed(lambda: adapter.dump_json(adapter.validate_python(data, from_attributes=True)),
+                                   repeat, per),
+            "bytes_per_item": len(adapter.dump_json(adapter.validate_python(data, from_attributes=True))) // per,
+        }
+        if orjson is not None and isinstance(data, dict) and data["items"] and isinstance(data["items"][0], dict):
+            # dict của dòng đã đúng kiểu từ DB: có thể bỏ qua validate, dump thẳng
+            result["orjson_ms"] = _timed(lambda: orjson.dumps(data), repeat, per)
+    return result
+
+
+def run(n: int = 1000, repeat: int = 20, categories: int = 50) -> dict:
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    session_factory = sessionmaker(bind=engine)
+    _seed(session_factory, n, categories)
+
+    summary = services.PRODUCT_SUMMARY_FIELDS
+    results = {"items": n, "orjson": orjson is not None}
+    results["products_detail"] = _case(
+        session_factory, lambda db: services.get_all_products(db, limit=n),
+        schemas.Page[schemas.Product], repeat, n,
+    )
+    results["products_summary"] = _case(
+        session_factory, lambda db: services.get_all_products(db, limit=n, fields=summary),
+        schemas.Page[schemas.ProductSummary], repeat, n,
+    )
+    # cây category: detail kèm products (mỗi product kèm images + categories)
+    results["categories_detail"] = _case(
+        session_factory, services.get_root_categories, list[schemas.Category], repeat, categories,
+    )
+    results["categories_summary"] = _case(
+        session_factory, lambda db: services.get_root_categories(db, view="summary"),
+        list[schemas.CategorySummary], repeat, categories,
+    )
+    engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Thời gian serialize danh sách: detail vs summary")
+    parser.add_argument("-n", type=int, default=1000, help="số sản phẩm")
+    parser.add_argument("--repeat", type=int, default=20, help="số lần lặp mỗi phép đo")
+    parser.add_argument("--json", action="store_true", help="in kết quả dạng JSON")
+    args = parser.parse_args()
+
+    results = run(args.n, args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"ms / 1000 item ({args.n} sản phẩm, 50 category)")
+    for name, value in results.items():
+        line = ", ".join(f"{k}={v}" for k, v in value.items()) if isinstance(value, dict) else value
+        print(f"{name:>20}: {line}")
+
+
+if __name__ == "__main__":
+    main()
+
+
+# Tác dụng chính: Đo thời gian query + serialize danh sách bản detail so với bản summary.
@@ -0,0 +1,133 @@
+# bulk.py
+# Nhận body của các endpoint ghi hàng loạt (/bulk/{entity}) và chia thành lô.
+#
+# - Body: JSON array (application/json) hoặc NDJSON (application/x-ndjson, mỗi
+#   dòng 1 item). NDJSON được đọc theo stream: mỗi khi đủ BULK_BATCH_SIZE item
+#   thì ghi lô đó luôn, không cần giữ cả body trong bộ nhớ.
+# - Mỗi item được validate riêng; item sai -> lỗi kèm vị trí (index), các item
+#   còn lại vẫn được ghi.
+# - transaction="batch": mỗi lô 1 transaction (lô lỗi không ảnh hưởng lô khác).
+#   transaction="all": tất cả trong 1 transaction; có bất kỳ lỗi nào -> rollback
+#   toàn bộ, không ghi gì.
+# Việc ghi thật sự (executemany, bảng trung gian...) nằm trong services.bulk_write.
+import json
+
+from fastapi import HTTPException, Request, status
+from pydantic import ValidationError
+
+from config import settings
+import async_services
+import schemas
+
+CREATE_SCHEMAS = {
+    "books": schemas.BookCreate,
+    "products": schemas.ProductCreate,
+    "categories": schemas.CategoryCreate,
+}
+# Cập nhật một phần: {"id": 1, "price": 999} chỉ sửa price
+UPDATE_SCHEMAS = {
+    "books": schemas.BookUpdate,
+    "products": schemas.ProductUpdate,
+    "categories": schemas.CategoryUpdate,
+}
+
+
+async def iter_items(request: Request):
+    """Sinh lần lượt các item (đã parse JSON hoặc lỗi ValueError) từ body."""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type in ("application/x-ndjson", "application/jsonl", "application/ndjson"):
+        buffer = b""
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield _parse_line(line)
+        if buffer.strip():
+            yield _parse_line(buffer)
+        return
+
+    try:
+        items = json.loads(await request.body())
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Body is not valid JSON")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Body must be a JSON array")
+    for item in items:
+        yield item
+
+
+def _parse_line(line: bytes):
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return ValueError(f"Invalid JSON line: {e}")
+
+
+def _error_message(error: Exception) -> str:
+    if isinstance(error, ValidationError):
+        return "; ".join(f"{'.'.join(map(str, e['loc'])) or 'item'}: {e['msg']}" for e in error.errors())
+    return str(error)
+
+
+def parse_item(entity: str, op: str, raw):
+    """Item thô -> payload cho services.bulk_write (xem _BULK_HANDLERS)."""
+    if isinstance(raw, Exception):
+        raise raw
+    if op == "delete":
+        item_id = raw.get("id") if isinstance(raw, dict) else raw
+        if not isinstance(item_id, int) or isinstance(item_id, bool):
+            raise ValueError("Expected an integer id or {\"id\": <int>}")
+        return item_id
+    if op == "create":
+        return CREATE_SCHEMAS[entity].model_validate(raw)
+    if not isinstance(raw, dict) or not isinstance(raw.get("id"), int):
+        raise ValueError("Update items need an integer \"id\"")
+    fields = {key: value for key, value in raw.items() if key != "id"}
+    return raw["id"], UPDATE_SCHEMAS[entity].model_validate(fields)
+
+
+async def run(db, request: Request, entity: str, op: str, transaction: str,
+              batch_size: int | None = None) -> schemas.BulkResult:
+    batch_size = batch_size or settings.BULK_BATCH_SIZE
+    commit_each = transaction == "batch"
+    result = schemas.BulkResult()
+    batch: list = []
+
+    async def flush():
+        outcome = await async_services.dispatch(db, "bulk_write", entity, op, batch, commit=commit_each)
+        result.ids.extend(item_id for _, item_id in outcome["ok"])
+        result.succeeded += len(outcome["ok"])
+        result.errors.extend(schemas.BulkError(index=i, error=str(e)) for i, e in outcome["errors"])
+        batch.clear()
+
+    index = 0
+    async for raw in iter_items(request):
+        if index >= settings.BULK_MAX_ITEMS:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"At most {settings.BULK_MAX_ITEMS} items per request",
+            )
+        try:
+            batch.append((index, parse_item(entity, op, raw)))
+        except (ValidationError, ValueError) as e:
+            result.errors.append(schemas.BulkError(index=index, error=_error_message(e)))
+        index += 1
+        if len(batch) >= batch_size:
+            await flush()
+    if batch:
+        await flush()
+
+    result.processed = index
+    result.errors.sort(key=lambda e: e.index)
+    if not commit_each:
+        # transaction="all": hoặc ghi tất cả, hoặc không ghi gì
+        result.committed = not result.errors
+        await async_services.dispatch(db, "bulk_finish", entity, result.committed)
+        if not result.committed:
+            result.succeeded, result.ids = 0, []
+    result.failed = result.processed - result.succeeded
+    return result
+
+
+# Tác dụng chính: Endpoint ghi hàng loạt (JSON array / NDJSON) theo lô, báo lỗi từng item.
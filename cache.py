@@ -0,0 +1,305 @@
+# cache.py
+# Cache đọc-xuyên (read-through) cho các endpoint GET của catalog.
+#
+# - Giá trị lưu trong cache là body JSON ĐÃ serialize (bytes) + ETag, nên lần
+#   hit không chạm DB và không chạy lại Pydantic.
+# - Vô hiệu hóa theo "namespace" (books / categories / products): mỗi namespace
+#   có một số phiên bản nằm trong key; khi ghi dữ liệu chỉ cần tăng số phiên bản
+#   là mọi key cũ không còn được dùng (LRU/TTL sẽ tự dọn).
+# - Backend thay được: InMemoryLRUBackend (mỗi worker một bản) hoặc
+#   RedisCacheBackend (dùng chung giữa các worker; FakeRedis cho dev/test).
+import functools
+import hashlib
+import inspect
+import threading
+import time
+from collections import OrderedDict
+
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from config import settings
+import metrics
+import uow
+
+CACHE_REQUESTS = metrics.Counter("cache_requests_total", "Số lần tra cache", ("route", "result"))
+CACHE_EVICTIONS = metrics.Counter("cache_evictions_total", "Số entry bị đẩy ra khỏi LRU")
+CACHE_INVALIDATIONS = metrics.Counter("cache_invalidations_total", "Số lần vô hiệu hóa", ("namespace",))
+
+
+# ===================================================================
+# --- BACKENDS ---
+# ===================================================================
+
+class CacheBackend:
+    def get(self, key: str) -> bytes | None:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes, ttl: float):
+        raise NotImplementedError
+
+    def incr(self, key: str) -> int:
+        raise NotImplementedError
+
+    def get_counter(self, key: str) -> int:
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class InMemoryLRUBackend(CacheBackend):
+    """LRU có giới hạn số entry, mỗi entry có TTL riêng (thread-safe)."""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._data: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._counters: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, ttl: float):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                CACHE_EVICTIONS.inc()
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def get_counter(self, key: str) -> int:
+        return self._counters.get(key, 0)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class FakeRedis:
+    """Bản giả lập tối thiểu của redis.Redis (get/set/incr/flushdb) để chạy local."""
+
+    def __init__(self):
+        self._data: dict[str, tuple[float | None, bytes]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ex=None):
+        if isinstance(value, (int, str)):
+            value = str(value).encode()
+        with self._lock:
+            self._data[key] = (time.monotonic() + ex if ex else None, value)
+        return True
+
+    def incr(self, key):
+        with self._lock:
+            _, value = self._data.get(key, (None, b"0"))
+            value = int(value) + 1
+            self._data[key] = (None, str(value).encode())
+            return value
+
+    def flushdb(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisCacheBackend(CacheBackend):
+    """Backend dùng chung giữa các worker; TTL và LRU do Redis (maxmemory-policy) quản lý."""
+
+    def __init__(self, client, prefix: str = "respcache:"):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key: str) -> bytes | None:
+        return self.client.get(self.prefix + key)
+
+    def set(self, key: str, value: bytes, ttl: float):
+        self.client.set(self.prefix + key, value, ex=max(1, int(ttl)))
+
+    def incr(self, key: str) -> int:
+        return int(self.client.incr(self.prefix + key))
+
+    def get_counter(self, key: str) -> int:
+        value = self.client.get(self.prefix + key)
+        return int(value) if value else 0
+
+    def clear(self):
+        self.client.flushdb()
+
+
+def _make_backend() -> CacheBackend:
+    if settings.CACHE_BACKEND == "redis":
+        import redis  # thư viện tùy chọn, chỉ cần khi dùng backend Redis
+        return RedisCacheBackend(redis.Redis.from_url(settings.CACHE_REDIS_URL))
+    if settings.CACHE_BACKEND == "fakeredis":
+        return RedisCacheBackend(FakeRedis())
+    return InMemoryLRUBackend(settings.CACHE_MAX_ENTRIES)
+
+
+backend: CacheBackend = _make_backend()
+
+
+# ===================================================================
+# --- VÔ HIỆU HÓA ---
+# ===================================================================
+
+def invalidate(*namespaces: str):
+    """Tăng phiên bản của namespace -> mọi response đã cache của nó hết hiệu lực."""
+    for namespace in namespaces:
+        backend.incr(f"ns:{namespace}")
+        CACHE_INVALIDATIONS.inc(namespace=namespace)
+
+
+def invalidates(*namespaces: str):
+    """
+    Decorator cho các hàm ghi trong services: sau khi hàm chạy xong (không lỗi)
+    thì vô hiệu hóa cache của các namespace bị ảnh hưởng. Dùng được cho cả
+    hàm sync lẫn async. Nếu session (tham số đầu) đang trong uow.unit_of_work
+    thì hoãn tới khi transaction commit (rollback thì bỏ).
+    """
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                result = await fn(*args, **kwargs)
+                _invalidate_after(args[0] if args else None, namespaces)
+                return result
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            result = fn(*args, **kwargs)
+            _invalidate_after(args[0] if args else None, namespaces)
+            return result
+        return wrapper
+    return decorator
+
+
+_PENDING_KEY = "cache_invalidations"
+
+
+def _invalidate_after(db, namespaces: tuple):
+    if isinstance(db, (Session, AsyncSession)) and uow.active(db):
+        db.info.setdefault(_PENDING_KEY, set()).update(namespaces)
+    else:
+        invalidate(*namespaces)
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if pending:
+        invalidate(*sorted(pending))
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _after_rollback(session, previous_transaction):
+    if not previous_transaction.nested:
+        session.info.pop(_PENDING_KEY, None)
+
+
+# ===================================================================
+# --- READ-THROUGH CHO ENDPOINT ---
+# ===================================================================
+
+def _cache_key(request: Request, namespaces: tuple) -> str:
+    versions = ",".join(f"{ns}={backend.get_counter(f'ns:{ns}')}" for ns in namespaces)
+    query = "&".join(sorted(request.url.query.split("&"))) if request.url.query else ""
+    return f"{request.url.path}?{query}|{versions}"
+
+
+def _etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or etag in [tag.strip() for tag in header.split(",")]
+
+
+@functools.lru_cache(maxsize=256)
+def type_adapter(schema) -> TypeAdapter:
+    """
+    TypeAdapter của `schema`, dựng 1 lần cho mỗi schema (dựng validator /
+    serializer tốn hơn nhiều so với dùng lại). Schema phải hashable: class,
+    list[...], Page[...] đều được.
+    """
+    return TypeAdapter(schema)
+
+
+async def cached_response(request: Request, route: str, namespaces: tuple, ttl: float,
+                          schema, producer) -> Response:
+    """
+    Trả response từ cache nếu có; nếu không thì gọi `producer()` (coroutine trả
+    về dữ liệu đã validate theo `schema`), serialize 1 lần, lưu cache rồi trả về.
+    Hỗ trợ ETag / If-None-Match -> 304. producer trả None -> không cache (404 do
+    caller tự xử lý: hàm này trả về None).
+    """
+    adapter = type_adapter(schema)
+    key = _cache_key(request, namespaces) if settings.CACHE_ENABLED else None
+    stored = backend.get(key) if key else None
+
+    if stored is not None:
+        CACHE_REQUESTS.inc(route=route, result="hit")
+        etag, body = stored[:34].decode(), stored[34:]
+    else:
+        CACHE_REQUESTS.inc(route=route, result="miss" if key else "bypass")
+        value = await producer()
+        if value is None:
+            return None
+        body = adapter.dump_json(value)
+        etag = _etag(body)
+        if key:
+            backend.set(key, etag.encode() + body, ttl)
+
+    # no-cache: client được lưu nhưng phải hỏi lại bằng If-None-Match
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def stats() -> dict:
+    """Số liệu hit/miss/eviction (cũng có trên /metrics)."""
+    return {
+        "backend": type(backend).__name__,
+        "entries": len(backend) if isinstance(backend, InMemoryLRUBackend) else None,
+        "hits": CACHE_REQUESTS.total(result="hit"),
+        "misses": CACHE_REQUESTS.total(result="miss"),
+        "evictions": CACHE_EVICTIONS.value(),
+    }
+
+
+# Tác dụng chính: Cache response của các endpoint GET catalog + vô hiệu hóa khi ghi.
@@ -0,0 +1,132 @@
+# category_tree.py
+# Chỉ mục cây category dạng "materialized path".
+#
+# Mỗi Category lưu cột `path` gồm id của tất cả tổ tiên và chính nó,
+# ví dụ: gốc 1 -> con 4 -> cháu 9  =>  path của cháu là "/1/4/9/".
+# Nhờ vậy:
+#   - cả cây con của X:     path LIKE '<path của X>%'          (1 câu SELECT)
+#   - tổ tiên (breadcrumb): id của chúng nằm sẵn trong path của X (1 câu SELECT theo khóa chính)
+#   - sản phẩm của cả cây:  JOIN bảng trung gian + điều kiện LIKE (1 câu SELECT)
+# rồi ghép cây trong bộ nhớ thay vì mỗi cấp một câu truy vấn.
+#
+# Các hàm *_stmt nhận PATH (đã tra trước bằng paths_stmt), không nhận id: prefix
+# của LIKE phải là hằng số thì planner mới dùng được index varchar_pattern_ops
+# trên cột path (prefix lấy từ subquery / cột khác -> quét cả bảng).
+from sqlalchemy import select, update, literal, func, or_, false
+from sqlalchemy.orm.attributes import set_committed_value
+
+from models import Category, Product, product_category_table
+
+SEPARATOR = "/"
+
+
+def build_path(parent_path: str | None, category_id: int) -> str:
+    """Path của một category từ path của cha (None nếu là gốc)."""
+    return f"{parent_path or SEPARATOR}{category_id}{SEPARATOR}"
+
+
+def path_ids(path: str) -> list[int]:
+    """'/1/4/9/' -> [1, 4, 9]"""
+    return [int(part) for part in path.strip(SEPARATOR).split(SEPARATOR) if part]
+
+
+def paths_stmt(*category_ids: int):
+    """SELECT path của các category (category không tồn tại -> không có dòng)."""
+    return select(Category.path).where(Category.id.in_(category_ids))
+
+
+def subtree_stmt(path: str | None = None, with_products: bool = True):
+    """
+    SELECT cả cây (path=None) hoặc cây con có gốc mang `path` (gồm chính nó),
+    sắp theo path để cha luôn đứng trước con.
+    """
+    stmt = select(Category).order_by(Category.path)
+    if path is not None:
+        stmt = stmt.where(Category.path.startswith(path, autoescape=True))
+    if with_products:
+        # import tại chỗ để tránh vòng import services <-> category_tree
+        from services import category_products_options
+        stmt = stmt.options(*category_products_options())
+    return stmt
+
+
+def subtree_rows_stmt(path: str | None = None):
+    """
+    Như subtree_stmt nhưng chỉ SELECT các cột của schemas.CategorySummary
+    (không products, không tạo ORM object). Ghép cây bằng assemble_rows().
+    """
+    stmt = select(Category.id, Category.name, Category.parent_id, Category.image_url).order_by(Category.path)
+    if path is not None:
+        stmt = stmt.where(Category.path.startswith(path, autoescape=True))
+    return stmt
+
+
+def ancestors_stmt(path: str, include_self: bool = True):
+    """SELECT các tổ tiên của category mang `path` (breadcrumb), từ gốc xuống."""
+    ids = path_ids(path)
+    if not include_self:
+        ids = ids[:-1]
+    return select(Category).where(Category.id.in_(ids)).order_by(func.length(Category.path))
+
+
+def descendant_product_ids_stmt(*paths: str):
+    """SELECT id các sản phẩm thuộc một trong các category mang `paths` HOẶC con cháu của chúng."""
+    # category_id IN (cây con) -> đi từ category sang bảng trung gian qua index
+    # (category_id, product_id) thay vì quét cả bảng trung gian
+    subtree = select(Category.id).where(
+        or_(false(), *[Category.path.startswith(path, autoescape=True) for path in paths])
+    )
+    return select(product_category_table.c.product_id).where(product_category_table.c.category_id.in_(subtree))
+
+
+def descendant_products_stmt(path: str):
+    """SELECT các sản phẩm thuộc category mang `path` HOẶC bất kỳ category con cháu nào."""
+    in_subtree = descendant_product_ids_stmt(path)
+    return select(Product).where(Product.id.in_(in_subtree)).order_by(Product.id)
+
+
+def move_subtree_stmt(old_prefix: str, new_prefix: str):
+    """UPDATE path của cả cây con khi đổi cha: thay prefix cũ bằng prefix mới."""
+    return (
+        update(Category)
+        .where(Category.path.startswith(old_prefix, autoescape=True))
+        .values(path=literal(new_prefix) + func.substr(Category.path, len(old_prefix) + 1))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def assemble(categories: list[Category], root_id: int | None = None) -> list[Category]:
+    """
+    Ghép danh sách category phẳng (đã sắp theo path) thành cây trong bộ nhớ.
+
+    Gán trực tiếp collection `children` (set_committed_value) nên khi serialize
+    schemas.Category sẽ KHÔNG phát sinh lazy load. Trả về các nút gốc: các
+    category gốc (root_id=None) hoặc [category root_id].
+    """
+    children_of: dict[int, list[Category]] = {c.id: [] for c in categories}
+    roots = []
+    for category in categories:
+        siblings = children_of.get(category.parent_id)
+        if siblings is not None and category.id != root_id:
+            siblings.append(category)
+        elif root_id is None or category.id == root_id:
+            roots.append(category)
+    for category in categories:
+        set_committed_value(category, "children", children_of[category.id])
+    return roots
+
+
+def assemble_rows(rows, root_id: int | None = None) -> list[dict]:
+    """Như assemble() nhưng với các dòng của subtree_rows_stmt -> cây dict lồng nhau."""
+    nodes = {row.id: {**row._mapping, "children": []} for row in rows}
+    roots = []
+    for row in rows:
+        siblings = nodes[row.parent_id]["children"] if row.parent_id in nodes else None
+        if siblings is not None and row.id != root_id:
+            siblings.append(nodes[row.id])
+        elif root_id is None or row.id == root_id:
+            roots.append(nodes[row.id])
+    return roots
+
+
+# Tác dụng chính: Truy vấn cây category (cây con, breadcrumb, sản phẩm của cả cây) bằng 1 câu SQL.
@@ -0,0 +1,174 @@
+# export.py
+# Xuất toàn bộ catalog dạng NDJSON / CSV theo stream (GET /export/{entity}).
+#
+# GET /products/ trả JSON của cả trang trong bộ nhớ; xuất cả bảng theo cách đó
+# làm worker hết RAM. Ở đây:
+#   - SELECT chỉ các cột cần (không tạo ORM object), đọc bằng server-side cursor
+#     (stream_results + yield_per) -> mỗi lần chỉ giữ EXPORT_CHUNK_SIZE dòng;
+#   - mỗi lô dòng được serialize rồi gửi ngay qua StreamingResponse;
+#   - gzip nén dần từng lô (zlib.compressobj), không đệm cả file.
+# Bộ nhớ dùng không phụ thuộc số dòng của bảng.
+import csv
+import io
+import json
+import zlib
+
+from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+
+from config import settings
+from models import Book, Product, product_category_table
+import metrics
+
+EXPORT_ROWS = metrics.Counter("export_rows_total", "Số dòng đã xuất", ("entity", "format"))
+
+# Các trường được phép xuất (và thứ tự mặc định)
+EXPORT_FIELDS = {
+    "books": ["id", "title", "author", "description", "year"],
+    "products": ["id", "name", "description", "price", "stock_quantity", "view_count",
+                 "thumbnail_url", "category_ids"],
+}
+_MODELS = {"books": Book, "products": Product}
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+
+def parse_fields(entity: str, fields: str | None) -> list[str]:
+    """"id,name,price" -> ["id", "name", "price"]; trường lạ -> 400."""
+    allowed = EXPORT_FIELDS[entity]
+    if not fields:
+        return list(allowed)
+    selected = list(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [f for f in selected if f not in allowed]
+    if unknown or not selected:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(allowed)}",
+        )
+    return selected
+
+
+def _statement(entity: str, fields: list[str]):
+    model = _MODELS[entity]
+    # luôn lấy id (để ghép category_ids), bỏ đi khi xuất nếu không được chọn
+    columns = [model.id] + [getattr(model, f) for f in fields if f not in ("id", "category_ids")]
+    return select(*columns).order_by(model.id)
+
+
+def _category_ids_stmt(product_ids: list[int]):
+    return select(product_category_table.c.product_id, product_category_table.c.category_id).where(
+        product_category_table.c.product_id.in_(product_ids)
+    )
+
+
+def _attach_category_ids(rows: list[dict], links) -> list[dict]:
+    by_product: dict[int, list[int]] = {}
+    for product_id, category_id in links:
+        by_product.setdefault(product_id, []).append(category_id)
+    for row in rows:
+        row["category_ids"] = sorted(by_product.get(row["id"], []))
+    return rows
+
+
+# ===================================================================
+# --- ĐỌC THEO LÔ (server-side cursor) ---
+# ===================================================================
+
+def _partitions_sync(entity: str, fields: list[str], chunk_size: int):
+    """Generator (chạy trong threadpool): mỗi lần trả 1 lô dòng dạng dict."""
+    from db import SessionLocal
+    stmt = _statement(entity, fields).execution_options(stream_results=True, yield_per=chunk_size)
+    with SessionLocal() as db:
+        for partition in db.execute(stmt).mappings().partitions():
+            rows = [dict(row) for row in partition]
+            if "category_ids" in fields:
+                _attach_category_ids(rows, db.execute(_category_ids_stmt([r["id"] for r in rows])))
+            yield rows
+
+
+async def _partitions_async(entity: str, fields: list[str], chunk_size: int):
+    from db import AsyncSessionLocal
+    stmt = _statement(entity, fields).execution_options(yield_per=chunk_size)
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(stmt)
+        async for partition in result.mappings().partitions():
+            rows = [dict(row) for row in partition]
+            if "category_ids" in fields:
+                links = await db.execute(_category_ids_stmt([r["id"] for r in rows]))
+                _attach_category_ids(rows, links)
+            yield rows
+
+
+async def _partitions_threaded(entity: str, fields: list[str], chunk_size: int):
+    generator = _partitions_sync(entity, fields, chunk_size)
+    try:
+        async for rows in iterate_in_threadpool(generator):
+            yield rows
+    finally:
+        # client ngắt giữa chừng -> đóng cursor + trả connection về pool
+        await run_in_threadpool(generator.close)
+
+
+def _partitions(entity: str, fields: list[str], chunk_size: int):
+    # Dùng session RIÊNG (không phải session của request): stream kéo dài
+    # sau khi handler đã return, và cần giữ 1 connection cho cursor.
+    if settings.USE_ASYNC_DB:
+        return _partitions_async(entity, fields, chunk_size)
+    return _partitions_threaded(entity, fields, chunk_size)
+
+
+# ===================================================================
+# --- SERIALIZE + NÉN ---
+# ===================================================================
+
+def _ndjson(rows: list[dict], fields: list[str]) -> bytes:
+    lines = [json.dumps({f: row[f] for f in fields}, ensure_ascii=False, default=str) for row in rows]
+    return ("\n".join(lines) + "\n").encode()
+
+
+def _csv(rows: list[dict], fields: list[str], header: bool) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(fields)
+    for row in rows:
+        writer.writerow(
+            " ".join(map(str, row[f])) if f == "category_ids" else row[f] for f in fields
+        )
+    return buffer.getvalue().encode()
+
+
+async def _body(entity: str, fmt: str, fields: list[str], compress: bool, chunk_size: int):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if compress else None
+    first = True
+    async for rows in _partitions(entity, fields, chunk_size):
+        data = _ndjson(rows, fields) if fmt == "ndjson" else _csv(rows, fields, header=first)
+        first = False
+        EXPORT_ROWS.inc(len(rows), entity=entity, format=fmt)
+        if compressor is not None:
+            data = compressor.compress(data)
+        if data:
+            yield data
+    if fmt == "csv" and first:
+        # bảng rỗng: vẫn trả dòng tiêu đề
+        data = _csv([], fields, header=True)
+        yield compressor.compress(data) if compressor is not None else data
+    if compressor is not None:
+        yield compressor.flush()
+
+
+def stream_export(entity: str, fmt: str, fields: str | None, compress: bool) -> StreamingResponse:
+    selected = parse_fields(entity, fields)
+    headers = {"Content-Disposition": f'attachment; filename="{entity}.{fmt}"'}
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+    return StreamingResponse(
+        _body(entity, fmt, selected, compress, settings.EXPORT_CHUNK_SIZE),
+        media_type=MEDIA_TYPES[fmt],
+        headers=headers,
+    )
+
+
+# Tác dụng chính: Xuất catalog NDJSON / CSV theo stream với bộ nhớ không đổi.
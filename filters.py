@@ -0,0 +1,69 @@
+# filters.py
+# Bộ lọc + chọn trường (projection) cho danh sách sản phẩm (GET /products/,
+# /search/products).
+#
+# Mỗi bộ lọc tương ứng với một index trong models.py, để danh sách đã lọc vẫn là
+# một lần quét index ngắn (kết hợp keyset pagination, xem pagination.py):
+#   category_ids -> ix_middleTableProductCategory_category (category -> sản phẩm)
+#   sort=price / view_count -> ix_Products_price_id / ix_Products_view_count_id
+#   in_stock=true           -> ix_Products_in_stock_price (partial index)
+#   name_prefix             -> ix_Products_name_lower (lower(name) text_pattern_ops)
+# Read model ProductListing (listing.py) có cùng các index ix_ProductListing_*.
+# Kiểm tra planner thật sự dùng các index này: python -m pytest tests/test_indexes.py
+from fastapi import HTTPException, status
+from sqlalchemy import func, literal_column
+
+from models import Product
+import category_tree
+import schemas
+
+# Các trường có thể chọn bằng ?fields= (theo schemas.Product)
+PRODUCT_FIELDS = list(schemas.Product.model_fields)
+# Trường là relationship: chỉ tải (selectinload) khi được chọn
+PRODUCT_RELATIONSHIPS = {"images", "categories"}
+
+
+def parse_fields(fields: str | None) -> tuple[str, ...] | None:
+    """"name,price" -> ("id", "name", "price"); None = đủ mọi trường; trường lạ -> 400."""
+    if not fields:
+        return None
+    selected = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in selected if f not in PRODUCT_FIELDS]
+    if unknown or not selected:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(PRODUCT_FIELDS)}",
+        )
+    # luôn có id; giữ thứ tự khai báo của schema để cache key / output ổn định
+    wanted = {"id", *selected}
+    return tuple(f for f in PRODUCT_FIELDS if f in wanted)
+
+
+def product_clauses(category_paths: list[str] | None = None, min_price: int | None = None,
+                    max_price: int | None = None, in_stock: bool | None = None,
+                    name_prefix: str | None = None, model=Product) -> list:
+    """
+    Các điều kiện WHERE trên Product (None = không lọc). model=ProductListing:
+    cùng điều kiện trên read model (cùng tên cột, cùng bộ index, xem listing.py).
+    category_paths: path của các category cần lọc, tra trước từ id
+    (category_tree.paths_stmt); [] = các category không tồn tại -> không sản phẩm nào.
+    """
+    clauses = []
+    if category_paths is not None:
+        # thuộc một trong các category HOẶC con cháu của chúng
+        clauses.append(model.id.in_(category_tree.descendant_product_ids_stmt(*category_paths)))
+    if min_price is not None:
+        clauses.append(model.price >= min_price)
+    if max_price is not None:
+        clauses.append(model.price <= max_price)
+    if in_stock is not None:
+        # hằng số 0 viết thẳng vào SQL (không bind param) để planner khớp được
+        # điều kiện của partial index kể cả với prepared statement (asyncpg)
+        zero = literal_column("0")
+        clauses.append(model.stock_quantity > zero if in_stock else model.stock_quantity <= zero)
+    if name_prefix:
+        clauses.append(func.lower(model.name).startswith(name_prefix.lower(), autoescape=True))
+    return clauses
+
+
+# Tác dụng chính: Lọc / chọn trường cho danh sách sản phẩm, khớp với các index của bảng Products.
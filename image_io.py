@@ -0,0 +1,124 @@
+# image_io.py
+# Ghi file upload và xử lý ảnh (Pillow) NGOÀI event loop.
+#
+# - Ghi file: copy cả file upload trong threadpool với buffer lớn
+#   (UPLOAD_CHUNK_SIZE) thay vì vòng lặp đọc/ghi 1 KB trên event loop.
+# - Decode / resize: chạy trong ProcessPoolExecutor (Pillow giữ GIL khi decode
+#   JPEG lớn), tối đa IMAGE_WORKERS job cùng lúc. Hàng đợi job và việc từ
+#   chối (503) khi quá tải nằm ở image_pipeline.py.
+import asyncio
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi import HTTPException, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
+from PIL import Image
+
+from config import settings
+import metrics
+
+IMAGE_JOBS = metrics.Histogram("image_job_seconds", "Thời gian xử lý ảnh trong process pool", ("job",))
+
+_pool: ProcessPoolExecutor | None = None
+_semaphore: asyncio.Semaphore | None = None
+
+
+# ===================================================================
+# --- HÀM CHẠY TRONG PROCESS CON (phải ở top-level để pickle được) ---
+# ===================================================================
+
+def render_renditions(original_path: str, out_root: str, name: str,
+                      sizes: list[int], formats: list[str]) -> dict:
+    """
+    Tạo các rendition (mỗi kích thước x mỗi định dạng) từ ảnh gốc.
+    Trả về {"300": {"jpeg": "images/.../300/<name>.jpg", "webp": ...}, ...}
+    (đường dẫn tương đối so với thư mục static).
+
+    - draft(): với JPEG, Pillow decode thẳng ở tỉ lệ 1/2, 1/4, 1/8 vừa đủ cho
+      rendition lớn nhất -> nhanh và tốn ít RAM hơn nhiều so với decode full.
+    - Rendition nhỏ được thu nhỏ từ rendition lớn hơn liền trước (không từ ảnh gốc).
+    """
+    renditions: dict[str, dict[str, str]] = {}
+    with Image.open(original_path) as img:
+        largest = max(sizes)
+        img.draft("RGB", (largest, largest))
+        source = img.convert("RGBA" if img.mode in ("RGBA", "LA", "P") else "RGB")
+
+    for size in sorted(sizes, reverse=True):
+        source = source.copy()
+        source.thumbnail((size, size), reducing_gap=2.0)
+        renditions[str(size)] = {}
+        for fmt in formats:
+            extension = "jpg" if fmt == "jpeg" else fmt
+            directory = os.path.join(out_root, str(size))
+            os.makedirs(directory, exist_ok=True)
+            image = source.convert("RGB") if fmt == "jpeg" and source.mode != "RGB" else source
+            image.save(os.path.join(directory, f"{name}.{extension}"), format=fmt.upper(), quality=85)
+            relative = os.path.join(os.path.relpath(directory, "static"), f"{name}.{extension}")
+            renditions[str(size)][fmt] = relative.replace("\\", "/")
+    return renditions
+
+
+# ===================================================================
+# --- PROCESS POOL ---
+# ===================================================================
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=settings.IMAGE_WORKERS)
+    return _pool
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(settings.IMAGE_WORKERS)
+    return _semaphore
+
+
+async def run_in_pool(job: str, fn, *args):
+    """Chạy `fn(*args)` trong process pool, tối đa IMAGE_WORKERS job cùng lúc."""
+    async with _get_semaphore():
+        loop = asyncio.get_running_loop()
+        with IMAGE_JOBS.time(job=job):
+            return await loop.run_in_executor(_get_pool(), fn, *args)
+
+
+def shutdown():
+    """Đóng process pool (gọi trong lifespan khi tắt ứng dụng)."""
+    global _pool, _semaphore
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
+    _semaphore = None
+
+
+# ===================================================================
+# --- GHI FILE UPLOAD ---
+# ===================================================================
+
+def _copy_to_disk(source, path: str, chunk_size: int) -> int:
+    source.seek(0)
+    with open(path, "wb", buffering=chunk_size) as buffer:
+        shutil.copyfileobj(source, buffer, chunk_size)
+        return buffer.tell()
+
+
+async def save_upload(file: UploadFile, path: str) -> int:
+    """
+    Ghi file upload xuống `path` trong threadpool; trả về số byte đã ghi.
+    Lỗi IO -> HTTP 500 (file dở dang bị xóa).
+    """
+    try:
+        return await run_in_threadpool(_copy_to_disk, file.file, path, settings.UPLOAD_CHUNK_SIZE)
+    except Exception as e:
+        if os.path.exists(path):
+            os.remove(path)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Could not save file: {e}")
+    finally:
+        await file.close()
+
+
+# Tác dụng chính: Ghi ảnh upload và render ảnh mà không chặn event loop.
@@ -0,0 +1,225 @@
+# image_pipeline.py
+# Hàng đợi xử lý ảnh sản phẩm chạy NỀN.
+#
+#   POST /products/{id}/upload-image/
+#       -> pipeline.admit()                     (503 + Retry-After nếu quá tải)
+#       -> ghi ảnh gốc, tạo ProductImage(status="pending"), COMMIT
+#       -> pipeline.submit(image_id, image_url)  -> trả response ngay
+#   worker (IMAGE_WORKERS task):
+#       -> image_io.render_renditions() trong process pool
+#       -> services.finish_product_image(): status ready/failed, lưu renditions,
+#          đặt Product.thumbnail_url nếu chưa có
+#
+# Hàng đợi nằm trong bộ nhớ của worker; ảnh còn "pending" khi tắt ứng dụng
+# được trả lại (stop() xóa claimed_at) và xếp hàng lại lúc khởi động (start()). Mỗi ảnh pending được đúng 1 worker
+# nhận (ProductImage.claimed_at): lúc upload là worker nhận request; lúc khởi
+# động, _recover() chỉ nhận các ảnh chưa ai nhận hoặc đã nhận quá
+# IMAGE_CLAIM_TIMEOUT bằng 1 câu UPDATE ... RETURNING (nguyên tử: N worker khởi
+# động cùng lúc không xử lý cùng 1 ảnh N lần).
+import asyncio
+import os
+import time
+from dataclasses import dataclass
+
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import or_, update
+
+from config import settings
+import image_io
+import metrics
+
+RENDITIONS_DIRECTORY = "static/images/products/renditions"
+
+IMAGE_PIPELINE_JOBS = metrics.Counter("image_pipeline_jobs_total", "Số job rendition đã xử lý", ("result",))
+IMAGE_REJECTED = metrics.Counter("image_jobs_rejected_total", "Số upload bị từ chối vì hàng đợi ảnh đầy")
+IMAGE_BACKLOG = metrics.Gauge(
+    "image_pipeline_backlog", "Số job ảnh đang chạy + đang chờ",
+    callback=lambda: {(): pipeline.backlog()},
+)
+
+
+@dataclass
+class ImageJob:
+    image_id: int
+    image_url: str   # đường dẫn tương đối so với static/, vd: images/products/full/<hex>.jpg
+
+
+class ImagePipeline:
+    def __init__(self):
+        self._queue: asyncio.Queue | None = None
+        self._workers: list[asyncio.Task] = []
+        self._busy = 0
+        self._in_flight: set[int] = set()   # id các ảnh worker đang xử lý
+
+    def _get_queue(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        return self._queue
+
+    def backlog(self) -> int:
+        return (self._queue.qsize() if self._queue is not None else 0) + self._busy
+
+    # --- Phía request ---
+
+    def admit(self):
+        """Gọi TRƯỚC khi ghi file: hàng đợi đầy -> 503 để client thử lại sau."""
+        if self.backlog() >= settings.IMAGE_WORKERS + settings.IMAGE_QUEUE_DEPTH:
+            IMAGE_REJECTED.inc()
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Image processing is busy, please retry later",
+                headers={"Retry-After": str(settings.IMAGE_RETRY_AFTER)},
+            )
+
+    def submit(self, image_id: int, image_url: str):
+        """Xếp job vào hàng đợi (không chờ xử lý xong)."""
+        self._get_queue().put_nowait(ImageJob(image_id, image_url))
+
+    # --- Worker ---
+
+    async def process(self, job: ImageJob):
+        """Tạo rendition cho 1 ảnh rồi ghi kết quả xuống DB."""
+        name = os.path.splitext(os.path.basename(job.image_url))[0]
+        try:
+            renditions = await image_io.run_in_pool(
+                "renditions", image_io.render_renditions,
+                os.path.join("static", job.image_url), RENDITIONS_DIRECTORY, name,
+                settings.IMAGE_RENDITION_SIZES, settings.IMAGE_RENDITION_FORMATS,
+            )
+        except Exception as e:
+            print(f"Không thể tạo rendition cho ảnh {job.image_id}: {e}")
+            IMAGE_PIPELINE_JOBS.inc(result="failed")
+            await self._finish(job.image_id, "failed", None)
+            return
+        IMAGE_PIPELINE_JOBS.inc(result="ready")
+        await self._finish(job.image_id, "ready", renditions)
+
+    async def _finish(self, image_id: int, status: str, renditions: dict | None):
+        if not settings.USE_ASYNC_DB:
+            import services
+            from db import SessionLocal
+
+            def _finish_sync():
+                with SessionLocal() as db:
+                    services.finish_product_image(db, image_id, status, renditions)
+            await run_in_threadpool(_finish_sync)
+            return
+        import async_services
+        from db import AsyncSessionLocal
+        async with AsyncSessionLocal() as db:
+            await async_services.finish_product_image(db, image_id, status, renditions)
+
+    async def _run(self):
+        queue = self._get_queue()
+        while True:
+            job = await queue.get()
+            self._busy += 1
+            self._in_flight.add(job.image_id)
+            try:
+                await self.process(job)
+            except Exception as e:
+                print(f"Lỗi khi xử lý ảnh {job.image_id}: {e}")
+            finally:
+                self._busy -= 1
+                self._in_flight.discard(job.image_id)
+                queue.task_done()
+
+    # --- Vòng đời (khởi động / dừng trong lifespan) ---
+
+    @staticmethod
+    def _claim_stmt(now: float):
+        """Nhận các ảnh pending chưa có worker nào xử lý (hoặc worker đó đã chết)."""
+        from models import ProductImage
+        return (
+            update(ProductImage)
+            .where(
+                ProductImage.status == "pending",
+                or_(ProductImage.claimed_at.is_(None), ProductImage.claimed_at < now - settings.IMAGE_CLAIM_TIMEOUT),
+            )
+            .values(claimed_at=now)
+            .returning(ProductImage.id, ProductImage.image_url)
+            .execution_options(synchronize_session=False)
+        )
+
+    @staticmethod
+    def _release_stmt(image_ids: list[int]):
+        """Trả lại các ảnh chưa xử lý xong: worker khác (hoặc lần khởi động sau) nhận ngay được."""
+        from models import ProductImage
+        return (
+            update(ProductImage)
+            .where(ProductImage.id.in_(image_ids), ProductImage.status == "pending")
+            .values(claimed_at=None)
+            .execution_options(synchronize_session=False)
+        )
+
+    async def _release(self, image_ids: list[int]):
+        stmt = self._release_stmt(image_ids)
+        if settings.USE_ASYNC_DB:
+            from db import AsyncSessionLocal
+            async with AsyncSessionLocal() as db:
+                await db.execute(stmt)
+                await db.commit()
+        else:
+            from db import SessionLocal
+
+            def _update():
+                with SessionLocal() as db:
+                    db.execute(stmt)
+                    db.commit()
+            await run_in_threadpool(_update)
+
+    async def _recover(self):
+        """Xếp hàng lại các ảnh còn pending (vd: ứng dụng bị tắt giữa chừng)."""
+        stmt = self._claim_stmt(time.time())
+        if settings.USE_ASYNC_DB:
+            from db import AsyncSessionLocal
+            async with AsyncSessionLocal() as db:
+                rows = (await db.execute(stmt)).all()
+                await db.commit()
+        else:
+            from db import SessionLocal
+
+            def _load():
+                with SessionLocal() as db:
+                    rows = db.execute(stmt).all()
+                    db.commit()
+                    return rows
+            rows = await run_in_threadpool(_load)
+        for image_id, image_url in rows:
+            self.submit(image_id, image_url)
+        return len(rows)
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        recovered = await self._recover()
+        if recovered:
+            print(f"Xếp hàng lại {recovered} ảnh đang chờ xử lý")
+        self._workers = [asyncio.create_task(self._run()) for _ in range(settings.IMAGE_WORKERS)]
+
+    async def stop(self):
+        """
+        Dừng worker; job chưa xong vẫn là pending trong DB và được trả lại
+        (claimed_at = NULL) để lần khởi động sau nhận lại ngay, không phải chờ
+        IMAGE_CLAIM_TIMEOUT.
+        """
+        unfinished = [*self._in_flight, *(job.image_id for job in self._get_queue()._queue)]
+        for task in self._workers:
+            task.cancel()
+        for task in self._workers:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._workers = []
+        self._queue = None
+        self._busy = 0
+        self._in_flight.clear()
+        if unfinished:
+            await self._release(unfinished)
+
+
+pipeline = ImagePipeline()
+
+
+# Tác dụng chính: Tạo các rendition ảnh sản phẩm trong nền, upload trả về ngay.
@@ -0,0 +1,197 @@
+# instrumentation.py
+# Đo hiệu năng từng request: middleware ASGI + event của engine SQLAlchemy.
+#
+#   - độ trễ theo route (histogram, nhãn là mẫu route "/products/{id}" chứ
+#     không phải URL thật, để số series có giới hạn), kích thước response;
+#   - số câu SQL, tổng thời gian SQL và số dòng trả về / bị ảnh hưởng của
+#     mỗi request;
+#   - log request / câu SQL chậm hơn ngưỡng (SLOW_REQUEST_MS / SLOW_QUERY_MS)
+#     kèm route và tham số;
+#   - xem qua /metrics (Prometheus) và header Server-Timing khi settings.DEBUG.
+#
+# Số liệu SQL được gắn với request qua contextvars: threadpool (anyio) và
+# greenlet của AsyncSession đều chạy trong context của request, nên event của
+# engine tìm được đúng RequestStats. Câu SQL ngoài request (view_counter,
+# image_pipeline...) chỉ được tính vào db_query_duration_seconds.
+import contextvars
+import logging
+import time
+
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+
+from config import settings
+import metrics
+
+logger = logging.getLogger("instrumentation")
+
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+HTTP_REQUEST_SECONDS = metrics.Histogram(
+    "http_request_duration_seconds", "Thời gian xử lý request", ("method", "route", "status")
+)
+HTTP_RESPONSE_BYTES = metrics.Histogram(
+    "http_response_size_bytes", "Kích thước body response", ("route",), buckets=SIZE_BUCKETS
+)
+HTTP_DB_QUERIES = metrics.Histogram(
+    "http_request_db_queries", "Số câu SQL mỗi request", ("route",), buckets=COUNT_BUCKETS
+)
+HTTP_DB_SECONDS = metrics.Histogram("http_request_db_seconds", "Tổng thời gian SQL mỗi request", ("route",))
+HTTP_DB_ROWS = metrics.Histogram(
+    "http_request_db_rows", "Số dòng SQL trả về / bị ảnh hưởng mỗi request", ("route",), buckets=ROW_BUCKETS
+)
+DB_QUERY_SECONDS = metrics.Histogram("db_query_duration_seconds", "Thời gian mỗi câu SQL", ("engine",))
+SLOW_REQUESTS = metrics.Counter("http_slow_requests_total", "Số request chậm hơn SLOW_REQUEST_MS", ("route",))
+SLOW_QUERIES = metrics.Counter("db_slow_queries_total", "Số câu SQL chậm hơn SLOW_QUERY_MS", ("route",))
+
+UNMATCHED_ROUTE = "<unmatched>"   # 404 / URL lạ: gom chung 1 nhãn
+
+_current: contextvars.ContextVar["RequestStats | None"] = contextvars.ContextVar("request_stats", default=None)
+
+
+def _truncate(value) -> str:
+    text = str(value)
+    limit = settings.SLOW_LOG_MAX_PARAMS
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+def route_of(scope: dict) -> str:
+    """Mẫu route đã khớp ("/products/{id}"); chỉ có sau khi router đã chạy."""
+    route = scope.get("route")
+    return getattr(route, "path", None) or UNMATCHED_ROUTE
+
+
+class RequestStats:
+    """Số liệu của một request (đọc / ghi từ middleware và event của engine)."""
+
+    __slots__ = ("scope", "start", "queries", "db_seconds", "rows", "response_bytes")
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.rows = 0
+        self.response_bytes = 0
+
+    @property
+    def route(self) -> str:
+        return route_of(self.scope)
+
+    def target(self) -> str:
+        """Path + query string (dùng khi log)."""
+        query = self.scope.get("query_string", b"").decode("latin-1")
+        return self.scope["path"] + ("?" + query if query else "")
+
+    def server_timing(self) -> str:
+        """Giá trị header Server-Timing (ms), vd: total;dur=12.5, db;dur=3.1;desc="4 queries"."""
+        total = (time.perf_counter() - self.start) * 1000
+        return (
+            f'total;dur={total:.1f}, db;dur={self.db_seconds * 1000:.1f};desc="{self.queries} queries", '
+            f'app;dur={max(total - self.db_seconds * 1000, 0):.1f}'
+        )
+
+
+def current() -> RequestStats | None:
+    """RequestStats của request đang chạy (None nếu ngoài request)."""
+    return _current.get()
+
+
+# ===================================================================
+# --- EVENT CỦA ENGINE ---
+# ===================================================================
+
+def instrument_engine(engine, label: str):
+    """Gắn event đo thời gian / số dòng của từng câu SQL (engine sync hoặc async_engine.sync_engine)."""
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        DB_QUERY_SECONDS.observe(elapsed, engine=label)
+        stats = _current.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += elapsed
+            # psycopg2 / asyncpg báo số dòng của cả SELECT; SQLite chỉ báo với DML (-1)
+            stats.rows += max(cursor.rowcount, 0)
+        if settings.SLOW_QUERY_MS and elapsed * 1000 >= settings.SLOW_QUERY_MS:
+            route = stats.route if stats is not None else "-"
+            SLOW_QUERIES.inc(route=route)
+            logger.warning(
+                "slow query %.1f ms [%s] route=%s request=%s: %s params=%s",
+                elapsed * 1000, label, route, _truncate(stats.target()) if stats is not None else "-",
+                _truncate(" ".join(statement.split())), _truncate(parameters),
+            )
+
+    def handle_error(exception_context):
+        # câu SQL lỗi không gọi after_cursor_execute: bỏ mốc thời gian của nó
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_start"):
+            conn.info["query_start"].pop()
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(engine, "handle_error", handle_error)
+
+
+# ===================================================================
+# --- MIDDLEWARE ---
+# ===================================================================
+
+class InstrumentationMiddleware:
+    """
+    Middleware ASGI thuần (không dùng BaseHTTPMiddleware: response stream vẫn
+    được gửi dần, và không tạo thêm task cho mỗi request).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope)
+        token = _current.set(stats)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if settings.DEBUG:
+                    MutableHeaders(scope=message).append("Server-Timing", stats.server_timing())
+            elif message["type"] == "http.response.body":
+                stats.response_bytes += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            _record(stats, scope["method"], status_code)
+
+
+def _record(stats: RequestStats, method: str, status_code: int):
+    elapsed = time.perf_counter() - stats.start
+    route = stats.route
+    HTTP_REQUEST_SECONDS.observe(elapsed, method=method, route=route, status=status_code)
+    HTTP_RESPONSE_BYTES.observe(stats.response_bytes, route=route)
+    HTTP_DB_QUERIES.observe(stats.queries, route=route)
+    HTTP_DB_SECONDS.observe(stats.db_seconds, route=route)
+    HTTP_DB_ROWS.observe(stats.rows, route=route)
+    if settings.SLOW_REQUEST_MS and elapsed * 1000 >= settings.SLOW_REQUEST_MS:
+        SLOW_REQUESTS.inc(route=route)
+        logger.warning(
+            "slow request %.1f ms %s %s route=%s status=%s: %d queries / %.1f ms SQL, %d rows, %d bytes",
+            elapsed * 1000, method, _truncate(stats.target()), route, status_code,
+            stats.queries, stats.db_seconds * 1000, stats.rows, stats.response_bytes,
+        )
+
+
+# Tác dụng chính: Đo độ trễ, số câu / thời gian SQL, số dòng, kích thước response của từng request.
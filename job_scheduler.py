@@ -0,0 +1,304 @@
+# job_scheduler.py
+# Chạy các job định kỳ (jobs.py) bằng APScheduler, theo SCHEDULER_MODE:
+#
+#   "off"     : không chạy job nào (mặc định).
+#   "local"   : job store trong bộ nhớ, mỗi worker tự chạy job (N worker uvicorn
+#               -> mỗi job chạy N lần). Chỉ dùng khi có 1 worker.
+#   "cluster" : job store SQLAlchemy trên engine hiện có (lịch + next_run_time
+#               được lưu, misfire được xử lý sau khi khởi động lại) và bầu
+#               leader bằng lease trong bảng SchedulerLease:
+#                   UPDATE "SchedulerLease" SET owner = <mình>, expires_at = now + TTL
+#                   WHERE name = 'scheduler' AND (owner = <mình> OR expires_at < now)
+#               (now là đồng hồ của DB, không phải của từng máy: lệch giờ giữa
+#               các host không sinh ra 2 leader)
+#               Câu UPDATE có điều kiện là nguyên tử (khóa dòng) -> tại mỗi thời
+#               điểm chỉ 1 worker giữ lease và chạy scheduler; leader gia hạn mỗi
+#               SCHEDULER_LEASE_RENEW_SECONDS, chết thì worker khác tiếp quản sau
+#               tối đa SCHEDULER_LEASE_SECONDS.
+#
+# Job chạy trong executor riêng (SCHEDULER_EXECUTOR: "thread" | "process"), job
+# async có event loop riêng trong executor -> không chiếm loop xử lý request.
+# max_instances / coalesce / misfire_grace_time lấy từ settings (job_definitions có thể ghi đè).
+import asyncio
+import os
+import socket
+import time
+import uuid
+
+from apscheduler.events import (
+    EVENT_JOB_ERROR, EVENT_JOB_EXECUTED, EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED, EVENT_JOB_SUBMITTED,
+)
+from apscheduler.executors.asyncio import AsyncIOExecutor
+from apscheduler.executors.pool import ProcessPoolExecutor, ThreadPoolExecutor
+from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.interval import IntervalTrigger
+from apscheduler.util import ref_to_obj
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, insert, or_, update
+from sqlalchemy.exc import IntegrityError
+
+from config import settings
+import metrics
+
+JOB_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+
+JOB_RUNS = metrics.Counter(
+    "scheduler_job_runs_total", "Số lần chạy job (success / error / missed / skipped)", ("job", "result")
+)
+JOB_SECONDS = metrics.Histogram(
+    "scheduler_job_duration_seconds", "Thời gian chạy job", ("job",), buckets=JOB_BUCKETS
+)
+JOB_DELAY = metrics.Histogram(
+    "scheduler_job_start_delay_seconds", "Độ trễ từ giờ hẹn đến lúc job được giao cho executor", ("job",),
+    buckets=JOB_BUCKETS,
+)
+SCHEDULER_LEADER = metrics.Gauge(
+    "scheduler_is_leader", "1 nếu worker này đang chạy scheduler",
+    callback=lambda: {(): 1 if job_scheduler.running else 0},
+)
+
+
+def job_definitions() -> list[dict]:
+    """Các job được lên lịch (tham số của scheduler.add_job)."""
+    return [
+        {
+            "id": "send_email_cron",
+            "func": "jobs:send_email_cron",
+            "trigger": IntervalTrigger(seconds=settings.SCHEDULER_EMAIL_INTERVAL),
+        },
+        {
+            "id": "refresh_popularity",
+            "func": "jobs:refresh_popularity",
+            "trigger": IntervalTrigger(seconds=settings.POPULARITY_REFRESH_INTERVAL),
+        },
+    ]
+
+
+def run_job(func_ref: str):
+    """
+    Điểm vào của mọi job trong thread / process executor: import hàm theo tham
+    chiếu; hàm async được chạy trong event loop riêng của executor.
+    Trả về (số giây chạy, kết quả); lỗi được gắn thêm job_seconds. Job tự đo
+    thời gian chạy vì với job ngắn, event "executed" có thể đến trước "submitted".
+    """
+    start = time.perf_counter()
+    try:
+        func = ref_to_obj(func_ref)
+        result = asyncio.run(func()) if asyncio.iscoroutinefunction(func) else func()
+    except Exception as e:
+        e.job_seconds = time.perf_counter() - start
+        raise
+    return time.perf_counter() - start, result
+
+
+async def run_job_async(func_ref: str):
+    """Như run_job nhưng chạy trên loop của ứng dụng (SCHEDULER_EXECUTOR="asyncio")."""
+    start = time.perf_counter()
+    try:
+        func = ref_to_obj(func_ref)
+        result = await func() if asyncio.iscoroutinefunction(func) else func()
+    except Exception as e:
+        e.job_seconds = time.perf_counter() - start
+        raise
+    return time.perf_counter() - start, result
+
+
+# ===================================================================
+# --- LEASE (BẦU LEADER) ---
+# ===================================================================
+
+def db_epoch(dialect_name: str):
+    """Thời điểm hiện tại (epoch, giây) theo đồng hồ của DB, dạng biểu thức SQL."""
+    if dialect_name == "postgresql":
+        return func.extract("epoch", func.now())
+    if dialect_name == "sqlite":
+        return (func.julianday("now") - 2440587.5) * 86400.0
+    return func.unix_timestamp()   # MySQL / MariaDB
+
+
+class LeaderLease:
+    """Lease theo tên trong bảng SchedulerLease; thao tác sync (gọi qua threadpool)."""
+
+    def __init__(self, engine, name: str = "scheduler"):
+        self.engine = engine
+        self.name = name
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def ensure(self):
+        """Tạo dòng lease (đã hết hạn) nếu chưa có."""
+        from models import SchedulerLease
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(insert(SchedulerLease).values(name=self.name, owner=None, expires_at=0))
+        except IntegrityError:
+            pass   # worker khác đã tạo
+
+    def try_acquire(self) -> bool:
+        """Giành hoặc gia hạn lease; True nếu worker này đang là leader."""
+        from models import SchedulerLease
+        now = db_epoch(self.engine.dialect.name)
+        with self.engine.begin() as conn:
+            result = conn.execute(
+                update(SchedulerLease)
+                .where(
+                    SchedulerLease.name == self.name,
+                    or_(SchedulerLease.owner == self.owner, SchedulerLease.expires_at < now),
+                )
+                .values(owner=self.owner, expires_at=now + settings.SCHEDULER_LEASE_SECONDS)
+            )
+        return result.rowcount == 1
+
+    def release(self):
+        """Trả lease khi tắt để worker khác tiếp quản ngay (không chờ hết hạn)."""
+        from models import SchedulerLease
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(SchedulerLease)
+                .where(SchedulerLease.name == self.name, SchedulerLease.owner == self.owner)
+                .values(owner=None, expires_at=0)
+            )
+
+
+# ===================================================================
+# --- SCHEDULER ---
+# ===================================================================
+
+class JobScheduler:
+    def __init__(self):
+        self.scheduler: AsyncIOScheduler | None = None
+        self.lease: LeaderLease | None = None
+        self._elector: asyncio.Task | None = None
+
+    @property
+    def running(self) -> bool:
+        return self.scheduler is not None and self.scheduler.running
+
+    # --- Dựng scheduler ---
+
+    def _executor(self):
+        workers = settings.SCHEDULER_EXECUTOR_WORKERS
+        if settings.SCHEDULER_EXECUTOR == "process":
+            return ProcessPoolExecutor(workers)
+        if settings.SCHEDULER_EXECUTOR == "asyncio":
+            return AsyncIOExecutor()   # như trước: job chạy trên loop của request
+        return ThreadPoolExecutor(workers)
+
+    def _build(self, jobstore) -> AsyncIOScheduler:
+        scheduler = AsyncIOScheduler(jobstores={"default": jobstore}, executors={"default": self._executor()})
+        scheduler.add_listener(
+            self._on_event,
+            EVENT_JOB_SUBMITTED | EVENT_JOB_EXECUTED | EVENT_JOB_ERROR | EVENT_JOB_MISSED | EVENT_JOB_MAX_INSTANCES,
+        )
+        return scheduler
+
+    def _schedule_jobs(self):
+        """
+        Đăng ký job; job đã có trong job store với cùng trigger thì giữ nguyên
+        next_run_time (để lần chạy bị lỡ lúc không có leader được xử lý theo
+        misfire_grace_time / coalesce thay vì bị dời lịch).
+        """
+        for definition in job_definitions():
+            definition = dict(definition)
+            func_ref = definition.pop("func")
+            runner = run_job_async if settings.SCHEDULER_EXECUTOR == "asyncio" else run_job
+            definition.update(func=runner, args=[func_ref])
+            # ghi rõ (không dựa vào job_defaults): modify() không áp dụng lại job_defaults
+            # cho job đã lưu, đổi settings sẽ không có tác dụng
+            definition.setdefault("max_instances", settings.SCHEDULER_MAX_INSTANCES)
+            definition.setdefault("coalesce", settings.SCHEDULER_COALESCE)
+            definition.setdefault("misfire_grace_time", settings.SCHEDULER_MISFIRE_GRACE_TIME)
+            existing = self.scheduler.get_job(definition["id"])
+            if existing is not None and str(existing.trigger) == str(definition["trigger"]):
+                existing.modify(**{key: value for key, value in definition.items() if key not in ("id", "trigger")})
+            else:
+                self.scheduler.add_job(replace_existing=True, **definition)
+
+    def _start_scheduler(self, jobstore):
+        self.scheduler = self._build(jobstore)
+        self.scheduler.start()
+        self._schedule_jobs()
+
+    def _stop_scheduler(self):
+        if self.scheduler is not None:
+            if self.scheduler.running:
+                self.scheduler.shutdown(wait=False)
+            self.scheduler = None
+
+    # --- Số liệu ---
+
+    def _on_event(self, event):
+        job = event.job_id
+        if event.code == EVENT_JOB_SUBMITTED:
+            now = time.time()
+            for run_time in event.scheduled_run_times:
+                JOB_DELAY.observe(max(now - run_time.timestamp(), 0), job=job)
+        elif event.code in (EVENT_JOB_EXECUTED, EVENT_JOB_ERROR):
+            if event.exception is not None:
+                seconds = getattr(event.exception, "job_seconds", None)
+                print(f"Job {job} lỗi: {event.exception!r}")
+            else:
+                seconds = event.retval[0] if isinstance(event.retval, tuple) else None
+            if seconds is not None:
+                JOB_SECONDS.observe(seconds, job=job)
+            JOB_RUNS.inc(job=job, result="success" if event.code == EVENT_JOB_EXECUTED else "error")
+        elif event.code == EVENT_JOB_MISSED:
+            JOB_RUNS.inc(job=job, result="missed")
+        else:   # EVENT_JOB_MAX_INSTANCES: lần trước chưa xong
+            JOB_RUNS.inc(job=job, result="skipped")
+
+    # --- Bầu leader ---
+
+    async def _elect(self):
+        while True:
+            try:
+                leader = await run_in_threadpool(self.lease.try_acquire)
+            except Exception as e:
+                # không gia hạn được thì coi như mất lease (tránh 2 leader cùng chạy)
+                print(f"Không gia hạn được lease của scheduler: {e}")
+                leader = False
+            if leader and not self.running:
+                print(f"Worker {self.lease.owner} trở thành leader, khởi động scheduler")
+                jobstore = SQLAlchemyJobStore(engine=self.lease.engine, tablename=settings.SCHEDULER_JOBSTORE_TABLE)
+                self._start_scheduler(jobstore)
+            elif not leader and self.running:
+                print(f"Worker {self.lease.owner} mất lease, dừng scheduler")
+                self._stop_scheduler()
+            await asyncio.sleep(settings.SCHEDULER_LEASE_RENEW_SECONDS)
+
+    # --- Vòng đời (khởi động / dừng trong lifespan) ---
+
+    async def start(self):
+        mode = settings.SCHEDULER_MODE
+        if mode == "off":
+            return
+        if mode == "local":
+            print("Khởi động scheduler (local)...")
+            self._start_scheduler(MemoryJobStore())
+            return
+        from db import engine
+        self.lease = LeaderLease(engine)
+        await run_in_threadpool(self.lease.ensure)
+        self._elector = asyncio.create_task(self._elect())
+
+    async def stop(self):
+        if self._elector is not None:
+            self._elector.cancel()
+            try:
+                await self._elector
+            except asyncio.CancelledError:
+                pass
+            self._elector = None
+        was_leader = self.running
+        if was_leader:
+            print("Tắt scheduler...")
+        self._stop_scheduler()
+        if self.lease is not None and was_leader:
+            await run_in_threadpool(self.lease.release)
+
+
+job_scheduler = JobScheduler()
+
+
+# Tác dụng chính: Chạy job định kỳ 1 lần cho cả cụm (leader lease + job store SQLAlchemy), trong executor riêng.
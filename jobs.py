@@ -0,0 +1,48 @@
+# jobs.py
+# Các job định kỳ (được job_scheduler.py lên lịch). Mỗi job là hàm cấp module
+# để job store lưu được dưới dạng tham chiếu "jobs:<tên hàm>" và process
+# executor import lại được trong process con.
+#
+# Job async chạy trong event loop RIÊNG của thread / process executor (không
+# phải loop xử lý request), nên không dùng chung các singleton gắn với loop
+# của ứng dụng (vd: mailer.mailer) mà tự tạo instance cho lần chạy đó.
+import datetime
+
+from pydantic import EmailStr
+
+from db import SessionLocal
+from mailer import Mailer
+import popularity
+
+
+async def send_email_cron():
+    """Gửi email báo cáo định kỳ (mặc định mỗi phút, SCHEDULER_EMAIL_INTERVAL)."""
+    print(f"Cron job running: Đang gửi email... lúc {datetime.datetime.now()}")
+
+    # Người nhận (bạn có thể thay đổi)
+    recipients: list[EmailStr] = ["hungmanh2607uitvnu@gmail.com"]
+
+    # Pool SMTP + worker riêng của lần chạy này; join() chờ gửi xong (kể cả retry)
+    job_mailer = Mailer()
+    await job_mailer.start(precompile=False)
+    try:
+        queued = await job_mailer.send_template(
+            "cron_email.html",
+            "Báo cáo Cron Job Tự Động (Mỗi 1 phút)",
+            recipients,
+            time=datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        )
+        await job_mailer.join()
+    finally:
+        await job_mailer.stop()
+    print(f"-> Đã gửi {queued} email")
+
+
+def refresh_popularity():
+    """Tính lại bảng xếp hạng sản phẩm phổ biến (mặc định mỗi 5 phút, POPULARITY_REFRESH_INTERVAL)."""
+    with SessionLocal() as db:
+        written = popularity.refresh(db)
+    print(f"Cron job: đã tính lại bảng xếp hạng sản phẩm phổ biến ({sum(written.values())} dòng)")
+
+
+# Tác dụng chính: Định nghĩa các job định kỳ (gửi email báo cáo, tính bảng xếp hạng sản phẩm) cho scheduler.
@@ -0,0 +1,281 @@
+# listing.py
+# Read model phi chuẩn hóa cho danh sách sản phẩm (bảng ProductListing, xem
+# models.ProductListing): mỗi sản phẩm 1 dòng gồm các cột của Products + ảnh và
+# category dạng JSON. GET /products/, /categories/{id}/products và
+# /search/products đọc bảng này (PRODUCT_LISTING_ENABLED) thay vì join / tải
+# relationship từ 4 bảng.
+#
+# Cập nhật tăng dần, TRONG CÙNG transaction với lần ghi (đọc sau ghi luôn thấy
+# dữ liệu mới, rollback thì read model cũng rollback):
+#   - ORM events: Product / ProductImage / Category mới, bị sửa hoặc bị xóa ->
+#     ghi nhận id các sản phẩm bị ảnh hưởng (category: mọi sản phẩm gắn với nó);
+#   - ghi bằng Core (bulk, ...) -> gọi track(session, ids);
+#   - trước COMMIT của transaction ngoài cùng: tính lại các dòng đó từ bảng nguồn
+#     (DELETE + INSERT theo lô, khóa dòng Products theo thứ tự id để 2 transaction
+#     cùng sửa 1 sản phẩm không ghi đè nhau bằng dữ liệu cũ).
+# Lượt xem (view_counter) cộng thẳng vào cả 2 bảng (add_views_stmt), không tính lại dòng.
+#
+#   python -m listing rebuild        (dựng lại toàn bộ, vd: sau khi nạp dữ liệu bằng SQL)
+#   python -m listing check [--fix]  (so read model với bảng nguồn; exit 1 nếu lệch)
+import argparse
+import sys
+from itertools import chain
+
+from sqlalchemy import case, delete, event, insert, select, update
+from sqlalchemy.orm import Session
+
+from models import Category, Product, ProductImage, ProductListing, product_category_table
+import metrics
+
+LISTING_REFRESHED = metrics.Counter(
+    "product_listing_refreshed_rows_total", "Số dòng read model ProductListing được tính lại", ("kind",)
+)
+
+# Số sản phẩm mỗi lô khi tính lại (giới hạn số tham số của IN (...))
+CHUNK_SIZE = 500
+
+PRODUCT_COLUMNS = ("id", "name", "description", "price", "stock_quantity", "view_count", "thumbnail_url")
+# Trường của mỗi phần tử trong JSON (theo schemas.ProductImage / schemas.CategoryRef)
+IMAGE_FIELDS = ("id", "product_id", "image_url", "status", "renditions")
+CATEGORY_FIELDS = ("id", "name", "parent_id", "image_url")
+
+
+def columns(fields: tuple[str, ...] | None = None, sort: str = "id") -> list:
+    """Cột của ProductListing cho `fields` (None = đủ mọi trường, kể cả images / categories)."""
+    if fields is None:
+        return list(ProductListing.__table__.columns)
+    names = ("id", sort, *fields)
+    return [getattr(ProductListing, name) for name in dict.fromkeys(names)]
+
+
+# ===================================================================
+# --- TÍNH DÒNG TỪ BẢNG NGUỒN ---
+# ===================================================================
+
+def build_rows(conn, ids) -> list[dict]:
+    """Dòng ProductListing của các sản phẩm `ids` (id đã bị xóa thì không có dòng)."""
+    ids = list(ids)
+    product_stmt = (
+        select(*[getattr(Product, name) for name in PRODUCT_COLUMNS])
+        .where(Product.id.in_(ids)).order_by(Product.id)
+    )
+    rows = {row.id: {**row._asdict(), "images": [], "categories": []} for row in conn.execute(product_stmt)}
+    if not rows:
+        return []
+    found = list(rows)
+    image_stmt = (
+        select(*[getattr(ProductImage, name) for name in IMAGE_FIELDS])
+        .where(ProductImage.product_id.in_(found)).order_by(ProductImage.id)
+    )
+    for image in conn.execute(image_stmt):
+        rows[image.product_id]["images"].append(image._asdict())
+    link = product_category_table
+    category_stmt = (
+        select(link.c.product_id, *[getattr(Category, name) for name in CATEGORY_FIELDS])
+        .join(Category, Category.id == link.c.category_id)
+        .where(link.c.product_id.in_(found)).order_by(link.c.product_id, Category.id)
+    )
+    for category in conn.execute(category_stmt):
+        rows[category.product_id]["categories"].append({name: getattr(category, name) for name in CATEGORY_FIELDS})
+    for row in rows.values():
+        row["view_count"] = row["view_count"] or 0
+    return list(rows.values())
+
+
+def _chunks(ids):
+    ids = sorted(ids)
+    for start in range(0, len(ids), CHUNK_SIZE):
+        yield ids[start:start + CHUNK_SIZE]
+
+
+def refresh(conn, ids, kind: str = "incremental") -> int:
+    """Tính lại các dòng của `ids` trên connection / transaction đang mở; trả về số dòng ghi."""
+    written = 0
+    for chunk in _chunks(set(ids)):
+        # khóa các sản phẩm (theo thứ tự id, tránh deadlock) tới hết transaction:
+        # transaction khác cùng tính lại sản phẩm này phải chờ và sẽ đọc dữ liệu mới
+        conn.execute(select(Product.id).where(Product.id.in_(chunk)).order_by(Product.id).with_for_update())
+        rows = build_rows(conn, chunk)
+        conn.execute(delete(ProductListing).where(ProductListing.id.in_(chunk)))
+        if rows:
+            conn.execute(insert(ProductListing), rows)
+        written += len(rows)
+    LISTING_REFRESHED.inc(written, kind=kind)
+    return written
+
+
+def add_views_stmt(counts: dict[int, int]):
+    """Cộng lượt xem vào read model (cùng lô với services._add_product_views_stmt)."""
+    return (
+        update(ProductListing)
+        .where(ProductListing.id.in_(list(counts)))
+        .values(view_count=ProductListing.view_count + case(counts, value=ProductListing.id, else_=0))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _product_ids(conn, model, after: int | None):
+    stmt = select(model.id).order_by(model.id).limit(CHUNK_SIZE)
+    if after is not None:
+        stmt = stmt.where(model.id > after)
+    return conn.execute(stmt).scalars().all()
+
+
+def rebuild(db: Session) -> int:
+    """Dựng lại toàn bộ read model (1 transaction); trả về số dòng."""
+    conn = db.connection()
+    conn.execute(delete(ProductListing))
+    written, after = 0, None
+    while ids := _product_ids(conn, Product, after):
+        rows = build_rows(conn, ids)
+        if rows:
+            conn.execute(insert(ProductListing), rows)
+        written += len(rows)
+        after = ids[-1]
+    db.commit()
+    LISTING_REFRESHED.inc(written, kind="rebuild")
+    return written
+
+
+def ensure_built(db: Session) -> int:
+    """Dựng read model nếu còn trống mà đã có sản phẩm (lần đầu triển khai, nạp dữ liệu ngoài app)."""
+    if db.execute(select(ProductListing.id).limit(1)).first() is not None:
+        return 0
+    if db.execute(select(Product.id).limit(1)).first() is None:
+        return 0
+    return rebuild(db)
+
+
+# ===================================================================
+# --- KIỂM TRA NHẤT QUÁN ---
+# ===================================================================
+
+def check(db: Session, fix: bool = False) -> dict:
+    """
+    So read model với dòng tính lại từ bảng nguồn, theo lô id:
+    {"checked", "missing": [id có sản phẩm nhưng không có dòng], "extra": [dòng
+    của sản phẩm không còn], "stale": [dòng sai nội dung]}. fix=True: tính lại
+    các dòng lệch rồi commit.
+    """
+    conn = db.connection()
+    report = {"checked": 0, "missing": [], "extra": [], "stale": []}
+    after = None
+    while True:
+        # lô theo id sản phẩm; dòng listing đọc trong cùng khoảng id (kể cả dòng thừa)
+        product_ids = _product_ids(conn, Product, after)
+        last = product_ids[-1] if len(product_ids) == CHUNK_SIZE else None
+        stored_stmt = select(*columns())
+        if after is not None:
+            stored_stmt = stored_stmt.where(ProductListing.id > after)
+        if last is not None:
+            stored_stmt = stored_stmt.where(ProductListing.id <= last)
+        stored = {row.id: row._asdict() for row in conn.execute(stored_stmt)}
+        expected = {row["id"]: row for row in build_rows(conn, product_ids)} if product_ids else {}
+        for product_id in sorted(expected.keys() | stored.keys()):
+            report["checked"] += 1
+            if product_id not in stored:
+                report["missing"].append(product_id)
+            elif product_id not in expected:
+                report["extra"].append(product_id)
+            elif stored[product_id] != expected[product_id]:
+                report["stale"].append(product_id)
+        if last is None:
+            break
+        after = last
+    inconsistent = report["missing"] + report["extra"] + report["stale"]
+    if fix and inconsistent:
+        refresh(conn, inconsistent, kind="repair")
+        db.commit()
+    return report
+
+
+# ===================================================================
+# --- GHI NHẬN THAY ĐỔI (ORM events + Core) ---
+# ===================================================================
+
+_PENDING_KEY = "product_listing_changes"
+
+
+def track(session: Session, product_ids):
+    """Đánh dấu các sản phẩm cần tính lại khi commit (dùng cho ghi bằng Core)."""
+    session.info.setdefault(_PENDING_KEY, set()).update(product_ids)
+
+
+@event.listens_for(Session, "before_flush")
+def _before_flush(session, flush_context, instances):
+    # category bị sửa / xóa: lấy sản phẩm gắn với nó TRƯỚC flush (xóa category
+    # là xóa luôn dòng ở bảng trung gian)
+    category_ids = [
+        obj.id for obj in chain(session.dirty, session.deleted)
+        if isinstance(obj, Category) and obj.id is not None
+    ]
+    if category_ids:
+        link = product_category_table
+        stmt = select(link.c.product_id).where(link.c.category_id.in_(category_ids))
+        track(session, session.connection().execute(stmt).scalars())
+
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session, flush_context):
+    ids = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Product) and obj.id is not None:
+            ids.add(obj.id)
+        elif isinstance(obj, ProductImage) and obj.product_id is not None:
+            ids.add(obj.product_id)
+    if ids:
+        track(session, ids)
+
+
+@event.listens_for(Session, "before_commit")
+def _before_commit(session):
+    # RELEASE SAVEPOINT cũng đi qua event này: chỉ tính lại ở commit ngoài cùng
+    if session.in_nested_transaction():
+        return
+    session.flush()   # thay đổi chưa flush cũng phải được ghi nhận (after_flush)
+    ids = session.info.pop(_PENDING_KEY, None)
+    if ids:
+        refresh(session.connection(), ids)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _after_rollback(session, previous_transaction):
+    # rollback SAVEPOINT (vd: bulk chia đôi lô) không hủy các thay đổi của transaction ngoài
+    if not previous_transaction.nested:
+        session.info.pop(_PENDING_KEY, None)
+
+
+# ===================================================================
+# --- DÒNG LỆNH ---
+# ===================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Read model ProductListing")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("rebuild", help="dựng lại toàn bộ từ bảng nguồn")
+    check_parser = commands.add_parser("check", help="so với bảng nguồn, exit 1 nếu lệch")
+    check_parser.add_argument("--fix", action="store_true", help="tính lại các dòng lệch")
+    args = parser.parse_args()
+
+    from db import SessionLocal, create_table
+    create_table()
+    with SessionLocal() as db:
+        if args.command == "rebuild":
+            print(f"Đã dựng lại {rebuild(db)} dòng ProductListing")
+            return
+        report = check(db, fix=args.fix)
+    problems = {key: report[key] for key in ("missing", "extra", "stale") if report[key]}
+    print(f"Đã kiểm tra {report['checked']} sản phẩm")
+    for key, ids in problems.items():
+        shown = ", ".join(map(str, ids[:20])) + (" ..." if len(ids) > 20 else "")
+        print(f"  {key}: {len(ids)} ({shown})")
+    if problems and args.fix:
+        print("Đã tính lại các dòng lệch")
+    sys.exit(1 if problems and not args.fix else 0)
+
+
+if __name__ == "__main__":
+    main()
+
+
+# Tác dụng chính: Duy trì bảng ProductListing (read model 1 dòng / sản phẩm) trong cùng transaction với các lần ghi.
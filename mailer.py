@@ -0,0 +1,341 @@
+# mailer.py
+# Gửi email hàng loạt chạy NỀN, thay cho FastMail (mở 1 phiên SMTP mới cho
+# mỗi email và đọc / biên dịch lại template mỗi lần chạy).
+#
+#   mailer.send_template("cron_email.html", subject, recipients, **context)
+#       -> render template 1 lần (đã biên dịch sẵn, bytecode cache của Jinja)
+#       -> header chung + body mã hóa 1 lần; mỗi người nhận chỉ thêm
+#          To / Message-ID (dựng EmailMessage tốn ~2-3 ms / email) -> hàng đợi
+#          (chờ nếu hàng đợi đầy)
+#   worker (MAIL_POOL_SIZE task):
+#       -> lấy tối đa MAIL_BATCH_SIZE email, gửi tất cả qua 1 connection SMTP
+#          lấy từ pool (không EHLO / STARTTLS / AUTH lại cho mỗi email)
+#       -> lỗi tạm thời (4xx, mất kết nối): gửi lại sau, backoff lũy thừa
+#          có jitter, tối đa MAIL_MAX_RETRIES lần; lỗi 5xx: bỏ
+#
+# Hàng đợi nằm trong bộ nhớ của worker: email chưa gửi khi tắt ứng dụng
+# (quá MAIL_SHUTDOWN_TIMEOUT) sẽ mất. Kiểm thử local: smtp_sink.py.
+import asyncio
+import base64
+import email.policy
+import random
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from email.message import EmailMessage
+from email.utils import formataddr, formatdate, make_msgid
+from typing import Iterable
+
+import aiosmtplib
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
+
+from config import settings
+import metrics
+
+MAIL_MESSAGES = metrics.Counter("mail_messages_total", "Số email đã xử lý", ("result",))
+MAIL_CONNECTIONS = metrics.Counter("mail_smtp_connections_total", "Số phiên SMTP đã mở")
+MAIL_BATCH_SECONDS = metrics.Histogram("mail_batch_duration_seconds", "Thời gian gửi 1 lô email")
+MAIL_BACKLOG = metrics.Gauge(
+    "mail_backlog", "Số email đang chờ / đang gửi / chờ gửi lại",
+    callback=lambda: {(): mailer.backlog()},
+)
+
+# Đọc template mỗi lần render chỉ khi MAIL_TEMPLATE_AUTO_RELOAD (phát triển);
+# bytecode cache giúp worker mới khởi động không phải biên dịch lại.
+templates = Environment(
+    loader=FileSystemLoader(settings.MAIL_TEMPLATE_FOLDER),
+    bytecode_cache=FileSystemBytecodeCache(settings.MAIL_TEMPLATE_CACHE_DIR),
+    auto_reload=settings.MAIL_TEMPLATE_AUTO_RELOAD,
+    autoescape=select_autoescape(["html"]),
+)
+
+# make_msgid() mặc định gọi socket.getfqdn() (có thể tra DNS) cho mỗi email
+_MSGID_DOMAIN = settings.MAIL_FROM.rsplit("@", 1)[-1]
+
+
+def precompile_templates() -> int:
+    """Biên dịch trước mọi template (gọi lúc khởi động); trả về số template."""
+    names = templates.list_templates()
+    for name in names:
+        templates.get_template(name)
+    return len(names)
+
+
+def render(template_name: str, **context) -> str:
+    return templates.get_template(template_name).render(**context)
+
+
+def shared_headers(subject: str) -> bytes:
+    """Header chung của 1 đợt gửi (From, Subject, Date, MIME), mã hóa 1 lần; kết thúc bằng dòng trống."""
+    message = EmailMessage(policy=email.policy.SMTP)
+    message["From"] = formataddr((settings.MAIL_FROM_NAME, settings.MAIL_FROM))
+    message["Subject"] = subject
+    message["Date"] = formatdate(localtime=True)
+    message["MIME-Version"] = "1.0"
+    message["Content-Type"] = 'text/html; charset="utf-8"'
+    message["Content-Transfer-Encoding"] = "base64"
+    return message.as_bytes()
+
+
+def encode_body(html: str) -> bytes:
+    return base64.encodebytes(html.encode()).replace(b"\n", b"\r\n")
+
+
+def compose(to: str, headers: bytes, body: bytes) -> bytes:
+    """Email hoàn chỉnh cho 1 người nhận: chỉ To / Message-ID là riêng."""
+    if to.isascii():
+        recipient = f"To: {to}\r\n".encode()
+    else:   # địa chỉ quốc tế hóa: để thư viện email mã hóa header
+        message = EmailMessage(policy=email.policy.SMTPUTF8)
+        message["To"] = to
+        recipient = message.as_bytes()[:-2]
+    return recipient + f"Message-ID: {make_msgid(domain=_MSGID_DOMAIN)}\r\n".encode() + headers + body
+
+
+def _response_code(error: Exception) -> int | None:
+    """Mã SMTP của lỗi do server trả lời (None: lỗi kết nối / timeout)."""
+    if isinstance(error, aiosmtplib.SMTPRecipientsRefused):
+        return max((refused.code for refused in error.recipients), default=None)
+    return getattr(error, "code", None) if isinstance(error, aiosmtplib.SMTPResponseException) else None
+
+
+# ===================================================================
+# --- CONNECTION POOL ---
+# ===================================================================
+
+class _Connection:
+    __slots__ = ("client", "sent", "last_used")
+
+    def __init__(self, client: aiosmtplib.SMTP):
+        self.client = client
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+
+class SMTPPool:
+    """Tối đa MAIL_POOL_SIZE phiên SMTP đã đăng nhập, dùng lại giữa các lô."""
+
+    def __init__(self):
+        self._idle: list[_Connection] = []
+        self._semaphore: asyncio.Semaphore | None = None
+
+    async def _open(self) -> _Connection:
+        client = aiosmtplib.SMTP(
+            hostname=settings.MAIL_SERVER,
+            port=settings.MAIL_PORT,
+            use_tls=settings.MAIL_SSL_TLS,
+            start_tls=settings.MAIL_STARTTLS and not settings.MAIL_SSL_TLS,
+            validate_certs=settings.MAIL_VALIDATE_CERTS,
+            timeout=settings.MAIL_TIMEOUT,
+        )
+        await client.connect()
+        if settings.MAIL_USE_CREDENTIALS:
+            await client.login(settings.MAIL_USERNAME, settings.MAIL_PASSWORD.get_secret_value())
+        MAIL_CONNECTIONS.inc()
+        return _Connection(client)
+
+    @staticmethod
+    async def _close(conn: _Connection):
+        try:
+            await asyncio.wait_for(conn.client.quit(), timeout=5)
+        except Exception:
+            conn.client.close()
+
+    def _take_idle(self) -> _Connection | None:
+        now = time.monotonic()
+        while self._idle:
+            conn = self._idle.pop()
+            # server thường tự ngắt phiên rảnh sau vài phút: không dùng lại
+            if conn.client.is_connected and now - conn.last_used < settings.MAIL_CONNECTION_IDLE_TIMEOUT:
+                return conn
+            conn.client.close()
+        return None
+
+    @asynccontextmanager
+    async def connection(self):
+        """Mượn 1 connection; lỗi trong khối -> connection bị đóng, không trả về pool."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(settings.MAIL_POOL_SIZE)
+        async with self._semaphore:
+            conn = self._take_idle() or await self._open()
+            try:
+                yield conn
+            except BaseException:
+                conn.client.close()
+                raise
+            conn.last_used = time.monotonic()
+            if conn.sent >= settings.MAIL_MAX_MESSAGES_PER_CONNECTION or not conn.client.is_connected:
+                await self._close(conn)
+            else:
+                self._idle.append(conn)
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            await self._close(conn)
+        self._semaphore = None
+
+
+# ===================================================================
+# --- HÀNG ĐỢI + WORKER ---
+# ===================================================================
+
+@dataclass
+class OutgoingEmail:
+    to: str
+    data: bytes          # email đã serialize (CRLF), gửi nguyên văn
+    attempts: int = 0
+
+
+class Mailer:
+    def __init__(self):
+        self.pool = SMTPPool()
+        self._queue: asyncio.Queue | None = None
+        self._workers: list[asyncio.Task] = []
+        self._retries: set[asyncio.Task] = set()
+        self._busy = 0
+
+    def _get_queue(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=settings.MAIL_QUEUE_MAX_SIZE)
+        return self._queue
+
+    def backlog(self) -> int:
+        return (self._queue.qsize() if self._queue is not None else 0) + self._busy + len(self._retries)
+
+    # --- Phía gọi (cron job, endpoint...) ---
+
+    async def send(self, message: EmailMessage):
+        """Xếp 1 email vào hàng đợi; hàng đợi đầy -> chờ (không giữ cả danh sách trong bộ nhớ)."""
+        await self._get_queue().put(OutgoingEmail(message["To"], message.as_bytes(policy=email.policy.SMTP)))
+
+    async def send_template(self, template_name: str, subject: str, recipients: Iterable[str], **context) -> int:
+        """Cùng nội dung cho mọi người nhận: render 1 lần, mỗi người 1 email riêng. Trả về số email."""
+        headers, body = shared_headers(subject), encode_body(render(template_name, **context))
+        queue = self._get_queue()
+        count = 0
+        for to in recipients:
+            await queue.put(OutgoingEmail(to, compose(to, headers, body)))
+            count += 1
+        return count
+
+    async def send_personalized(self, template_name: str, subject: str,
+                                recipients: Iterable[tuple[str, dict]], **shared) -> int:
+        """Nội dung riêng cho từng người: recipients là các cặp (email, context riêng)."""
+        template = templates.get_template(template_name)
+        headers = shared_headers(subject)
+        queue = self._get_queue()
+        count = 0
+        for to, context in recipients:
+            body = encode_body(template.render(**shared, **context))
+            await queue.put(OutgoingEmail(to, compose(to, headers, body)))
+            count += 1
+            if count % 500 == 0:
+                await asyncio.sleep(0)   # nhường event loop khi render hàng chục nghìn email
+        return count
+
+    # --- Worker ---
+
+    def _failed(self, item: OutgoingEmail, error: Exception, permanent: bool):
+        item.attempts += 1
+        if permanent or item.attempts > settings.MAIL_MAX_RETRIES:
+            MAIL_MESSAGES.inc(result="failed")
+            print(f"Không gửi được email tới {item.to} sau {item.attempts} lần: {error}")
+            return
+        MAIL_MESSAGES.inc(result="retried")
+        delay = min(settings.MAIL_RETRY_BASE_DELAY * 2 ** (item.attempts - 1), settings.MAIL_RETRY_MAX_DELAY)
+        task = asyncio.create_task(self._retry_later(item, random.uniform(delay / 2, delay)))
+        self._retries.add(task)
+        task.add_done_callback(self._retries.discard)
+
+    async def _retry_later(self, item: OutgoingEmail, delay: float):
+        await asyncio.sleep(delay)
+        await self._get_queue().put(item)
+
+    async def send_batch(self, batch: list[OutgoingEmail]):
+        """Gửi cả lô qua 1 connection; lỗi kết nối -> phần còn lại của lô được gửi lại sau."""
+        pending = list(batch)
+        start = time.perf_counter()
+        try:
+            async with self.pool.connection() as conn:
+                while pending:
+                    item = pending.pop(0)
+                    try:
+                        await conn.client.sendmail(settings.MAIL_FROM, [item.to], item.data)
+                    except (aiosmtplib.SMTPRecipientsRefused, aiosmtplib.SMTPResponseException) as e:
+                        code = _response_code(e)
+                        self._failed(item, e, permanent=code is not None and code >= 500)
+                        if code == 421:   # server sắp đóng phiên
+                            raise
+                        await conn.client.rset()
+                        continue
+                    except BaseException:
+                        pending.insert(0, item)
+                        raise
+                    conn.sent += 1
+                    MAIL_MESSAGES.inc(result="sent")
+        except Exception as e:
+            for item in pending:
+                self._failed(item, e, permanent=False)
+        finally:
+            MAIL_BATCH_SECONDS.observe(time.perf_counter() - start)
+
+    async def _run(self):
+        queue = self._get_queue()
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < settings.MAIL_BATCH_SIZE and not queue.empty():
+                batch.append(queue.get_nowait())
+            self._busy += len(batch)
+            try:
+                await self.send_batch(batch)
+            except Exception as e:
+                print(f"Lỗi khi gửi lô {len(batch)} email: {e}")
+            finally:
+                self._busy -= len(batch)
+                for _ in batch:
+                    queue.task_done()
+
+    # --- Vòng đời (khởi động / dừng trong lifespan) ---
+
+    async def start(self, precompile: bool = True):
+        if precompile:
+            compiled = precompile_templates()
+            print(f"Đã biên dịch {compiled} email template")
+        self._queue = asyncio.Queue(maxsize=settings.MAIL_QUEUE_MAX_SIZE)
+        self._workers = [asyncio.create_task(self._run()) for _ in range(settings.MAIL_POOL_SIZE)]
+
+    async def join(self):
+        """Chờ đến khi mọi email đã xếp hàng (kể cả đang chờ gửi lại) được xử lý xong."""
+        while self.backlog():
+            await self._get_queue().join()
+            if self._retries:
+                await asyncio.wait(set(self._retries))
+
+    async def stop(self):
+        """Chờ gửi nốt hàng đợi (tối đa MAIL_SHUTDOWN_TIMEOUT giây), dừng worker, đóng các phiên SMTP."""
+        if self._queue is not None and self._workers:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=settings.MAIL_SHUTDOWN_TIMEOUT)
+            except asyncio.TimeoutError:
+                pass
+        if self.backlog():
+            print(f"Bỏ {self.backlog()} email chưa gửi khi tắt ứng dụng")
+        for task in [*self._workers, *self._retries]:
+            task.cancel()
+        for task in [*self._workers, *self._retries]:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._workers = []
+        self._retries = set()
+        self._queue = None
+        self._busy = 0
+        await self.pool.close()
+
+
+mailer = Mailer()
+
+
+# Tác dụng chính: Gửi email hàng loạt qua pool kết nối SMTP, theo lô, có retry và template biên dịch sẵn.
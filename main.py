@@ -4,77 +4,40 @@
 from fastapi.security import OAuth2PasswordRequestForm # Thêm class này
 from datetime import timedelta # Thêm timedelta
 import services, models, schemas, auth # <-- Thêm auth
-from db import get_db, engine, create_table
+import async_services
+from db import get_session, engine, create_table, SessionLocal
 
-from apscheduler.schedulers.asyncio import AsyncIOScheduler  # <--- SỬA DÒNG NÀY
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from contextlib import asynccontextmanager
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from pydantic import EmailStr
 from config import settings # <-- Import cấu hình
-from jinja2 import Environment, FileSystemLoader # <-- Import Jinja2
-import datetime
 
-from fastapi import FastAPI, Depends, HTTPException, status, File, UploadFile # Thêm File, UploadFile
-from fastapi.staticfiles import StaticFiles # Thêm StaticFiles
+from fastapi import FastAPI, Depends, HTTPException, status, File, UploadFile, Query, Request # Thêm File, UploadFile
+from typing import Literal
 from fastapi.responses import JSONResponse # Thêm JSONResponse (tùy chọn)
-
-
-# --- Cấu hình Scheduler ---
-# DÒNG SỬA 2: Thay thế tên class
-scheduler = AsyncIOScheduler() # <--- SỬA DÒNG NÀY
-
-# --- Cấu hình Jinja2 ---
-# Chỉ định thư mục chứa template
-env = Environment(loader=FileSystemLoader("templates"))
-
-# --- Cấu hình FastAPI-Mail ---
-conf = ConnectionConfig(
-    MAIL_USERNAME=settings.MAIL_USERNAME,
-    MAIL_PASSWORD=settings.MAIL_PASSWORD.get_secret_value(), # Lấy giá trị bí mật
-    MAIL_FROM=settings.MAIL_FROM,
-    MAIL_PORT=settings.MAIL_PORT,
-    MAIL_SERVER=settings.MAIL_SERVER,
-    MAIL_FROM_NAME=settings.MAIL_FROM_NAME,
-    MAIL_STARTTLS=settings.MAIL_STARTTLS,
-    MAIL_SSL_TLS=settings.MAIL_SSL_TLS,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER='./templates' # Chỉ định thư mục template cho fastapi-mail (nếu cần)
-)
-
-fm = FastMail(conf)
-
-# --- Hàm Cron Job ---
-async def send_email_cron():
-    """
-    Hàm này sẽ được thực thi mỗi phút bởi scheduler.
-    """
-    print(f"Cron job running: Đang gửi email... lúc {datetime.datetime.now()}")
-    
-    # Lấy template
-    template = env.get_template("cron_email.html")
-    
-    # Render template với dữ liệu
-    html_body = template.render(
-        time=datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    )
-    
-    # Người nhận (bạn có thể thay đổi)
-    recipients: list[EmailStr] = ["hungmanh2607uitvnu@gmail.com"]
-
-    message = MessageSchema(
-        subject="Báo cáo Cron Job Tự Động (Mỗi 1 phút)",
-        recipients=recipients,
-        body=html_body,
-        subtype=MessageType.html
-    )
-
-    try:
-        await fm.send_message(message)
-        print("-> Email đã được gửi thành công!")
-    except Exception as e:
-        print(f"-> Lỗi khi gửi email: {e}")
+from fastapi.responses import PlainTextResponse
+import metrics
+import db as database
+from view_counter import view_counter
+import cache
+import image_io
+import password_hasher
+import tokens
+import bulk
+import export
+import search
+import listing
+import popularity
+import filters
+import instrumentation
+from media import MediaFiles
+from image_pipeline import pipeline as image_pipeline
+from mailer import mailer
+from job_scheduler import job_scheduler
+
+
+# Kiểu session do get_session trả về (tùy settings.USE_ASYNC_DB)
+DBSession = Session | AsyncSession
 
 # --- Quản lý vòng đời (Lifespan) của ứng dụng ---
 @asynccontextmanager
@@ -82,47 +45,89 @@ async def lifespan(app: FastAPI):
     # Khởi tạo bảng
     print("Khởi tạo bảng cơ sở dữ liệu...")
     create_table()
+
+    # Cột tsvector + index GIN cho tìm kiếm (Postgres), bỏ index B-tree cũ
+    search.ensure_schema(engine)
+
+    # Bổ sung materialized path cho các category cũ (nếu có)
+    with SessionLocal() as db:
+        fixed = services.rebuild_category_paths(db)
+        if fixed:
+            print(f"Đã cập nhật path cho {fixed} category")
+        # Read model danh sách sản phẩm: dựng lần đầu nếu còn trống (xem listing.py)
+        built = listing.ensure_built(db)
+        if built:
+            print(f"Đã dựng read model ProductListing ({built} sản phẩm)")
     
-    # Lên lịch cho cron job
-    # print("Thêm cron job 'send_email_cron' chạy mỗi phút...")
-    # scheduler.add_job(send_email_cron, "interval", minutes=1)
-    
-    # # Khởi động scheduler
-    # print("Khởi động scheduler...")
-    # scheduler.start()
+
+    # Vòng lặp nền ghi lượt xem sản phẩm theo lô
+    view_counter.start()
+
+    # Worker tạo rendition ảnh (xếp hàng lại các ảnh còn pending)
+    await image_pipeline.start()
+
+    # Worker gửi email (biên dịch sẵn template, pool kết nối SMTP)
+    await mailer.start()
+
+    # Job định kỳ (jobs.py) theo SCHEDULER_MODE; "cluster": chỉ worker giữ lease chạy job
+    await job_scheduler.start()
 
     yield # Ứng dụng chạy ở đây
 
-    # Tắt scheduler khi ứng dụng dừng
-    print("Tắt scheduler...")
-    scheduler.shutdown()
+    # Ghi nốt các lượt xem còn trong bộ nhớ trước khi tắt
+    await view_counter.stop()
+
+    # Dừng worker ảnh rồi đóng process pool xử lý ảnh
+    await image_pipeline.stop()
+    image_io.shutdown()
+    password_hasher.shutdown()
+
+    # Tắt scheduler khi ứng dụng dừng (trả lease cho worker khác nếu đang là leader)
+    await job_scheduler.stop()
+
+    # Gửi nốt email trong hàng đợi rồi đóng các phiên SMTP
+    await mailer.stop()
 
 # Khởi tạo ứng dụng FastAPI với lifespan
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, debug=settings.DEBUG)
+
+# Đo độ trễ / số câu SQL / kích thước response của mỗi request (xem instrumentation.py)
+instrumentation.instrument_engine(engine, "sync")
+instrumentation.instrument_engine(database.async_engine.sync_engine, "async")
+app.add_middleware(instrumentation.InstrumentationMiddleware)
+
+# Ảnh upload (static/images/...): ETag, Cache-Control immutable, Range, WebP/AVIF (xem media.py)
+app.mount("/static", MediaFiles(directory="static"), name="static")
 
 # --- THÊM CÁC ENDPOINT XÁC THỰC ---
+# Tất cả endpoint đều là `async def`; truy cập DB đi qua async_services.dispatch
+# nên ở chế độ sync (psycopg2) việc truy vấn vẫn chạy trong threadpool,
+# còn ở chế độ async (asyncpg) thì không chiếm worker thread nào.
 
 @app.post("/signup", response_model=schemas.User, status_code=status.HTTP_201_CREATED)
-def signup_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+async def signup_user(user: schemas.UserCreate, db: DBSession = Depends(get_session)):
     """
     Endpoint để đăng ký user mới.
     """
     # Kiểm tra xem user đã tồn tại chưa
-    db_user = services.get_user_by_email(db, email=user.email)
+    db_user = await async_services.dispatch(db, "get_user_by_email", email=user.email)
     if db_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
     
-    # Tạo user mới
-    return services.create_user(db=db, user=user)
+    # Băm mật khẩu trong process pool riêng (503 nếu quá tải), rồi tạo user mới
+    hashed_password = await password_hasher.hash_password(user.password)
+    return await async_services.dispatch(
+        db, "create_user", user=user, hashed_password=hashed_password, schema=schemas.User
+    )
 
 
 @app.post("/signin", response_model=schemas.Token)
-def signin_for_access_token(
+async def signin_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(), 
-    db: Session = Depends(get_db)
+    db: DBSession = Depends(get_session)
 ):
     """
     Endpoint để đăng nhập, nhận về Access Token.
@@ -130,15 +135,23 @@ def signin_for_access_token(
     """
     
     # 1. Lấy user từ DB (form_data.username chính là email)
-    user = services.get_user_by_email(db, email=form_data.username)
+    user = await async_services.dispatch(db, "get_user_by_email", email=form_data.username)
     
     # 2. Kiểm tra user có tồn tại VÀ mật khẩu có đúng không
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+    #    (bcrypt chạy trong process pool riêng, không chiếm threadpool)
+    verified, new_hash = False, None
+    if user:
+        verified, new_hash = await password_hasher.verify_password(form_data.password, user.hashed_password)
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+
+    # Tham số bcrypt đã thay đổi -> lưu lại hash mới (rehash-on-login)
+    if new_hash:
+        await async_services.dispatch(db, "update_password_hash", user.id, new_hash)
         
     # 3. Tạo Access Token
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -148,12 +161,42 @@ def signin_for_access_token(
         expires_delta=access_token_expires
     )
     
-    # 4. Trả về token
-    return {"access_token": access_token, "token_type": "bearer"}
+    # 4. Trả về token (kèm refresh token để lấy access token mới qua /token/refresh)
+    refresh_token = auth.create_refresh_token(user.email, new_hash or user.hashed_password)
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+
+@app.post("/token/refresh", response_model=schemas.Token)
+async def refresh_access_token(body: schemas.RefreshRequest, db: DBSession = Depends(get_session)):
+    """
+    Đổi refresh token lấy access token mới (và refresh token mới) mà không cần
+    kiểm tra lại mật khẩu (không tốn bcrypt). Refresh token mất hiệu lực khi
+    user đổi mật khẩu hoặc bị xóa.
+    """
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    try:
+        claims = tokens.decode(body.refresh_token, "refresh", use_cache=False)
+    except tokens.TokenError:
+        raise credentials_exception
+
+    user = await async_services.dispatch(db, "get_user_by_email", email=claims.get("sub"))
+    if not user or claims.get("pwd") != tokens.password_fingerprint(user.hashed_password):
+        raise credentials_exception
+
+    access_token = auth.create_access_token(
+        data={"sub": user.email},
+        expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    refresh_token = auth.create_refresh_token(user.email, user.hashed_password)
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
 
 
 @app.get("/users/me", response_model=schemas.User)
-def read_users_me(current_user: models.User = Depends(auth.get_current_user)):
+async def read_users_me(current_user: schemas.User = Depends(auth.get_current_user)):
     """
     Một endpoint được bảo vệ. 
     Chỉ user đã đăng nhập (cung cấp token hợp lệ) mới truy cập được.
@@ -162,114 +205,187 @@ def read_users_me(current_user: models.User = Depends(auth.get_current_user)):
 
 # --- CÁC API ENDPOINT CỦA BẠN (giữ nguyên) ---
 
-@app.get("/books/",  response_model=list[schemas.Book])
-def get_all_books(db: Session = Depends(get_db)):
-    return services.get_all_book(db)
+@app.get("/books/",  response_model=schemas.Page[schemas.Book])
+async def get_all_books(request: Request,
+                        db: DBSession = Depends(get_session),
+                        cursor: str | None = None,
+                        limit: int = Query(50, ge=1, le=500),
+                        sort: Literal["id", "year"] = "id",
+                        order: Literal["asc", "desc"] = "asc",
+                        with_total: bool = False
+                        ):
+    """
+    Lấy sách theo trang (cursor).
+    - /books/                      (trang đầu)
+    - /books/?cursor=<next_cursor> (trang tiếp theo)
+    """
+    async def load():
+        page = await async_services.dispatch(
+            db, "get_all_book", limit=limit, cursor=cursor, sort=sort, order=order,
+            schema=schemas.Page[schemas.Book]
+        )
+        if with_total:
+            page.total_estimate = await async_services.dispatch(db, "estimate_total", models.Book.__tablename__)
+        return page
+
+    return await cache.cached_response(
+        request, "books", ("books",), settings.CACHE_TTL_BOOKS, schemas.Page[schemas.Book], load
+    )
 
 
 
 @app.get("/books/{id}", response_model=schemas.Book)
-def get_book_by_id(id: int, db: Session = Depends(get_db)):
-    book_queryset = services.get_book(db, id)
-    if book_queryset:
-        return book_queryset
+async def get_book_by_id(id: int, request: Request, db: DBSession = Depends(get_session)):
+    response = await cache.cached_response(
+        request, "book", ("books",), settings.CACHE_TTL_BOOKS, schemas.Book,
+        lambda: async_services.dispatch(db, "get_book", id, schema=schemas.Book)
+    )
+    if response:
+        return response
     raise HTTPException(status_code=404, detail="id sach ko hop le")
 
 
 @app.post("/books/", response_model=schemas.Book)
-def create_new_book(book: schemas.BookCreate, 
-                    db: Session=Depends(get_db), 
-                    current_user: models.User = Depends(auth.get_current_user)
+async def create_new_book(book: schemas.BookCreate, 
+                    db: DBSession=Depends(get_session), 
+                    current_user: schemas.User = Depends(auth.get_current_user)
                     ):
     # Dòng code bên dưới chỉ chạy nếu 'get_current_user' thành công
     print(f"User {current_user.email} đang tạo sách...")
-    return services.create_book(db, book)
+    return await async_services.dispatch(db, "create_book", book, schema=schemas.Book)
 
 @app.put("/books/{id}", response_model=schemas.Book)
-def update_book(book: schemas.BookCreate, 
+async def update_book(book: schemas.BookCreate, 
                 id: int, 
-                db: Session= Depends(get_db), 
-                current_user: models.User = Depends(auth.get_current_user)
+                db: DBSession= Depends(get_session), 
+                current_user: schemas.User = Depends(auth.get_current_user)
                 ):
-    db_update = services.update_book(db, book, id)
+    db_update = await async_services.dispatch(db, "update_book", book, id, schema=schemas.Book)
     if not db_update:
         raise HTTPException(status_code=404, detail="book not found")
     return db_update
 
 @app.delete("/books/{id}", response_model=schemas.Book)
-def delete_book(id: int, 
-                db: Session=Depends(get_db), 
-                current_user: models.User = Depends(auth.get_current_user) # <-- Bảo vệ
+async def delete_book(id: int, 
+                db: DBSession=Depends(get_session), 
+                current_user: schemas.User = Depends(auth.get_current_user) # <-- Bảo vệ
                 ):
     """this api for delete a book with its id"""
-    delete_entry = services.delete_book(db, id)
+    delete_entry = await async_services.dispatch(db, "delete_book", id, schema=schemas.Book)
     if delete_entry:
         return delete_entry
     raise HTTPException(status_code=404, detail="Book not found")
 
 # ====================CATEGORY=================
-@app.get("/categories/", response_model=list[schemas.Category])
-def get_all_categories(db: Session= Depends(get_db)):
-    return services.get_root_category(db)
-
-@app.get("/categories/{id}", response_model=schemas.Category)
-def get_category_by_id(id: int, db: Session=Depends(get_db)):
-    category_queryset = services.get_category(db, id)
-    if category_queryset:
-        return category_queryset
+@app.get("/categories/", response_model=list[schemas.Category] | list[schemas.CategorySummary])
+async def get_all_categories(request: Request, db: DBSession= Depends(get_session),
+                             view: Literal["summary", "detail"] = "detail"):
+    """
+    Cây category.
+    - /categories/?view=summary   (chỉ cây id/name/parent_id/image_url, không kèm products)
+    """
+    schema = list[schemas.CategorySummary] if view == "summary" else list[schemas.Category]
+    return await cache.cached_response(
+        request, "categories", ("categories",), settings.CACHE_TTL_CATEGORIES, schema,
+        lambda: async_services.dispatch(db, "get_root_categories", view=view, schema=schema)
+    )
+
+@app.get("/categories/{id}", response_model=schemas.Category | schemas.CategorySummary)
+async def get_category_by_id(id: int, request: Request, db: DBSession=Depends(get_session),
+                             view: Literal["summary", "detail"] = "detail"):
+    schema = schemas.CategorySummary if view == "summary" else schemas.Category
+    response = await cache.cached_response(
+        request, "category", ("categories",), settings.CACHE_TTL_CATEGORIES, schema,
+        lambda: async_services.dispatch(db, "get_category_tree", id, view=view, schema=schema)
+    )
+    if response:
+        return response
     raise HTTPException(status_code=404, detail='category ko hop le')
 
 @app.post("/categories/", response_model=schemas.Category)
-def create_new_category(category: schemas.CategoryCreate,
-                        db: Session=Depends(get_db),
+async def create_new_category(category: schemas.CategoryCreate,
+                        db: DBSession=Depends(get_session),
                         current_user: models.Category=Depends(auth.get_current_user)
                         ):
     print(f"user {current_user} is creating new category...")
-    return services.create_category(db, category)
+    return await async_services.dispatch(db, "create_category", category, schema=schemas.Category)
 
 @app.put("/categories/{id}", response_model= schemas.Category)
-def update_category(category: schemas.CategoryCreate,
+async def update_category(category: schemas.CategoryCreate,
                     id: int,
-                    db: Session = Depends(get_db),
-                    current_user: models.User = Depends(auth.get_current_user)
+                    db: DBSession = Depends(get_session),
+                    current_user: schemas.User = Depends(auth.get_current_user)
                     ):
-    db_update = services.update_category(db, category, id)
+    db_update = await async_services.dispatch(db, "update_category", category, id, schema=schemas.Category)
     if not db_update:
         raise HTTPException(status_code=404, detail="category not found")
     return db_update
         
 @app.delete("/categories/{id}", response_model=schemas.Category)
-def delete_category(id: int,
-                    db: Session=Depends(get_db),
-                    current_user: models.User = Depends(auth.get_current_user)
+async def delete_category(id: int,
+                    db: DBSession=Depends(get_session),
+                    current_user: schemas.User = Depends(auth.get_current_user)
                     ):
-    delete_entry = services.delete_category(db, id)
+    delete_entry = await async_services.dispatch(db, "delete_category", id, schema=schemas.Category)
     if delete_entry:
         return delete_entry
     raise HTTPException(status_code=404, detail="category not found")
 
+@app.get("/categories/{id}/ancestors", response_model=list[schemas.CategoryRef])
+async def get_category_ancestors(id: int, db: DBSession = Depends(get_session)):
+    """
+    Breadcrumb của một category: các tổ tiên từ gốc xuống tới chính nó.
+    """
+    ancestors = await async_services.dispatch(db, "get_category_ancestors", id, schema=list[schemas.CategoryRef])
+    if not ancestors:
+        raise HTTPException(status_code=404, detail="category not found")
+    return ancestors
+
+@app.get("/categories/{id}/products", response_model=list[schemas.Product] | list[schemas.ProductSummary])
+async def get_category_products(id: int,
+                                request: Request,
+                                db: DBSession = Depends(get_session),
+                                skip: int = 0,
+                                limit: int = 10,
+                                view: Literal["summary", "detail"] = "detail"
+                                ):
+    """
+    Tất cả sản phẩm thuộc category này HOẶC các category con cháu của nó.
+    - ?view=summary   (chỉ các trường của ProductSummary, không images / categories)
+    """
+    schema = list[schemas.ProductSummary] if view == "summary" else list[schemas.Product]
+    return await cache.cached_response(
+        request, "category_products", ("products", "categories"), settings.CACHE_TTL_PRODUCTS, schema,
+        lambda: async_services.dispatch(
+            db, "get_category_products", id, skip=skip, limit=limit, view=view, schema=schema
+        )
+    )
+
 # --- THÊM ENDPOINT UPLOAD ẢNH CATEGORY ---
 @app.post("/categories/{category_id}/upload-image/", response_model=schemas.Category)
 async def upload_category_image(
     category_id: int,
+    request: Request,
     file: UploadFile = File(...), # Nhận file upload
-    db: Session = Depends(get_db)
-    # current_user: models.User = Depends(auth.get_current_user) # Bật nếu cần xác thực
+    db: DBSession = Depends(get_session)
+    # current_user: schemas.User = Depends(auth.get_current_user) # Bật nếu cần xác thực
 ):
     """
     Upload ảnh cho một Category theo ID.
     """
     try:
-        updated_category = await services.save_category_image(db=db, category_id=category_id, file=file)
+        updated_category = await async_services.dispatch(
+            db, "save_category_image", category_id=category_id, file=file, schema=schemas.Category
+        )
 
-        # Tạo URL đầy đủ cho ảnh để trả về (tùy chọn)
-        # Giả sử server chạy tại http://localhost:8000
-        # Bạn có thể lấy base URL từ request nếu cần linh động hơn
-        base_url = "http://localhost:8000" # Hoặc lấy từ request
-        image_full_url = f"{base_url}/static/{updated_category.image_path}" if updated_category.image_path else None
+        # Tạo URL đầy đủ cho ảnh để trả về (theo host của request, trỏ vào mount /static)
+        image_full_url = (
+            str(request.url_for("static", path=updated_category.image_url))
+            if updated_category.image_url else None
+        )
 
         # Tạo response dictionary thủ công để thêm image_url
-        response_data = schemas.Category.model_validate(updated_category).model_dump()
+        response_data = updated_category.model_dump()
         response_data["image_url"] = image_full_url
 
         return JSONResponse(content=response_data)
@@ -284,57 +400,146 @@ async def upload_category_image(
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"An unexpected error occurred: {e}")
         
         
-# ====================PRODUCT=================
-
 # ====================PRODUCT=================
 
 @app.post("/products/", response_model=schemas.Product)
-def create_new_product(product: schemas.ProductCreate,
-                       db: Session = Depends(get_db),
-                       current_user: models.User = Depends(auth.get_current_user)
+async def create_new_product(product: schemas.ProductCreate,
+                       db: DBSession = Depends(get_session),
+                       current_user: schemas.User = Depends(auth.get_current_user)
                        ):
     """
     Tạo sản phẩm mới và liên kết với các category IDs.
     """
-    return services.create_product(db, product)
+    return await async_services.dispatch(db, "create_product", product, schema=schemas.Product)
+    
+@app.get("/products/", response_model=schemas.Page[schemas.ProductItem])
+async def get_all_products(
+    request: Request,
+    db: DBSession = Depends(get_session),
+    cursor: str | None = None,
+    limit: int = Query(10, ge=1, le=100),
+    sort: Literal["id", "price", "view_count", "newest"] = "id",
+    order: Literal["asc", "desc"] = "asc",
+    with_total: bool = False,
+    category_ids: list[int] | None = Query(None),
+    min_price: int | None = Query(None, ge=0),
+    max_price: int | None = Query(None, ge=0),
+    in_stock: bool | None = None,
+    name_prefix: str | None = Query(None, min_length=1, max_length=100),
+    fields: str | None = None,
+    view: Literal["summary", "detail"] = "detail",
+):
+    """
+    Lấy tất cả sản phẩm (phân trang bằng cursor).
     
-@app.get("/products/", response_model=list[schemas.Product])
-def get_all_products(db: Session = Depends(get_db)):
+    Cách dùng:
+    - /products/                         (Lấy trang 1 - 10 sản phẩm đầu)
+    - /products/?cursor=<next_cursor>    (Lấy trang tiếp theo)
+    - /products/?sort=price&order=desc   (Sắp theo giá giảm dần)
+    - /products/?sort=newest             (Mới tạo nhất trước)
+    - /products/?category_ids=3&category_ids=7&in_stock=true   (Thuộc category 3 hoặc 7, kể cả con cháu)
+    - /products/?min_price=100000&max_price=500000&name_prefix=ip
+    - /products/?fields=name,price,thumbnail_url   (Chỉ trả các trường này + id)
+    - /products/?view=summary            (Bản gọn ProductSummary, không images / categories;
+                                          bị bỏ qua khi có ?fields=)
+    - /products/?with_total=true         (Kèm ước lượng tổng số sản phẩm; bỏ qua khi có bộ lọc)
     """
-    Lấy tất cả sản phẩm.
+    if sort == "newest":
+        # id tăng dần theo thời gian tạo -> mới nhất = id lớn nhất
+        sort, order = "id", "desc"
+    selected = filters.parse_fields(fields)
+    if selected:
+        item_schema = schemas.product_projection(selected)
+    elif view == "summary":
+        selected, item_schema = services.PRODUCT_SUMMARY_FIELDS, schemas.ProductSummary
+    else:
+        item_schema = schemas.Product
+    filter_args = dict(category_ids=category_ids, min_price=min_price, max_price=max_price,
+                       in_stock=in_stock, name_prefix=name_prefix)
+    filtered = any(value is not None for value in filter_args.values())
+
+    async def load():
+        page = await async_services.dispatch(
+            db, "get_all_products", limit=limit, cursor=cursor, sort=sort, order=order, fields=selected,
+            **filter_args, schema=schemas.Page[item_schema]
+        )
+        if with_total and not filtered:
+            page.total_estimate = await async_services.dispatch(db, "estimate_total", models.Product.__tablename__)
+        # view_count = số đã ghi trong DB + số lượt đang chờ ghi
+        if selected is None or "view_count" in selected:
+            view_counter.apply(page.items)
+        return page
+
+    # lọc theo category phụ thuộc cả cây category (đổi cha -> kết quả đổi)
+    namespaces = ("products", "categories") if category_ids else ("products",)
+    return await cache.cached_response(
+        request, "products", namespaces, settings.CACHE_TTL_PRODUCTS, schemas.Page[item_schema], load
+    )
+
+# Khai báo trước /products/{id}: nếu không "popular" bị hiểu là id
+@app.get("/products/popular", response_model=schemas.PopularProducts)
+async def get_popular_products(
+    request: Request,
+    db: DBSession = Depends(get_session),
+    window: popularity.Window = "24h",
+    category_id: int | None = None,
+    limit: int = Query(20, ge=1, le=100),
+):
     """
-    return services.get_all_products(db)
+    Sản phẩm xem nhiều nhất trong khoảng thời gian gần đây.
+
+    - /products/popular?window=24h            (1h | 24h | 7d | 30d)
+    - /products/popular?category_id=3&window=7d   (gồm cả category con cháu)
+
+    Đọc bảng xếp hạng tính sẵn định kỳ (POPULARITY_REFRESH_INTERVAL, xem
+    popularity.py): tối đa POPULARITY_TOP_K sản phẩm, computed_at = lần tính.
+    """
+    async def load():
+        result = await async_services.dispatch(
+            db, "get_popular_products", window, category_id, limit, schema=schemas.PopularProducts
+        )
+        view_counter.apply(result.items)
+        return result
+
+    namespaces = ("products", "categories") if category_id is not None else ("products",)
+    return await cache.cached_response(
+        request, "products_popular", namespaces, settings.CACHE_TTL_PRODUCTS, schemas.PopularProducts, load
+    )
 
 @app.get("/products/{id}", response_model=schemas.Product)
-def get_product_by_id(id: int, db: Session = Depends(get_db)):
+async def get_product_by_id(id: int, request: Request, db: DBSession = Depends(get_session)):
     """
     Lấy một sản phẩm theo ID VÀ TĂNG LƯỢT XEM.
+    (response có thể lấy từ cache; view_count khi đó cũ tối đa CACHE_TTL_PRODUCTS giây)
     """
-    product_queryset = services.get_product(db, id)
-    
-    if not product_queryset:
+    async def load():
+        product = await async_services.dispatch(db, "get_product", id, schema=schemas.Product)
+        if product:
+            # + 1: tính cả lượt xem của chính request này (record ở bên dưới)
+            product.view_count += view_counter.pending(id) + 1
+        return product
+
+    response = await cache.cached_response(
+        request, "product", ("products",), settings.CACHE_TTL_PRODUCTS, schemas.Product, load
+    )
+    if not response:
         raise HTTPException(status_code=404, detail='product ko hop le')
 
-    # --- THÊM LOGIC TĂNG LƯỢT XEM ---
-    # Tăng lượt xem lên 1
-    product_queryset.view_count += 1
-    
-    # Lưu thay đổi vào CSDL
-    db.commit()
-    
-    # Làm mới (refresh) để đảm bảo dữ liệu trả về là mới nhất
-    db.refresh(product_queryset)
+    # --- TĂNG LƯỢT XEM ---
+    # Chỉ tăng bộ đếm trong bộ nhớ; view_counter ghi xuống DB theo lô
+    # (1 câu UPDATE view_count = view_count + n) thay vì commit mỗi lần GET
+    view_counter.record(id)
     # ----------------------------------
     
-    return product_queryset
+    return response
 
 # --- THÊM ENDPOINT MỚI NÀY ---
 @app.post("/products/{product_id}/upload-image/", response_model=schemas.ProductImage)
 async def upload_product_image(
     product_id: int,
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(auth.get_current_user) # Bảo vệ endpoint
+    db: DBSession = Depends(get_session),
+    current_user: schemas.User = Depends(auth.get_current_user) # Bảo vệ endpoint
 ):
     """
     Upload một ảnh cho sản phẩm.
@@ -343,27 +548,157 @@ async def upload_product_image(
     """
     try:
         # Gọi hàm service xử lý tất cả logic
-        return await services.save_product_image(db=db, product_id=product_id, file=file)
+        return await async_services.dispatch(
+            db, "save_product_image", product_id=product_id, file=file, schema=schemas.ProductImage
+        )
     except HTTPException as e:
         raise e
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"An unexpected error occurred: {e}")
-# ... (Endpoint create_new_product và get_product_by_id giữ nguyên) ...
-    
-@app.get("/products/", response_model=list[schemas.Product])
-def get_all_products(
-    db: Session = Depends(get_db),
-    skip: int = 0,  # <-- Thêm dòng này
-    limit: int = 10 # <-- Thêm dòng này
+
+@app.get("/products/{product_id}/images/{image_id}", response_model=schemas.ProductImage)
+async def get_product_image(product_id: int, image_id: int, db: DBSession = Depends(get_session)):
+    """
+    Trạng thái xử lý của một ảnh sản phẩm (pending / ready / failed) + các rendition.
+    Không cache: client poll endpoint này sau khi upload.
+    """
+    image = await async_services.dispatch(
+        db, "get_product_image", product_id, image_id, schema=schemas.ProductImage
+    )
+    if not image:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return image
+
+
+# ====================SEARCH=================
+
+@app.get("/search/products",
+         response_model=schemas.SearchResult[schemas.Product] | schemas.SearchResult[schemas.ProductSummary])
+async def search_products(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    category_id: int | None = None,
+    min_price: int | None = Query(None, ge=0),
+    max_price: int | None = Query(None, ge=0),
+    in_stock: bool | None = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=1000),
+    facets: bool = True,
+    view: Literal["summary", "detail"] = "detail",
+    db: DBSession = Depends(get_session),
 ):
     """
-    Lấy tất cả sản phẩm (có phân trang).
-    
-    Cách dùng:
-    - /products/              (Lấy trang 1 - 10 sản phẩm đầu)
-    - /products/?skip=0&limit=10 (Lấy trang 1)
-    - /products/?skip=10&limit=10 (Lấy trang 2)
-    - /products/?skip=20&limit=10 (Lấy trang 3)
+    Tìm sản phẩm theo từ khóa, xếp theo độ liên quan (từ cuối có thể gõ dở: "điện tho").
+    - /search/products?q=laptop&category_id=3       (cả các category con của 3)
+    - /search/products?q=laptop&min_price=1000000&in_stock=true
+    - /search/products?q=laptop&view=summary        (item là ProductSummary)
+    - facets: số kết quả theo category con, khoảng giá, tình trạng kho
+    """
+    item_schema = schemas.ProductSummary if view == "summary" else schemas.Product
+    schema = schemas.SearchResult[item_schema]
+
+    async def load():
+        result = await async_services.dispatch(
+            db, "search_products", q, category_id=category_id, min_price=min_price, max_price=max_price,
+            in_stock=in_stock, limit=limit, offset=offset, facets=facets, view=view, schema=schema
+        )
+        view_counter.apply(hit.item for hit in result.hits)
+        return result
+
+    return await cache.cached_response(
+        request, "search_products", ("products", "categories"), settings.CACHE_TTL_PRODUCTS, schema, load
+    )
+
+@app.get("/search/books", response_model=schemas.SearchResult[schemas.Book])
+async def search_books(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=1000),
+    db: DBSession = Depends(get_session),
+):
+    """Tìm sách theo tiêu đề / tác giả / mô tả."""
+    schema = schemas.SearchResult[schemas.Book]
+    return await cache.cached_response(
+        request, "search_books", ("books",), settings.CACHE_TTL_BOOKS, schema,
+        lambda: async_services.dispatch(db, "search_books", q, limit=limit, offset=offset, schema=schema)
+    )
+
+
+# ====================EXPORT=================
+
+@app.get("/export/{entity}")
+async def export_catalog(entity: Literal["books", "products"], request: Request,
+                         format: Literal["ndjson", "csv"] = "ndjson",
+                         fields: str | None = None,
+                         gzip: bool | None = None):
+    """
+    Xuất toàn bộ bảng theo stream (bộ nhớ không đổi dù bảng lớn tới đâu).
+    - /export/products?format=csv
+    - /export/products?fields=id,name,price,category_ids
+    - gzip: mặc định nén nếu client gửi Accept-Encoding: gzip; ?gzip=false để tắt
+    """
+    if gzip is None:
+        gzip = "gzip" in request.headers.get("accept-encoding", "")
+    return export.stream_export(entity, format, fields, gzip)
+
+
+# ====================BULK=================
+# Body: JSON array hoặc NDJSON (Content-Type: application/x-ndjson), xem bulk.py
+#   POST   /bulk/products   [{...ProductCreate}, ...]
+#   PUT    /bulk/products   [{"id": 1, ...các trường cần sửa}, ...]
+#   DELETE /bulk/products   [1, 2, 3]  hoặc  [{"id": 1}, ...]
+
+BulkEntity = Literal["books", "products", "categories"]
+BulkTransaction = Literal["batch", "all"]
+
+@app.post("/bulk/{entity}", response_model=schemas.BulkResult)
+async def bulk_create(entity: BulkEntity, request: Request,
+                      transaction: BulkTransaction = settings.BULK_TRANSACTION,
+                      batch_size: int | None = Query(None, ge=1, le=10000),
+                      db: DBSession = Depends(get_session),
+                      current_user: schemas.User = Depends(auth.get_current_user)):
+    """Tạo hàng loạt (INSERT theo lô, trả về id theo đúng thứ tự item)."""
+    return await bulk.run(db, request, entity, "create", transaction, batch_size)
+
+@app.put("/bulk/{entity}", response_model=schemas.BulkResult)
+async def bulk_update(entity: BulkEntity, request: Request,
+                      transaction: BulkTransaction = settings.BULK_TRANSACTION,
+                      batch_size: int | None = Query(None, ge=1, le=10000),
+                      db: DBSession = Depends(get_session),
+                      current_user: schemas.User = Depends(auth.get_current_user)):
+    """Cập nhật hàng loạt theo id."""
+    return await bulk.run(db, request, entity, "update", transaction, batch_size)
+
+@app.delete("/bulk/{entity}", response_model=schemas.BulkResult)
+async def bulk_delete(entity: BulkEntity, request: Request,
+                      transaction: BulkTransaction = settings.BULK_TRANSACTION,
+                      batch_size: int | None = Query(None, ge=1, le=10000),
+                      db: DBSession = Depends(get_session),
+                      current_user: schemas.User = Depends(auth.get_current_user)):
+    """Xóa hàng loạt theo id."""
+    return await bulk.run(db, request, entity, "delete", transaction, batch_size)
+
+
+
+# ====================METRICS=================
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics():
     """
-    # Sửa lại dòng này
-    return services.get_all_products(db, skip=skip, limit=limit)
+    Số liệu theo định dạng Prometheus: trạng thái pool (checked out, overflow),
+    thời gian chờ checkout và thời gian sống của session mỗi request; độ trễ,
+    số câu / thời gian SQL, số dòng và kích thước response theo route
+    (instrumentation.py).
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/metrics/db", include_in_schema=False)
+async def get_db_pool_status():
+    """Trạng thái pool dạng JSON (tiện xem nhanh khi debug)."""
+    return database.pool_status()
+
+@app.get("/metrics/cache", include_in_schema=False)
+async def get_cache_stats():
+    """Hit / miss / eviction của cache response."""
+    return cache.stats()
@@ -0,0 +1,145 @@
+# media.py
+# Phục vụ file tĩnh (ảnh upload) tại /static với header cache phù hợp.
+#
+# - ETag mạnh: với tên file ngẫu nhiên (secrets.token_hex, 32 ký tự hex) thì
+#   nội dung không bao giờ đổi -> ETag lấy từ TÊN + kích thước, giống nhau trên
+#   mọi server. File khác (vd: ảnh category ghi đè cùng tên) -> mtime + kích thước.
+# - Cache-Control: tên ngẫu nhiên -> "public, max-age=1 năm, immutable" (trình
+#   duyệt / CDN không cần hỏi lại); file khác -> max-age ngắn + must-revalidate.
+# - Range / If-Range: do FileResponse của Starlette xử lý (206, multipart).
+# - Zero-copy: FileResponse dùng extension "http.response.pathsend" nếu ASGI
+#   server hỗ trợ (vd: Granian), nếu không thì stream theo chunk.
+# - Thương lượng định dạng: GET .../x.jpg với Accept: image/avif hoặc image/webp
+#   -> trả x.avif / x.webp nếu file đó tồn tại cạnh file gốc (image_pipeline tạo
+#   sẵn các rendition WebP). File nén sẵn (.br / .gz) cho svg/css/js... theo
+#   Accept-Encoding. Luôn kèm header Vary tương ứng.
+import mimetypes
+import os
+import re
+import stat
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import StaticFiles, NotModifiedResponse
+from starlette.types import Scope
+
+from config import settings
+import metrics
+
+MEDIA_RESPONSES = metrics.Counter("media_responses_total", "Số response file tĩnh", ("variant",))
+
+# Tên file do services tạo bằng secrets.token_hex(16)
+_IMMUTABLE_NAME = re.compile(r"^[0-9a-f]{32}$")
+
+# Định dạng thay thế cho ảnh, theo thứ tự ưu tiên (nhỏ nhất trước)
+_IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+_ALTERNATE_FORMATS = [("image/avif", ".avif"), ("image/webp", ".webp")]
+
+# File nén sẵn cho các định dạng văn bản
+_COMPRESSIBLE_EXTENSIONS = {".svg", ".css", ".js", ".json", ".txt", ".html"}
+_PRECOMPRESSED = [("br", ".br"), ("gzip", ".gz")]
+
+
+def _accepts(header: str, token: str) -> bool:
+    """token có trong Accept / Accept-Encoding và không bị tắt bằng q=0."""
+    for part in header.split(","):
+        value, *params = [p.strip() for p in part.split(";")]
+        if value == token:
+            return not any(p.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000") for p in params)
+    return False
+
+
+def is_immutable(full_path: str) -> bool:
+    stem = os.path.basename(full_path).split(".", 1)[0]
+    return bool(_IMMUTABLE_NAME.match(stem))
+
+
+def strong_etag(full_path: str, stat_result: os.stat_result) -> str:
+    if is_immutable(full_path):
+        return f'"{os.path.basename(full_path)}-{stat_result.st_size:x}"'
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def cache_control(full_path: str) -> str:
+    if is_immutable(full_path):
+        return f"public, max-age={settings.MEDIA_IMMUTABLE_MAX_AGE}, immutable"
+    return f"public, max-age={settings.MEDIA_MAX_AGE}, must-revalidate"
+
+
+class MediaFiles(StaticFiles):
+    """StaticFiles + ETag mạnh, Cache-Control dài hạn và chọn biến thể theo Accept."""
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        if scope["method"] in ("GET", "HEAD"):
+            variant = await anyio.to_thread.run_sync(self._find_variant, path, Headers(scope=scope))
+            if variant is not None:
+                full_path, stat_result, original_path = variant
+                return self._media_response(full_path, stat_result, scope, original_path)
+        return await super().get_response(path, scope)
+
+    def _find_variant(self, path: str, request_headers: Headers):
+        """
+        Tìm file thay thế (định dạng ảnh tốt hơn hoặc bản nén sẵn) cho `path`.
+        Trả về (full_path, stat_result, original_path) hoặc None để phục vụ file gốc như bình thường.
+        """
+        extension = os.path.splitext(path)[1].lower()
+        if extension in _IMAGE_EXTENSIONS:
+            header, candidates = request_headers.get("accept", ""), _ALTERNATE_FORMATS
+            stem = os.path.splitext(path)[0]
+        elif extension in _COMPRESSIBLE_EXTENSIONS:
+            header, candidates = request_headers.get("accept-encoding", ""), _PRECOMPRESSED
+            stem = path
+        else:
+            return None
+
+        original_path, original_stat = self.lookup_path(path)
+        if original_stat is None or not stat.S_ISREG(original_stat.st_mode):
+            return None
+        for token, suffix in candidates:
+            if not _accepts(header, token):
+                continue
+            full_path, stat_result = self.lookup_path(stem + suffix)
+            if stat_result is not None and stat.S_ISREG(stat_result.st_mode):
+                return full_path, stat_result, original_path
+        return None
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope: Scope,
+                      status_code: int = 200) -> Response:
+        return self._media_response(full_path, stat_result, scope, full_path, status_code)
+
+    def _media_response(self, full_path, stat_result: os.stat_result, scope: Scope,
+                        original_path, status_code: int = 200) -> Response:
+        full_path, original_path = str(full_path), str(original_path)
+        extension = os.path.splitext(original_path)[1].lower()
+
+        headers = {
+            "etag": strong_etag(full_path, stat_result),
+            "cache-control": cache_control(original_path),
+        }
+        media_type = None
+        variant = "original"
+        if extension in _IMAGE_EXTENSIONS:
+            headers["vary"] = "Accept"
+            if full_path != original_path:
+                variant = os.path.splitext(full_path)[1].lstrip(".")
+        elif extension in _COMPRESSIBLE_EXTENSIONS:
+            headers["vary"] = "Accept-Encoding"
+            if full_path != original_path:
+                variant = os.path.splitext(full_path)[1].lstrip(".")
+                headers["content-encoding"] = "br" if variant == "br" else "gzip"
+                # Content-Type theo file gốc, không phải .br / .gz
+                media_type = mimetypes.guess_type(original_path)[0]
+
+        response = FileResponse(
+            full_path, status_code=status_code, headers=headers,
+            media_type=media_type, stat_result=stat_result,
+        )
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            MEDIA_RESPONSES.inc(variant="not_modified")
+            return NotModifiedResponse(response.headers)
+        MEDIA_RESPONSES.inc(variant=variant)
+        return response
+
+
+# Tác dụng chính: Phục vụ ảnh / file tĩnh với ETag, cache dài hạn, Range và WebP/AVIF.
@@ -1,16 +1,19 @@
 from db import Base
-from sqlalchemy import Integer, Column, String, Table
+from sqlalchemy import Integer, Column, String, Table, Index, JSON, Float, func, text
 from typing import Optional
 from sqlalchemy import Column, Integer, String, ForeignKey
 from pydantic import BaseModel, ConfigDict, EmailStr
 from sqlalchemy.orm import relationship, declared_attr
+from sqlalchemy.dialects.postgresql import JSONB
 
 class Book(Base):
     __tablename__ = "Books"
     id = Column(Integer, primary_key=True, index=True)
-    title = Column(String, index = True)
-    description = Column(String, index = True)
-    author = Column(String, index = True)
+    # Không đặt index B-tree cho các cột văn bản: không giúp gì cho tìm theo từ
+    # khóa mà làm chậm mọi lần ghi. Tìm kiếm dùng search_vector + GIN (search.py)
+    title = Column(String)
+    description = Column(String)
+    author = Column(String)
     year = Column(Integer)
     # --- THÊM CLASS NÀY ---
 class User(Base):
@@ -47,7 +50,10 @@ product_category_table = Table(
     "middleTableProductCategory",
     Base.metadata,
     Column("product_id", Integer, ForeignKey("Products.id"), primary_key=True),
-    Column("category_id", Integer, ForeignKey("Categories.id"), primary_key=True)
+    Column("category_id", Integer, ForeignKey("Categories.id"), primary_key=True),
+    # Khóa chính (product_id, category_id) chỉ phục vụ tra theo sản phẩm;
+    # lọc "sản phẩm của category X" cần chiều ngược lại
+    Index("ix_middleTableProductCategory_category", "category_id", "product_id"),
 )
 
 class Product(Base):
@@ -63,6 +69,9 @@ class Product(Base):
     view_count = Column(Integer, default=0, nullable=False)
     # -----------------------
     
+    # Đường dẫn thumbnail (set bởi services.save_product_image)
+    thumbnail_url = Column(String, nullable=True)
+    
     # Quan hệ Một-Nhiều (One-to-Many) với ProductImage
     images = relationship("ProductImage", back_populates="product")
     
@@ -73,6 +82,23 @@ class Product(Base):
         back_populates="products"    # <--- Tên thuộc tính ở class Category
     )   
 
+    # Index cho các cách lọc / sắp xếp của GET /products/ (xem filters.py).
+    # (cột sắp xếp, id) khớp đúng ORDER BY col, id + điều kiện keyset (col, id) > (..)
+    __table_args__ = (
+        Index("ix_Products_price_id", "price", "id"),
+        Index("ix_Products_view_count_id", "view_count", "id"),
+        # in_stock=true: partial index chỉ chứa sản phẩm còn hàng, sắp theo giá
+        Index(
+            "ix_Products_in_stock_price", "price", "id",
+            postgresql_where=text("stock_quantity > 0"), sqlite_where=text("stock_quantity > 0"),
+        ),
+        # name_prefix: LIKE 'abc%' không phân biệt hoa thường
+        Index(
+            "ix_Products_name_lower", func.lower(name).label("name_lower"),
+            postgresql_ops={"name_lower": "text_pattern_ops"},
+        ),
+    )
+
     
 class ProductImage(Base):
     __tablename__ = "ProductImage"
@@ -80,9 +106,18 @@ class ProductImage(Base):
     id = Column(Integer, primary_key=True, index=True)
     image_url = Column(String, nullable=True)
     product_id = Column(Integer, ForeignKey("Products.id"), nullable=False)
+    # pending -> ready | failed (image_pipeline.py xử lý nền sau khi upload).
+    # Ảnh mới luôn bắt đầu là pending (default); server_default="ready" là giá trị
+    # cho các dòng cũ khi create_table thêm cột vào bảng có sẵn (db.ADDED_COLUMNS)
+    status = Column(String, nullable=False, default="pending", server_default="ready")
+    # Lúc (epoch) một worker nhận xử lý ảnh đang pending; pending quá IMAGE_CLAIM_TIMEOUT
+    # (worker chết giữa chừng) thì worker khác được nhận lại, xem image_pipeline._recover
+    claimed_at = Column(Float, nullable=True)
+    # {"300": {"jpeg": "images/...", "webp": "images/..."}, ...}
+    renditions = Column(JSON, nullable=True)
 
     # Quan hệ ngược lại (Many-to-One)
-    product = relationship("Product", back_populate="images")
+    product = relationship("Product", back_populates="images")
 
 
 class Category(Base):
@@ -92,6 +127,9 @@ class Category(Base):
     name = Column(String, unique=True, index = True)  
     image_url = Column(String, nullable=True)
     parent_id = Column(Integer, ForeignKey("Categories.id"), nullable=True) 
+    # Materialized path: id của các tổ tiên + chính nó, vd "/1/4/9/"
+    # (được services duy trì, xem category_tree.py)
+    path = Column(String, nullable=True)
 
     # Quan hệ cha-con (tự tham chiếu)
     parent = relationship("Category", back_populates="children", remote_side=[id])
@@ -103,6 +141,93 @@ class Category(Base):
         secondary=product_category_table, # <--- Dùng LẠI tên Bảng trung gian
         back_populates="categories"    # <--- Tên thuộc tính ở class Product
     )
+
+    __table_args__ = (
+        # varchar_pattern_ops để Postgres dùng được index cho LIKE 'prefix%'
+        Index("ix_Categories_path", "path", postgresql_ops={"path": "varchar_pattern_ops"}),
+    )
+
+
+# JSON thường (SQLite) / JSONB (Postgres: lưu dạng nhị phân, không phải parse lại khi đọc)
+JSONDocument = JSON().with_variant(JSONB(), "postgresql")
+
+
+class ProductListing(Base):
+    """
+    Read model (phi chuẩn hóa) của danh sách sản phẩm: các cột của Products kèm
+    ảnh và category dạng JSON trên CÙNG 1 dòng, để GET /products/,
+    /categories/{id}/products, /search/products đọc 1 bảng hẹp thay vì
+    Products + ProductImage + bảng trung gian + Categories.
+    Không ghi trực tiếp: listing.py tính lại dòng trong cùng transaction với các
+    lần ghi vào bảng nguồn (python -m listing rebuild / check).
+    """
+    __tablename__ = "ProductListing"
+
+    id = Column(Integer, primary_key=True)   # = Products.id
+    name = Column(String, nullable=True)
+    description = Column(String, nullable=False)
+    price = Column(Integer, nullable=False)
+    stock_quantity = Column(Integer, nullable=False)
+    view_count = Column(Integer, nullable=False, default=0)
+    thumbnail_url = Column(String, nullable=True)
+    # [{"id", "product_id", "image_url", "status", "renditions"}, ...] theo id (schemas.ProductImage)
+    images = Column(JSONDocument, nullable=False, default=list)
+    # [{"id", "name", "parent_id", "image_url"}, ...] theo id (schemas.CategoryRef)
+    categories = Column(JSONDocument, nullable=False, default=list)
+
+    # Cùng các index của Products (xem filters.py): lọc / sắp xếp / keyset trên read model
+    __table_args__ = (
+        Index("ix_ProductListing_price_id", "price", "id"),
+        Index("ix_ProductListing_view_count_id", "view_count", "id"),
+        Index(
+            "ix_ProductListing_in_stock_price", "price", "id",
+            postgresql_where=text("stock_quantity > 0"), sqlite_where=text("stock_quantity > 0"),
+        ),
+        Index(
+            "ix_ProductListing_name_lower", func.lower(name).label("name_lower"),
+            postgresql_ops={"name_lower": "text_pattern_ops"},
+        ),
+    )
+
+
+class ProductViewBucket(Base):
+    """
+    Lượt xem theo khung giờ / ngày (popularity.py), cộng dồn bằng upsert mỗi lần
+    view_counter ghi lô. Không có khóa ngoại: xóa sản phẩm không phải dọn bảng
+    này (dòng mồ côi bị bỏ qua khi tính xếp hạng, bị xóa khi hết hạn giữ).
+    """
+    __tablename__ = "ProductViewBucket"
+
+    # PK bắt đầu bằng (granularity, bucket_start): tính tổng theo window / dọn
+    # bucket cũ là quét 1 khoảng liên tục của index
+    granularity = Column(String, primary_key=True)     # "hour" | "day"
+    bucket_start = Column(Integer, primary_key=True)   # epoch (giây, UTC) đầu giờ / đầu ngày
+    product_id = Column(Integer, primary_key=True)
+    views = Column(Integer, nullable=False, default=0)
+
+
+class ProductRanking(Base):
+    """
+    Top-K sản phẩm xem nhiều nhất theo (window, category), tính sẵn định kỳ
+    (popularity.refresh). GET /products/popular đọc K dòng liên tiếp theo PK.
+    """
+    __tablename__ = "ProductRanking"
+
+    period = Column(String, primary_key=True)         # window: "1h" | "24h" | "7d" | "30d"
+    category_id = Column(Integer, primary_key=True)   # gồm cả category con cháu; 0 = mọi sản phẩm
+    rank = Column(Integer, primary_key=True)          # 1 = xem nhiều nhất
+    product_id = Column(Integer, nullable=False)
+    views = Column(Integer, nullable=False)           # lượt xem trong window
+    computed_at = Column(Float, nullable=False)       # epoch (giây) của lần tính
+
+
+class SchedulerLease(Base):
+    """Lease bầu leader cho scheduler (job_scheduler.py): chỉ worker giữ lease mới chạy job."""
+    __tablename__ = "SchedulerLease"
+
+    name = Column(String, primary_key=True)
+    owner = Column(String, nullable=True)         # "host:pid:ngẫu nhiên" của worker đang giữ
+    expires_at = Column(Float, nullable=False)    # epoch (giây); hết hạn -> worker khác giành được
      
     
     
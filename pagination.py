@@ -0,0 +1,105 @@
+# pagination.py
+# Phân trang theo "con trỏ" (keyset / cursor pagination).
+#
+# OFFSET n buộc DB phải đọc rồi bỏ qua n dòng, nên trang càng sâu càng chậm.
+# Keyset thì nhớ giá trị (cột sắp xếp, id) của dòng cuối trang trước và lấy
+# tiếp bằng WHERE (col, id) > (:v, :id) ORDER BY col, id LIMIT n -> luôn là
+# một lần quét index ngắn, bất kể đang ở trang thứ mấy.
+import base64
+import json
+
+from fastapi import HTTPException, status
+from sqlalchemy import tuple_, text, func, select
+
+
+def encode_cursor(data: dict) -> str:
+    """dict -> chuỗi opaque (base64url, không padding) để trả cho client."""
+    raw = json.dumps(data, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _is_int(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _valid_cursor(data) -> bool:
+    """Đúng dạng do build_page tạo: s, o, id (số nguyên) và v (giá trị cột sắp xếp) nếu s != "id"."""
+    if not isinstance(data, dict) or not isinstance(data.get("s"), str) or data.get("o") not in ("asc", "desc"):
+        return False
+    if not _is_int(data.get("id")):
+        return False
+    if data["s"] == "id":
+        return True
+    value = data.get("v", ...)
+    return value is None or _is_int(value) or isinstance(value, (str, float))
+
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except ValueError:
+        data = None
+    if not _valid_cursor(data):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return data
+
+
+def keyset_paginate(stmt, model, sort: str, order: str, cursor: str | None, limit: int):
+    """
+    Thêm WHERE/ORDER BY/LIMIT keyset vào câu SELECT `stmt` của `model`.
+    Lấy dư 1 dòng (limit + 1) để biết còn trang sau hay không.
+    """
+    sort_col = getattr(model, sort)
+    id_col = model.id
+    descending = order == "desc"
+
+    if cursor:
+        data = decode_cursor(cursor)
+        if data.get("s") != sort or data.get("o") != order:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Cursor does not match the requested sort order"
+            )
+        if sort == "id":
+            stmt = stmt.where(id_col < data["id"] if descending else id_col > data["id"])
+        else:
+            key, last = tuple_(sort_col, id_col), tuple_(data["v"], data["id"])
+            stmt = stmt.where(key < last if descending else key > last)
+
+    if sort == "id":
+        order_by = [id_col.desc() if descending else id_col.asc()]
+    elif descending:
+        order_by = [sort_col.desc(), id_col.desc()]
+    else:
+        order_by = [sort_col.asc(), id_col.asc()]
+    return stmt.order_by(*order_by).limit(limit + 1)
+
+
+def build_page(rows: list, sort: str, order: str, limit: int) -> dict:
+    """Cắt dòng dư và tạo next_cursor từ dòng cuối cùng của trang."""
+    items = list(rows[:limit])
+    next_cursor = None
+    if len(rows) > limit and items:
+        last = items[-1]
+        data = {"s": sort, "o": order, "id": last.id}
+        if sort != "id":
+            data["v"] = getattr(last, sort)
+        next_cursor = encode_cursor(data)
+    return {"items": items, "next_cursor": next_cursor}
+
+
+def estimate_count_stmt(dialect_name: str, table_name: str):
+    """
+    Ước lượng số dòng của bảng mà KHÔNG cần COUNT(*) quét cả bảng.
+    Postgres: dùng thống kê của planner (pg_class.reltuples, cập nhật bởi
+    ANALYZE/autovacuum). DB khác: quay về COUNT(*).
+    """
+    if dialect_name == "postgresql":
+        return text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:name)").bindparams(
+            name=f'"{table_name}"'
+        )
+    return select(func.count()).select_from(text(f'"{table_name}"'))
+
+
+# Tác dụng chính: Phân trang bằng cursor (keyset) cho các endpoint danh sách.
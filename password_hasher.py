@@ -0,0 +1,114 @@
+# password_hasher.py
+# Băm / kiểm tra mật khẩu (bcrypt) trong process pool RIÊNG, có giới hạn.
+#
+# bcrypt tốn ~100-300 ms CPU mỗi lần. Chạy inline (hoặc trong threadpool chung
+# của Starlette) thì một đợt đăng nhập dồn dập sẽ chiếm hết thread và mọi
+# request khác (kể cả đọc cache) phải xếp hàng sau nó. Ở đây:
+#   - tối đa PASSWORD_HASH_WORKERS phép băm chạy song song (mỗi process 1 lõi);
+#   - thêm tối đa PASSWORD_HASH_QUEUE_DEPTH phép băm được xếp hàng;
+#   - vượt quá -> 503 + Retry-After ngay lập tức, không chờ.
+# Khi tham số cost (BCRYPT_ROUNDS) thay đổi, verify() trả về hash mới để lưu lại
+# (rehash-on-login) -> user cũ dần được nâng cấp mà không cần reset mật khẩu.
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from config import settings
+import metrics
+
+PASSWORD_HASH_SECONDS = metrics.Histogram(
+    "password_hash_seconds", "Thời gian băm / kiểm tra mật khẩu (gồm cả thời gian chờ)", ("op",)
+)
+PASSWORD_HASH_REJECTED = metrics.Counter(
+    "password_hash_rejected_total", "Số request bị từ chối vì pool băm mật khẩu quá tải", ("op",)
+)
+PASSWORD_REHASHED = metrics.Counter("password_rehashed_total", "Số mật khẩu được băm lại khi đăng nhập")
+PASSWORD_HASH_INFLIGHT = metrics.Gauge(
+    "password_hash_inflight", "Số phép băm đang chạy + đang chờ",
+    callback=lambda: {(): _admitted},
+)
+
+# Chúng ta chọn bcrypt làm thuật toán băm; hash có cost khác BCRYPT_ROUNDS
+# được coi là "cần cập nhật" (deprecated="auto" + verify_and_update)
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
+
+_pool: ProcessPoolExecutor | None = None
+_semaphore: asyncio.Semaphore | None = None
+_admitted = 0
+
+
+# ===================================================================
+# --- HÀM CHẠY TRONG PROCESS CON (phải ở top-level để pickle được) ---
+# ===================================================================
+
+def hash_sync(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_sync(password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """(mật khẩu đúng?, hash mới nếu cần băm lại với tham số hiện tại)."""
+    return pwd_context.verify_and_update(password, hashed_password)
+
+
+# ===================================================================
+# --- POOL + ADMISSION CONTROL ---
+# ===================================================================
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS)
+    return _pool
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(settings.PASSWORD_HASH_WORKERS)
+    return _semaphore
+
+
+async def _run(op: str, fn, *args):
+    global _admitted
+    if _admitted >= settings.PASSWORD_HASH_WORKERS + settings.PASSWORD_HASH_QUEUE_DEPTH:
+        PASSWORD_HASH_REJECTED.inc(op=op)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Authentication is busy, please retry later",
+            headers={"Retry-After": str(settings.PASSWORD_HASH_RETRY_AFTER)},
+        )
+    _admitted += 1
+    try:
+        with PASSWORD_HASH_SECONDS.time(op=op):
+            async with _get_semaphore():
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(_get_pool(), fn, *args)
+    finally:
+        _admitted -= 1
+
+
+async def hash_password(password: str) -> str:
+    """Băm mật khẩu trong process pool."""
+    return await _run("hash", hash_sync, password)
+
+
+async def verify_password(password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """Kiểm tra mật khẩu trong process pool; trả về (đúng?, hash mới hoặc None)."""
+    verified, new_hash = await _run("verify", verify_sync, password, hashed_password)
+    if verified and new_hash:
+        PASSWORD_REHASHED.inc()
+    return verified, new_hash
+
+
+def shutdown():
+    """Đóng process pool (gọi trong lifespan khi tắt ứng dụng)."""
+    global _pool, _semaphore
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
+    _semaphore = None
+
+
+# Tác dụng chính: Băm / kiểm tra mật khẩu bcrypt ngoài event loop, có giới hạn tải.
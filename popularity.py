@@ -0,0 +1,194 @@
+# popularity.py
+# Sản phẩm phổ biến (GET /products/popular?window=&category_id=).
+#
+# Products.view_count chỉ là tổng từ trước tới nay. Để xếp hạng theo khoảng thời
+# gian, lượt xem còn được cộng vào các bucket theo giờ và theo ngày
+# (ProductViewBucket), trong CÙNG lô ghi của view_counter:
+#
+#   INSERT INTO "ProductViewBucket" (granularity, bucket_start, product_id, views) VALUES (...)
+#   ON CONFLICT (granularity, bucket_start, product_id) DO UPDATE SET views = views + excluded.views
+#
+# -> số dòng ghi tỉ lệ với số SẢN PHẨM được xem trong mỗi lần flush (vài giây),
+# không phải số lượt xem: hàng triệu lượt / ngày vẫn chỉ là vài upsert mỗi lần.
+#
+# Định kỳ (job "refresh_popularity" của job_scheduler, số liệu: scheduler_job_*)
+# refresh() tính top-K cho mỗi window và mỗi category (tính cả sản phẩm của
+# category con cháu, theo materialized path) rồi ghi đè bảng ProductRanking trong
+# 1 transaction. Đọc chỉ là K dòng liên tiếp theo PK (window, category_id, rank)
+# -> O(K), không sắp xếp bảng Products.
+#
+#   python -m popularity refresh   (tính lại ngay, vd: khi SCHEDULER_MODE="off")
+import argparse
+import heapq
+import time
+from itertools import chain
+from typing import Literal
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from config import settings
+from models import Category, Product, ProductRanking, ProductViewBucket, product_category_table
+import category_tree
+
+GRANULARITY_SECONDS = {"hour": 3600, "day": 86400}
+
+# window -> (granularity, số bucket ĐẦY ĐỦ gần nhất). Cộng thêm bucket đang dở, nên
+# window "24h" là 24-25 giờ gần nhất (độ phân giải = 1 bucket)
+Window = Literal["1h", "24h", "7d", "30d"]
+WINDOWS: dict[str, tuple[str, int]] = {"1h": ("hour", 1), "24h": ("hour", 24), "7d": ("day", 7), "30d": ("day", 30)}
+
+# category_id của bảng xếp hạng toàn bộ sản phẩm
+ALL_CATEGORIES = 0
+
+_UPSERTS = {"postgresql": postgresql_insert, "sqlite": sqlite_insert}
+
+
+def bucket_start(granularity: str, now: float) -> int:
+    """Epoch (UTC) đầu giờ / đầu ngày chứa thời điểm `now`."""
+    step = GRANULARITY_SECONDS[granularity]
+    return int(now // step * step)
+
+
+def window_start(window: str, now: float) -> int:
+    granularity, count = WINDOWS[window]
+    return bucket_start(granularity, now) - count * GRANULARITY_SECONDS[granularity]
+
+
+# ===================================================================
+# --- GHI LƯỢT XEM VÀO BUCKET ---
+# ===================================================================
+
+def upsert_views_stmt(dialect_name: str):
+    """INSERT ... ON CONFLICT DO UPDATE cộng dồn (dùng với executemany, xem view_rows)."""
+    stmt = _UPSERTS[dialect_name](ProductViewBucket)
+    return stmt.on_conflict_do_update(
+        index_elements=[ProductViewBucket.granularity, ProductViewBucket.bucket_start, ProductViewBucket.product_id],
+        set_={"views": ProductViewBucket.views + stmt.excluded.views},
+    )
+
+
+def view_rows(counts: dict[int, int], now: float | None = None) -> list[dict]:
+    """Lượt xem của 1 lô -> dòng cho bucket giờ + bucket ngày hiện tại."""
+    now = time.time() if now is None else now
+    return [
+        {"granularity": granularity, "bucket_start": bucket_start(granularity, now), "product_id": product_id,
+         "views": views}
+        for granularity in GRANULARITY_SECONDS
+        for product_id, views in sorted(counts.items())   # thứ tự cố định: tránh deadlock giữa các worker
+    ]
+
+
+# ===================================================================
+# --- TÍNH BẢNG XẾP HẠNG ---
+# ===================================================================
+
+def _ancestors(db: Session) -> dict[int, list[int]]:
+    """category -> chính nó + mọi tổ tiên (theo materialized path)."""
+    rows = db.execute(select(Category.id, Category.path))
+    return {cid: category_tree.path_ids(path) if path else [cid] for cid, path in rows}
+
+
+def _scores_stmt(window: str, now: float):
+    """SELECT product_id, tổng lượt xem trong window (bỏ sản phẩm đã bị xóa)."""
+    granularity, _ = WINDOWS[window]
+    views = func.sum(ProductViewBucket.views).label("views")
+    return (
+        select(ProductViewBucket.product_id, views)
+        .join(Product, Product.id == ProductViewBucket.product_id)
+        .where(ProductViewBucket.granularity == granularity, ProductViewBucket.bucket_start >= window_start(window, now))
+        .group_by(ProductViewBucket.product_id)
+    )
+
+
+def top_k(scores: dict[int, int], links, ancestors: dict[int, list[int]], k: int) -> dict[int, list[tuple[int, int]]]:
+    """
+    Top-k theo từng category (gồm cả sản phẩm của category con cháu) + toàn bộ
+    (ALL_CATEGORIES). links: (product_id, category_id). Mỗi category giữ 1 heap
+    kích thước k -> O(số sản phẩm * số tổ tiên * log k), bộ nhớ O(số category * k).
+    Trả về {category_id: [(product_id, views), ...]} theo lượt xem giảm dần, hòa thì id nhỏ trước.
+    """
+    targets: dict[int, set[int]] = {}
+    for product_id, category_id in links:
+        targets.setdefault(product_id, set()).update(ancestors.get(category_id, (category_id,)))
+    heaps: dict[int, list[tuple[int, int]]] = {}
+    for product_id, views in scores.items():
+        entry = (views, -product_id)
+        for category_id in chain((ALL_CATEGORIES,), targets.get(product_id, ())):
+            heap = heaps.setdefault(category_id, [])
+            if len(heap) < k:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+    return {
+        category_id: [(-negative_id, views) for views, negative_id in sorted(heap, reverse=True)]
+        for category_id, heap in heaps.items()
+    }
+
+
+def prune(db: Session, now: float) -> int:
+    """Xóa bucket quá hạn giữ (không ngắn hơn window dài nhất của mỗi loại bucket)."""
+    retention = {"hour": settings.POPULARITY_HOURLY_RETENTION, "day": settings.POPULARITY_DAILY_RETENTION}
+    removed = 0
+    for granularity, keep in retention.items():
+        longest = max(count for g, count in WINDOWS.values() if g == granularity)
+        cutoff = bucket_start(granularity, now) - max(keep, longest + 1) * GRANULARITY_SECONDS[granularity]
+        removed += db.execute(
+            delete(ProductViewBucket)
+            .where(ProductViewBucket.granularity == granularity, ProductViewBucket.bucket_start < cutoff)
+        ).rowcount
+    return removed
+
+
+def refresh(db: Session, now: float | None = None) -> dict[str, int]:
+    """
+    Tính lại bảng xếp hạng của mọi window và dọn bucket cũ, trong 1 transaction
+    (người đọc thấy bảng cũ cho tới khi commit). Trả về {window: số dòng}.
+    """
+    now = time.time() if now is None else now
+    ancestors = _ancestors(db)
+    link = product_category_table
+    written = {}
+    for window in WINDOWS:
+        scored = _scores_stmt(window, now)
+        scores = {product_id: views for product_id, views in db.execute(scored)}
+        # chỉ các liên kết của sản phẩm có lượt xem trong window
+        links = db.execute(
+            select(link.c.product_id, link.c.category_id)
+            .where(link.c.product_id.in_(select(scored.subquery().c.product_id)))
+        )
+        rankings = top_k(scores, links, ancestors, settings.POPULARITY_TOP_K)
+        db.execute(delete(ProductRanking).where(ProductRanking.period == window))
+        rows = [
+            {"period": window, "category_id": category_id, "rank": rank, "product_id": product_id,
+             "views": views, "computed_at": now}
+            for category_id, ranked in rankings.items()
+            for rank, (product_id, views) in enumerate(ranked, start=1)
+        ]
+        if rows:
+            db.execute(insert(ProductRanking), rows)
+        written[window] = len(rows)
+    prune(db, now)
+    db.commit()
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description="Bảng xếp hạng sản phẩm phổ biến")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("refresh", help="tính lại bảng xếp hạng ngay")
+    parser.parse_args()
+
+    from db import SessionLocal, create_table
+    create_table()
+    with SessionLocal() as db:
+        written = refresh(db)
+    print(", ".join(f"{window}: {count} dòng" for window, count in written.items()))
+
+
+if __name__ == "__main__":
+    main()
+
+
+# Tác dụng chính: Đếm lượt xem theo giờ / ngày và tính sẵn top-K sản phẩm phổ biến theo category.
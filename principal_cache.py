@@ -0,0 +1,185 @@
+# principal_cache.py
+# Cache "principal" (user đã xác thực) theo access token cho auth.get_current_user.
+#
+# Trước đây mỗi request có bảo vệ = giải mã JWT + 1 SELECT "Users" theo email.
+# Giờ:
+#   hit  -> trả principal từ bộ nhớ (không decode lại JWT, không chạm DB)
+#   miss -> decode + SELECT 1 lần; các request ĐỒNG THỜI cùng token chờ chung
+#           kết quả đó (single-flight) thay vì cùng bắn SELECT.
+#
+# - Key: sha256 của token (không giữ token gốc trong bộ nhớ).
+# - TTL: min(PRINCIPAL_CACHE_TTL, exp của token - bây giờ) -> không bao giờ sống
+#   lâu hơn token.
+# - Vô hiệu hóa: khi user bị xóa / đổi mật khẩu / đổi email, các ORM event bên
+#   dưới xóa mọi entry của user đó SAU KHI transaction commit. Cache nằm trong
+#   bộ nhớ của từng worker: với nhiều worker, worker khác chỉ thấy thay đổi sau
+#   tối đa PRINCIPAL_CACHE_TTL giây.
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from config import settings
+import metrics
+import models
+import schemas
+
+PRINCIPAL_LOOKUPS = metrics.Counter("principal_cache_requests_total", "Số lần tra cache principal", ("result",))
+PRINCIPAL_INVALIDATIONS = metrics.Counter("principal_cache_invalidations_total", "Số entry principal bị xóa")
+
+
+def token_key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class PrincipalCache:
+    """LRU + TTL, thread-safe; kèm chỉ mục email -> các key để vô hiệu hóa theo user."""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._data: OrderedDict[str, tuple[float, schemas.User]] = OrderedDict()
+        self._by_email: dict[str, set[str]] = {}
+        self._inflight: dict[str, asyncio.Future] = {}
+        # tăng mỗi lần vô hiệu hóa: kết quả load bắt đầu TRƯỚC đó không được cache
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> schemas.User | None:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, principal = item
+            if expires_at <= time.time():
+                self._remove(key)
+                return None
+            self._data.move_to_end(key)
+            return principal
+
+    def set(self, key: str, principal: schemas.User, token_exp: float | None):
+        ttl = settings.PRINCIPAL_CACHE_TTL
+        expires_at = time.time() + ttl
+        if token_exp is not None:
+            expires_at = min(expires_at, token_exp)
+        with self._lock:
+            self._data[key] = (expires_at, principal)
+            self._data.move_to_end(key)
+            self._by_email.setdefault(principal.email, set()).add(key)
+            while len(self._data) > self.max_entries:
+                self._remove(next(iter(self._data)))
+
+    def _remove(self, key: str):
+        _, principal = self._data.pop(key)
+        keys = self._by_email.get(principal.email)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_email[principal.email]
+
+    def invalidate_user(self, email: str):
+        """Xóa mọi principal (mọi token) của user `email`."""
+        with self._lock:
+            self._generation += 1
+            keys = self._by_email.pop(email, set())
+            for key in keys:
+                self._data.pop(key, None)
+        PRINCIPAL_INVALIDATIONS.inc(len(keys))
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._by_email.clear()
+
+    async def get_or_load(self, token: str, loader) -> schemas.User | None:
+        """
+        Trả principal của token; nếu chưa có thì gọi `await loader()` -> (principal, exp).
+        Các coroutine cùng token trong lúc đang load sẽ chờ chung 1 Future.
+        """
+        key = token_key(token)
+        principal = self.get(key)
+        if principal is not None:
+            PRINCIPAL_LOOKUPS.inc(result="hit")
+            return principal
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            PRINCIPAL_LOOKUPS.inc(result="shared")
+            return await asyncio.shield(pending)
+
+        PRINCIPAL_LOOKUPS.inc(result="miss")
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        generation = self._generation
+        try:
+            principal, token_exp = await loader()
+            if principal is not None and generation == self._generation:
+                self.set(key, principal, token_exp)
+            future.set_result(principal)
+            return principal
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # tránh cảnh báo "exception was never retrieved" khi không ai chờ
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+
+
+principal_cache = PrincipalCache(settings.PRINCIPAL_CACHE_MAX_ENTRIES)
+
+
+# ===================================================================
+# --- VÔ HIỆU HÓA KHI USER THAY ĐỔI (ORM events) ---
+# ===================================================================
+# Ghi nhận email bị ảnh hưởng lúc flush, chỉ xóa cache sau khi COMMIT thành công
+# (nếu xóa ngay lúc flush, request khác có thể nạp lại dữ liệu cũ trước commit).
+
+_PENDING_KEY = "principal_cache_invalidations"
+
+
+def track(session: Session, *emails):
+    """Xóa cache của các email này khi session commit (dùng cho ghi bằng Core, không qua ORM events)."""
+    session.info.setdefault(_PENDING_KEY, set()).update(e for e in emails if e)
+
+
+def _mark(target: models.User, *emails):
+    session = inspect(target).session
+    if session is not None:
+        track(session, *emails)
+
+
+@event.listens_for(models.User, "after_update")
+def _user_updated(mapper, connection, target):
+    state = inspect(target)
+    password = state.attrs.hashed_password.history
+    email = state.attrs.email.history
+    if password.has_changes() or email.has_changes():
+        _mark(target, target.email, *email.deleted)
+
+
+@event.listens_for(models.User, "after_delete")
+def _user_deleted(mapper, connection, target):
+    _mark(target, target.email)
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    for email in session.info.pop(_PENDING_KEY, ()):
+        principal_cache.invalidate_user(email)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _after_rollback(session, previous_transaction):
+    # rollback SAVEPOINT không hủy các thay đổi của transaction ngoài (vẫn phải xóa cache khi commit)
+    if not previous_transaction.nested:
+        session.info.pop(_PENDING_KEY, None)
+
+
+# Tác dụng chính: Cache user đã xác thực theo token để get_current_user không query DB mỗi request.
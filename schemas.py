@@ -1,8 +1,10 @@
 # schemas.py
 
 from sqlalchemy import Column, Integer, String, ForeignKey
-from pydantic import BaseModel, ConfigDict, EmailStr
-from typing import Optional, List  # <-- Đảm bảo 'List' đã được import
+from datetime import datetime
+from functools import lru_cache
+from pydantic import BaseModel, ConfigDict, EmailStr, create_model
+from typing import Optional, List, Generic, TypeVar, Literal  # <-- Đảm bảo 'List' đã được import
 
 # --- CÁC SCHEMAS CỦA BẠN (giữ nguyên) ---
 
@@ -15,6 +17,17 @@ class BookBase(BaseModel):
 class BookCreate(BookBase):
     pass
 
+# --- CẬP NHẬT MỘT PHẦN (PUT /bulk/{entity}) ---
+# Mọi trường đều không bắt buộc; chỉ các trường client gửi lên mới được ghi
+# (model_dump(exclude_unset=True)). Cột NOT NULL có kiểu không Optional: gửi
+# null tường minh vẫn bị từ chối khi validate.
+
+class BookUpdate(BaseModel):
+    title: str = None
+    author: str = None
+    description: str = None
+    year: Optional[int] = None
+
 class Book(BookBase):
     id: int
     model_config = ConfigDict(from_attributes=True)
@@ -32,6 +45,10 @@ class User(UserBase):
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: str | None = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 class TokenData(BaseModel):
     email: EmailStr | None = None
@@ -51,6 +68,9 @@ class ProductImageBase(BaseModel):
 class ProductImage(ProductImageBase):
     id: int
     product_id: int # Thêm trường này để biết nó thuộc về SP nào
+    # pending: đang chờ tạo rendition; client poll tới khi ready / failed
+    status: Literal["pending", "ready", "failed"] = "ready"
+    renditions: dict[str, dict[str, str]] | None = None
     
     model_config = ConfigDict(from_attributes=True)
 
@@ -72,6 +92,14 @@ class ProductCreate(ProductBase):
     # một danh sách các ID của Category để liên kết
     categories: List[int] = [] 
     
+class ProductUpdate(BaseModel):
+    name: str = None
+    description: str = None
+    price: int = None
+    stock_quantity: int = None
+    thumbnail_url: Optional[str] = None
+    categories: List[int] = None
+
 # kiểu dữ liệu typehint theo 1 công thưc chung: tên_trường: Kiểu_Dữ_Liệu = Giá_Trị_Mặc_Định
 
 class Product(ProductBase):
@@ -87,9 +115,9 @@ class Product(ProductBase):
     images: List[ProductImage] = []
     
     # 2. Hiển thị danh sách các category (từ 'categories' trong model)
-    # Cần dùng Forward Ref "Category" vì class Category 
-    # được định nghĩa ở bên dưới
-    categories: List["Category"] = []
+    # Chỉ dùng CategoryRef (không có children/products) để cắt vòng lặp
+    # Product -> Category -> Product ... và giữ số câu truy vấn có giới hạn
+    categories: List["CategoryRef"] = []
     
     model_config = ConfigDict(from_attributes=True)
 
@@ -102,6 +130,18 @@ class CategoryBase(BaseModel):
 class CategoryCreate(CategoryBase):
     parent_id: Optional[int] = None
 
+class CategoryUpdate(BaseModel):
+    name: str = None
+    parent_id: Optional[int] = None
+
+class CategoryRef(CategoryBase):
+    # Category "phẳng" dùng khi lồng trong Product
+    id: int
+    parent_id: Optional[int] = None
+    image_url: Optional[str] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
 class Category(CategoryBase):
     id: int
     parent_id: Optional[int] = None
@@ -120,6 +160,114 @@ class Category(CategoryBase):
     model_config = ConfigDict(from_attributes=True)
     
 
+# --- BIẾN THỂ GỌN (?view=summary) CHO DANH SÁCH ---
+# Product / Category ở trên là bản "detail": Product kèm images + categories,
+# Category kèm children + products (mỗi product lại kèm images + categories).
+# Danh sách lớn chỉ cần vài cột -> dùng bản summary: không có relationship,
+# services đọc thẳng các cột thành dòng (không tạo ORM object) rồi validate
+# từ dict, nhanh hơn nhiều so với đi qua thuộc tính ORM (from_attributes).
+# So sánh: python -m benchmarks.serialization
+
+class ProductSummary(BaseModel):
+    id: int
+    name: str
+    price: int
+    stock_quantity: int
+    view_count: int
+    thumbnail_url: Optional[str] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+class PopularProduct(ProductSummary):
+    views: int   # lượt xem trong window (view_count là tổng từ trước tới nay)
+
+class PopularProducts(BaseModel):
+    window: str
+    category_id: Optional[int] = None
+    # lần tính bảng xếp hạng (định kỳ, xem popularity.py); None = chưa có dữ liệu
+    computed_at: Optional[datetime] = None
+    items: List[PopularProduct]
+
+class CategorySummary(CategoryRef):
+    # cây category không kèm sản phẩm
+    children: List["CategorySummary"] = []
+
+
+# --- PHÂN TRANG (CURSOR) ---
+
+T = TypeVar("T")
+
+class Page(BaseModel, Generic[T]):
+    items: List[T]
+    # Truyền lại vào ?cursor= để lấy trang tiếp theo; None = hết dữ liệu
+    next_cursor: Optional[str] = None
+    # Ước lượng tổng số bản ghi (chỉ có khi ?with_total=true)
+    total_estimate: Optional[int] = None
+
+
+# --- TÌM KIẾM ---
+
+class SearchHit(BaseModel, Generic[T]):
+    score: float   # càng lớn càng liên quan (chỉ so sánh được trong cùng 1 lần tìm)
+    item: T
+
+class FacetCount(BaseModel):
+    value: str                   # id category / khoảng giá "100000-500000" / "in_stock"
+    label: Optional[str] = None  # tên category
+    count: int
+
+class SearchResult(BaseModel, Generic[T]):
+    total: int
+    hits: List[SearchHit[T]]
+    # "category" (các category con, đếm cả cây con), "price", "stock"
+    facets: dict[str, List[FacetCount]] = {}
+
+
+# --- CHỌN TRƯỜNG (?fields=) ---
+
+@lru_cache(maxsize=128)
+def product_projection(fields: tuple[str, ...]) -> type[BaseModel]:
+    """
+    Schema chỉ gồm `fields` của Product (vd: ("id", "name", "price")).
+    Validate từ ORM chỉ đọc các thuộc tính này -> không chạm tới images /
+    categories nếu không được chọn. Tạo 1 lần cho mỗi tổ hợp trường.
+    """
+    return create_model(
+        "ProductFields",
+        __config__=ConfigDict(from_attributes=True),
+        **{name: (Product.model_fields[name].annotation, Product.model_fields[name]) for name in fields},
+    )
+
+# Mô tả (OpenAPI) các schema do product_projection tạo ra: luôn có id, các
+# trường khác chỉ có mặt khi được chọn trong ?fields=
+ProductProjection = create_model(
+    "ProductProjection",
+    id=(int, ...),
+    **{name: (field.annotation, None) for name, field in Product.model_fields.items() if name != "id"},
+)
+
+# response_model của danh sách sản phẩm có ?view= / ?fields=. Response thật do
+# cache.cached_response serialize theo đúng schema đã chọn (không đi qua
+# response_model); kiểu này chỉ để OpenAPI liệt kê đủ các dạng có thể trả về.
+ProductItem = Product | ProductSummary | ProductProjection
+
+
+# --- GHI HÀNG LOẠT (BULK) ---
+
+class BulkError(BaseModel):
+    index: int   # vị trí item trong body (bắt đầu từ 0)
+    error: str
+
+class BulkResult(BaseModel):
+    processed: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    # False khi transaction="all" và có lỗi -> không item nào được ghi
+    committed: bool = True
+    ids: List[int] = []
+    errors: List[BulkError] = []
+
+
 # --- 4. CÁC LỆNH REBUILD (QUAN TRỌNG) ---
 # Vì 'Category' tham chiếu đến chính nó (children)
 # và 'Product' tham chiếu đến 'Category'
@@ -127,4 +275,5 @@ class Category(CategoryBase):
 # sau khi TẤT CẢ đã được định nghĩa.
 
 Category.model_rebuild()
-Product.model_rebuild()
\ No newline at end of file
+Product.model_rebuild()
+CategorySummary.model_rebuild()
\ No newline at end of file
@@ -0,0 +1,575 @@
+# search.py
+# Tìm kiếm full-text + lọc + facet cho sản phẩm và sách (GET /search/...).
+#
+# Index B-tree trên các cột văn bản không giúp được LIKE '%từ%' hay tìm theo từ
+# khóa, nên tìm kiếm dùng một trong 2 backend (cùng interface, SEARCH_BACKEND):
+#   - "postgres": cột search_vector kiểu tsvector, GENERATED ... STORED nên
+#     Postgres tự tính lại mỗi lần INSERT / UPDATE (kể cả ghi hàng loạt qua Core),
+#     kèm index GIN. Khớp bằng to_tsquery với tiền tố ("từ:*"), xếp hạng
+#     ts_rank_cd (trọng số: tên / tiêu đề > mô tả).
+#   - "memory": inverted index trong bộ nhớ của từng worker (SQLite, dev, catalog
+#     nhỏ). Cập nhật theo id sau mỗi commit (ORM events + bulk), xếp hạng BM25,
+#     tiền tố bằng bisect trên từ điển đã sắp xếp.
+# Cả 2 backend: lọc theo category (gồm cả cây con, theo materialized path), khoảng
+# giá, còn hàng; facet: category con, khoảng giá, tình trạng kho.
+import bisect
+import heapq
+import math
+import re
+import threading
+import time
+from itertools import chain
+
+from sqlalchemy import case, distinct, event, func, literal_column, select, text
+from sqlalchemy.orm import Session, aliased
+
+from config import settings
+from filters import product_clauses
+from models import Book, Category, Product, product_category_table
+import cache
+import category_tree
+import metrics
+
+SEARCH_SECONDS = metrics.Histogram("search_seconds", "Thời gian tìm kiếm (không gồm tải kết quả)", ("backend", "entity"))
+SEARCH_INDEX_REFRESHES = metrics.Counter(
+    "search_index_refreshes_total", "Số lần cập nhật inverted index trong bộ nhớ", ("entity", "kind")
+)
+SEARCH_INDEX_DOCUMENTS = metrics.Gauge(
+    "search_index_documents", "Số tài liệu trong inverted index trong bộ nhớ", ("entity",),
+    callback=lambda: {(entity,): len(index) for entity, index in indexes.items()},
+)
+
+_MODELS = {"books": Book, "products": Product}
+
+# Các cột được đánh chỉ mục và trọng số (A > B) - dùng chung cho 2 backend
+DOCUMENT_FIELDS = {
+    "products": [("name", "A"), ("description", "B")],
+    "books": [("title", "A"), ("author", "A"), ("description", "B")],
+}
+FIELD_WEIGHTS = {"A": 3.0, "B": 1.0}
+
+# Index B-tree cũ trên cột văn bản của Books (bỏ khi khởi động, xem ensure_schema)
+LEGACY_TEXT_INDEXES = ["ix_Books_title", "ix_Books_description", "ix_Books_author"]
+
+_TOKEN = re.compile(r"[^\W_]+")
+
+
+def tokenize(text: str | None) -> list[str]:
+    """'Điện thoại iPhone-15' -> ['điện', 'thoại', 'iphone', '15'] (giống config 'simple')."""
+    return _TOKEN.findall(text.lower()) if text else []
+
+
+def backend_name(db: Session) -> str:
+    if settings.SEARCH_BACKEND != "auto":
+        return settings.SEARCH_BACKEND
+    return "postgres" if db.get_bind().dialect.name == "postgresql" else "memory"
+
+
+# ===================================================================
+# --- FACET (dùng chung) ---
+# ===================================================================
+
+def price_bucket(price: int) -> int:
+    return bisect.bisect_right(settings.SEARCH_PRICE_BUCKETS, price)
+
+
+def _price_facet(counts: dict[int, int]) -> list[dict]:
+    bounds = [None, *settings.SEARCH_PRICE_BUCKETS, None]
+    facet = []
+    for bucket in sorted(counts):
+        low, high = bounds[bucket], bounds[bucket + 1]
+        value = f"{low or 0}-{high if high is not None else ''}"
+        facet.append({"value": value, "label": None, "count": counts[bucket]})
+    return facet
+
+
+def _stock_facet(counts: dict[bool, int]) -> list[dict]:
+    return [
+        {"value": "in_stock" if in_stock else "out_of_stock", "label": None, "count": counts[in_stock]}
+        for in_stock in (True, False) if counts.get(in_stock)
+    ]
+
+
+def _category_facet(rows) -> list[dict]:
+    """rows: (category_id, name, count) đã sắp giảm dần theo count."""
+    return [{"value": str(cid), "label": name, "count": count} for cid, name, count in rows]
+
+
+# ===================================================================
+# --- BACKEND POSTGRES (tsvector + GIN) ---
+# ===================================================================
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _document_sql(entity: str) -> str:
+    return " || ".join(
+        f"setweight(to_tsvector('simple', coalesce({_quote(column)}, '')), '{weight}')"
+        for column, weight in DOCUMENT_FIELDS[entity]
+    )
+
+
+def ensure_schema(engine) -> None:
+    """
+    Tạo cột search_vector + index GIN nếu chưa có (Postgres 12+), và bỏ các index
+    B-tree cũ trên cột văn bản của Books. Gọi 1 lần trong lifespan, an toàn khi
+    gọi lại (IF [NOT] EXISTS).
+    """
+    with engine.begin() as conn:
+        for name in LEGACY_TEXT_INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {_quote(name)}"))
+        if conn.dialect.name != "postgresql":
+            return
+        for entity, model in _MODELS.items():
+            table = _quote(model.__tablename__)
+            conn.execute(text(
+                f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+                f"GENERATED ALWAYS AS ({_document_sql(entity)}) STORED"
+            ))
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS {_quote(f'ix_{model.__tablename__}_search_vector')} "
+                f"ON {table} USING gin (search_vector)"
+            ))
+
+
+def tsquery_text(terms: list[str]) -> str:
+    """
+    ['điện', 'tho'] -> "điện & tho:*": từ cuối (đang gõ dở) khớp theo tiền tố nếu
+    dài ít nhất SEARCH_MIN_PREFIX, các từ trước khớp nguyên từ.
+    """
+    last = terms[-1]
+    if len(last) >= settings.SEARCH_MIN_PREFIX:
+        last += ":*"
+    return " & ".join([*terms[:-1], last])
+
+
+def _filter_clauses(db: Session, filters: dict) -> list:
+    category_id = filters.get("category_id")
+    category_paths = None
+    if category_id is not None:
+        category_paths = db.scalars(category_tree.paths_stmt(category_id)).all()
+    return product_clauses(
+        category_paths=category_paths,
+        min_price=filters.get("min_price"), max_price=filters.get("max_price"), in_stock=filters.get("in_stock"),
+    )
+
+
+class PostgresSearchBackend:
+    name = "postgres"
+
+    def search(self, db: Session, entity: str, terms: list[str], filters: dict,
+               limit: int, offset: int, with_facets: bool) -> dict:
+        model = _MODELS[entity]
+        # cột generated không khai báo trong models (ORM không cần đọc nó)
+        vector = literal_column(f"{_quote(model.__tablename__)}.search_vector")
+        # cùng config 'simple' với cột (không stemming: hợp với tiếng Việt)
+        query = func.to_tsquery(literal_column("'simple'"), tsquery_text(terms))
+        clauses = [vector.op("@@")(query)]
+        if entity == "products":
+            clauses += _filter_clauses(db, filters)
+
+        score = func.ts_rank_cd(vector, query).label("score")
+        hits_stmt = (
+            select(model.id, score).where(*clauses)
+            .order_by(score.desc(), model.id).limit(limit).offset(offset)
+        )
+        hits = [(row.id, float(row.score)) for row in db.execute(hits_stmt)]
+        total = db.execute(select(func.count()).select_from(model).where(*clauses)).scalar()
+        facets = self._facets(db, clauses, filters) if with_facets and entity == "products" else {}
+        return {"total": total, "hits": hits, "facets": facets}
+
+    def _facets(self, db: Session, clauses: list, filters: dict) -> dict:
+        # Category: các category con của category đang lọc (hoặc các category gốc),
+        # mỗi cái đếm sản phẩm khớp thuộc CẢ CÂY CON của nó
+        matched = select(Product.id).where(*clauses)
+        link = product_category_table
+        child = aliased(Category)
+        parent_id = filters.get("category_id")
+        count = func.count(distinct(link.c.product_id)).label("count")
+        category_stmt = (
+            select(child.id, child.name, count)
+            .select_from(link)
+            .join(Category, Category.id == link.c.category_id)
+            .join(child, Category.path.startswith(child.path, autoescape=False))
+            .where(link.c.product_id.in_(matched))
+            .where(child.parent_id == parent_id if parent_id is not None else child.parent_id.is_(None))
+            .group_by(child.id, child.name)
+            .order_by(count.desc(), child.id)
+            .limit(settings.SEARCH_FACET_LIMIT)
+        )
+        # giá + kho: 1 câu GROUP BY trên subquery (tránh lặp biểu thức có bind param trong GROUP BY)
+        bucket = case(
+            *[(Product.price < bound, i) for i, bound in enumerate(settings.SEARCH_PRICE_BUCKETS)],
+            else_=len(settings.SEARCH_PRICE_BUCKETS),
+        )
+        keys = select(bucket.label("bucket"), (Product.stock_quantity > 0).label("in_stock")).where(*clauses).subquery()
+        prices: dict[int, int] = {}
+        stock: dict[bool, int] = {}
+        for row in db.execute(select(keys.c.bucket, keys.c.in_stock, func.count()).group_by(keys.c.bucket, keys.c.in_stock)):
+            prices[row[0]] = prices.get(row[0], 0) + row[2]
+            stock[bool(row[1])] = stock.get(bool(row[1]), 0) + row[2]
+        return {
+            "category": _category_facet(db.execute(category_stmt).all()),
+            "price": _price_facet(prices),
+            "stock": _stock_facet(stock),
+        }
+
+
+# ===================================================================
+# --- BACKEND BỘ NHỚ (inverted index) ---
+# ===================================================================
+
+class CategorySnapshot:
+    """id -> (path, name) của mọi category; tải lại khi namespace cache "categories" đổi."""
+
+    def __init__(self, rows):
+        self.path = {cid: path or category_tree.build_path(None, cid) for cid, _, path, _ in rows}
+        self.name = {cid: name for cid, _, _, name in rows}
+
+    def subtree(self, category_id: int) -> set[int]:
+        prefix = self.path.get(category_id)
+        if prefix is None:
+            return set()
+        return {cid for cid, path in self.path.items() if path.startswith(prefix)}
+
+    def facet_targets(self, parent_id: int | None) -> dict[int, int]:
+        """
+        category -> category con TRỰC TIẾP của parent_id (None: category gốc) chứa nó
+        (chính nó hoặc tổ tiên); category nằm ngoài cây con của parent_id không có mặt.
+        """
+        targets = {}
+        for cid, path in self.path.items():
+            ancestors = category_tree.path_ids(path)
+            if parent_id is None:
+                targets[cid] = ancestors[0]
+            elif parent_id in ancestors[:-1]:
+                targets[cid] = ancestors[ancestors.index(parent_id) + 1]
+        return targets
+
+
+class InvertedIndex:
+    """
+    term -> {doc_id: tf có trọng số} cho một loại tài liệu (thread-safe).
+    Lưu kèm thuộc tính để lọc / facet (giá, tồn kho, category_ids) nên tìm kiếm
+    không phải quay lại DB. Cần khoảng vài trăm byte cho mỗi (từ, tài liệu):
+    với catalog hàng triệu dòng hãy dùng backend "postgres".
+    """
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self, entity: str):
+        self.entity = entity
+        self._postings: dict[str, dict[int, float]] = {}
+        self._vocabulary: list[str] = []      # các term đã sắp xếp (để tìm theo tiền tố)
+        self._docs: dict[int, tuple] = {}     # id -> (terms, price, stock, category_ids)
+        self._lengths: dict[int, float] = {}  # id -> độ dài (có trọng số), cho chuẩn hóa BM25
+        self._total_length = 0.0
+        self._dirty: set[int] = set()
+        self._built_at: float | None = None
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    @property
+    def built(self) -> bool:
+        return self._built_at is not None
+
+    # --- Ghi ---
+
+    def _add(self, doc_id: int, fields: dict[str, str | None], price=None, stock=None, category_ids=()):
+        frequencies: dict[str, float] = {}
+        for column, weight in DOCUMENT_FIELDS[self.entity]:
+            for term in tokenize(fields.get(column)):
+                frequencies[term] = frequencies.get(term, 0.0) + FIELD_WEIGHTS[weight]
+        length = sum(frequencies.values())
+        for term, frequency in frequencies.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                if self.built:
+                    # term bị _remove() vẫn nằm trong _vocabulary: không chèn trùng
+                    position = bisect.bisect_left(self._vocabulary, term)
+                    if position == len(self._vocabulary) or self._vocabulary[position] != term:
+                        self._vocabulary.insert(position, term)
+            postings[doc_id] = frequency
+        self._docs[doc_id] = (tuple(frequencies), price, stock, frozenset(category_ids))
+        self._lengths[doc_id] = length
+        self._total_length += length
+
+    def _remove(self, doc_id: int):
+        doc = self._docs.pop(doc_id, None)
+        if doc is None:
+            return
+        for term in doc[0]:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    # giữ term trong _vocabulary (bỏ qua khi mở rộng), dọn khi rebuild
+                    del self._postings[term]
+        self._total_length -= self._lengths.pop(doc_id)
+
+    def load(self, rows, links=()):
+        """Xây lại toàn bộ index. rows: dict có "id" + các cột; links: (doc_id, category_id)."""
+        categories: dict[int, list[int]] = {}
+        for doc_id, category_id in links:
+            categories.setdefault(doc_id, []).append(category_id)
+        with self._lock:
+            self._postings, self._docs, self._lengths, self._total_length = {}, {}, {}, 0.0
+            self._built_at = None
+            for row in rows:
+                self._add(row["id"], row, row.get("price"), row.get("stock_quantity"), categories.get(row["id"], ()))
+            self._vocabulary = sorted(self._postings)
+            self._dirty.clear()
+            self._built_at = time.monotonic()
+
+    def upsert(self, rows, links=(), ids=()):
+        """Cập nhật các tài liệu `ids`: id không có trong `rows` nghĩa là đã bị xóa."""
+        categories: dict[int, list[int]] = {}
+        for doc_id, category_id in links:
+            categories.setdefault(doc_id, []).append(category_id)
+        with self._lock:
+            for doc_id in ids:
+                self._remove(doc_id)
+            for row in rows:
+                self._remove(row["id"])
+                self._add(row["id"], row, row.get("price"), row.get("stock_quantity"), categories.get(row["id"], ()))
+
+    def mark_dirty(self, ids):
+        with self._lock:
+            if self.built:
+                self._dirty.update(ids)
+
+    def take_dirty(self) -> set[int]:
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            return dirty
+
+    def stale(self) -> bool:
+        return not self.built or time.monotonic() - self._built_at > settings.SEARCH_INDEX_MAX_AGE
+
+    # --- Đọc ---
+
+    def _expand(self, term: str, prefix: bool) -> list[tuple[dict, float]]:
+        """Các danh sách posting khớp `term` (nguyên từ: trọng số 1, tiền tố: SEARCH_PREFIX_WEIGHT)."""
+        if not prefix or len(term) < settings.SEARCH_MIN_PREFIX:
+            postings = self._postings.get(term)
+            return [(postings, 1.0)] if postings else []
+        matches = []
+        vocabulary = self._vocabulary
+        i = bisect.bisect_left(vocabulary, term)
+        while i < len(vocabulary) and vocabulary[i].startswith(term):
+            postings = self._postings.get(vocabulary[i])
+            if postings:
+                matches.append((postings, 1.0 if vocabulary[i] == term else settings.SEARCH_PREFIX_WEIGHT))
+                if len(matches) >= settings.SEARCH_MAX_PREFIX_EXPANSIONS:
+                    break
+            i += 1
+        return matches
+
+    def _scores(self, group: list[tuple[dict, float]], candidates: dict | None = None) -> dict[int, float]:
+        """
+        Điểm BM25 của 1 từ truy vấn cho từng tài liệu (từ mở rộng theo tiền tố: lấy
+        điểm cao nhất). `candidates`: chỉ tính cho các tài liệu này.
+        """
+        count = len(self._docs)
+        k1, lengths = self.k1, self._lengths
+        c1 = k1 * (1 - self.b)
+        c2 = k1 * self.b * count / self._total_length if self._total_length else 0.0
+        scores: dict[int, float] = {}
+        for postings, weight in group:
+            factor = weight * (k1 + 1) * math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            if candidates is None:
+                items = postings.items()
+            elif len(postings) <= len(candidates):
+                items = ((d, tf) for d, tf in postings.items() if d in candidates)
+            else:
+                items = ((d, postings[d]) for d in candidates if d in postings)
+            partial = {d: factor * tf / (tf + c1 + c2 * lengths[d]) for d, tf in items}
+            if not scores:
+                scores = partial
+            else:
+                for d, score in partial.items():
+                    if score > scores.get(d, 0.0):
+                        scores[d] = score
+        return scores
+
+    def _matches(self, doc, filters: dict, subtree: set[int] | None) -> bool:
+        _, price, stock, category_ids = doc
+        if subtree is not None and not (category_ids & subtree):
+            return False
+        if filters.get("min_price") is not None and price < filters["min_price"]:
+            return False
+        if filters.get("max_price") is not None and price > filters["max_price"]:
+            return False
+        if filters.get("in_stock") is not None and (stock > 0) != filters["in_stock"]:
+            return False
+        return True
+
+    def search(self, terms: list[str], filters: dict | None = None, limit: int = 20, offset: int = 0,
+               categories: CategorySnapshot | None = None, with_facets: bool = False) -> dict:
+        """Từ cuối khớp theo tiền tố (đang gõ dở), các từ trước khớp nguyên từ; mọi từ đều phải có (AND)."""
+        filters = filters or {}
+        with self._lock:
+            groups = [self._expand(term, prefix=i == len(terms) - 1) for i, term in enumerate(terms)]
+            if not groups or not all(groups):
+                return {"total": 0, "hits": [], "facets": {}}
+            # Bắt đầu từ từ hiếm nhất; các từ sau chỉ tính điểm cho tài liệu còn lại
+            groups.sort(key=lambda group: sum(len(postings) for postings, _ in group))
+            scores = self._scores(groups[0])
+
+            subtree = None
+            if filters.get("category_id") is not None:
+                subtree = categories.subtree(filters["category_id"]) if categories else set()
+            if subtree is not None or any(filters.get(k) is not None for k in ("min_price", "max_price", "in_stock")):
+                docs = self._docs
+                scores = {d: score for d, score in scores.items() if self._matches(docs[d], filters, subtree)}
+
+            for group in groups[1:]:
+                if not scores:
+                    break
+                extra = self._scores(group, scores)
+                scores = {d: score + extra[d] for d, score in scores.items() if d in extra}
+
+            top = heapq.nlargest(limit + offset, scores.items(), key=lambda item: (item[1], -item[0]))
+            facets = self._facets(scores, filters, categories) if with_facets else {}
+            return {"total": len(scores), "hits": top[offset:], "facets": facets}
+
+    def _facets(self, candidates: set[int], filters: dict, categories: CategorySnapshot | None) -> dict:
+        prices: dict[int, int] = {}
+        stock: dict[bool, int] = {}
+        category_counts: dict[int, int] = {}
+        targets = categories.facet_targets(filters.get("category_id")) if categories else {}
+        for doc_id in candidates:
+            _, price, quantity, category_ids = self._docs[doc_id]
+            bucket = price_bucket(price)
+            prices[bucket] = prices.get(bucket, 0) + 1
+            stock[quantity > 0] = stock.get(quantity > 0, 0) + 1
+            # mỗi sản phẩm đếm 1 lần cho mỗi category con chứa nó (trực tiếp hoặc qua con cháu)
+            for target in {targets[c] for c in category_ids if c in targets}:
+                category_counts[target] = category_counts.get(target, 0) + 1
+        top = heapq.nsmallest(settings.SEARCH_FACET_LIMIT, category_counts.items(), key=lambda kv: (-kv[1], kv[0]))
+        return {
+            "category": _category_facet((cid, categories.name[cid], n) for cid, n in top),
+            "price": _price_facet(prices),
+            "stock": _stock_facet(stock),
+        }
+
+
+def _rows_stmt(entity: str, ids=None):
+    model = _MODELS[entity]
+    columns = [model.id] + [getattr(model, column) for column, _ in DOCUMENT_FIELDS[entity]]
+    if entity == "products":
+        columns += [Product.price, Product.stock_quantity]
+    stmt = select(*columns)
+    return stmt.where(model.id.in_(ids)) if ids is not None else stmt
+
+
+def _links_stmt(ids=None):
+    link = product_category_table
+    stmt = select(link.c.product_id, link.c.category_id)
+    return stmt.where(link.c.product_id.in_(ids)) if ids is not None else stmt
+
+
+class MemorySearchBackend:
+    name = "memory"
+
+    def __init__(self):
+        self._categories: CategorySnapshot | None = None
+        self._categories_version: int | None = None
+        self._lock = threading.Lock()
+
+    def _refresh(self, db: Session, index: InvertedIndex):
+        """
+        Index chưa có / quá SEARCH_INDEX_MAX_AGE (để thấy thay đổi của worker khác)
+        -> xây lại toàn bộ; ngược lại chỉ nạp lại các id đã đổi sau lần trước.
+        """
+        with index._lock:
+            if index.stale():
+                rows = db.execute(_rows_stmt(index.entity)).mappings()
+                links = db.execute(_links_stmt()).all() if index.entity == "products" else ()
+                index.load(rows, links)
+                SEARCH_INDEX_REFRESHES.inc(entity=index.entity, kind="full")
+                return
+            dirty = sorted(index.take_dirty())
+            for start in range(0, len(dirty), 1000):
+                ids = dirty[start:start + 1000]
+                rows = db.execute(_rows_stmt(index.entity, ids)).mappings().all()
+                links = db.execute(_links_stmt(ids)).all() if index.entity == "products" else ()
+                index.upsert(rows, links, ids)
+                SEARCH_INDEX_REFRESHES.inc(entity=index.entity, kind="incremental")
+
+    def categories(self, db: Session) -> CategorySnapshot:
+        version = cache.backend.get_counter("ns:categories")
+        with self._lock:
+            if self._categories is None or version != self._categories_version:
+                rows = db.execute(select(Category.id, Category.parent_id, Category.path, Category.name)).all()
+                self._categories, self._categories_version = CategorySnapshot(rows), version
+            return self._categories
+
+    def search(self, db: Session, entity: str, terms: list[str], filters: dict,
+               limit: int, offset: int, with_facets: bool) -> dict:
+        index = indexes[entity]
+        self._refresh(db, index)
+        categories = self.categories(db) if entity == "products" else None
+        return index.search(terms, filters, limit, offset, categories, with_facets and entity == "products")
+
+
+indexes = {entity: InvertedIndex(entity) for entity in _MODELS}
+BACKENDS = {"postgres": PostgresSearchBackend(), "memory": MemorySearchBackend()}
+
+
+def run(db: Session, entity: str, q: str, filters: dict | None = None,
+        limit: int = 20, offset: int = 0, with_facets: bool = True) -> dict:
+    """
+    Tìm `q` trong `entity` ("products" | "books").
+    Trả về {"total", "hits": [(id, score)] (điểm giảm dần), "facets"}.
+    """
+    terms = list(dict.fromkeys(tokenize(q)))
+    if not terms:
+        return {"total": 0, "hits": [], "facets": {}}
+    backend = BACKENDS[backend_name(db)]
+    with SEARCH_SECONDS.time(backend=backend.name, entity=entity):
+        return backend.search(db, entity, terms, filters or {}, limit, offset, with_facets)
+
+
+# ===================================================================
+# --- GIỮ INDEX BỘ NHỚ ĐỒNG BỘ VỚI DB ---
+# ===================================================================
+# Ghi nhận id sản phẩm / sách bị đổi lúc flush (ORM) hoặc qua track() (ghi bằng
+# Core, vd: bulk); chỉ đánh dấu "bẩn" trong index sau khi COMMIT thành công. Lần
+# tìm kiếm kế tiếp sẽ nạp lại đúng các id đó từ DB.
+
+_PENDING_KEY = "search_index_changes"
+_ENTITIES = {model: entity for entity, model in _MODELS.items()}
+
+
+def track(session: Session, entity: str, ids):
+    if entity in indexes:
+        session.info.setdefault(_PENDING_KEY, {}).setdefault(entity, set()).update(ids)
+
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session, flush_context):
+    for obj in chain(session.new, session.dirty, session.deleted):
+        entity = _ENTITIES.get(type(obj))
+        if entity is not None and obj.id is not None:
+            track(session, entity, (obj.id,))
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    for entity, ids in session.info.pop(_PENDING_KEY, {}).items():
+        indexes[entity].mark_dirty(ids)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _after_rollback(session, previous_transaction):
+    # rollback SAVEPOINT (vd: bulk chia đôi lô) không hủy các thay đổi của transaction ngoài
+    if not previous_transaction.nested:
+        session.info.pop(_PENDING_KEY, None)
+
+
+# Tác dụng chính: Tìm kiếm full-text có xếp hạng, lọc và facet (Postgres FTS hoặc index trong bộ nhớ).
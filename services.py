@@ -2,55 +2,119 @@
 # from sqlalchemy.orm import Session
 # from schemas import BookCreate
 # services.py
-from models import Book, User, Category, Product, ProductImage
-from schemas import BookCreate, UserCreate, CategoryCreate, ProductCreate
-from sqlalchemy.orm import Session
+from models import Book, User, Category, Product, ProductImage, ProductListing, ProductRanking, product_category_table
+from schemas import BookCreate, UserCreate, CategoryCreate, ProductCreate, ProductSummary
+from sqlalchemy import select, update, case, insert, delete, or_
+from sqlalchemy.exc import IntegrityError, DataError
+from sqlalchemy.orm import Session, selectinload, joinedload, load_only
 from fastapi import UploadFile, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 import auth # <-- Import file auth mới
+import category_tree
+import filters
+import pagination
+import cache
+import search
+import listing
+import popularity
+import uow
+import principal_cache
 import shutil
 import os
-from PIL import Image # <-- Import thư viện Pillow
+import image_io # <-- Ghi file + Pillow chạy ngoài event loop
+from image_pipeline import pipeline as image_pipeline # <-- Tạo rendition chạy nền
 import secrets # <-- Dùng để tạo tên file ngẫu nhiên, an toàn
+import time
+from datetime import datetime, timezone
+from config import settings
 
 # ... (các import khác)
 
 # --- THÊM CÁC ĐƯỜNG DẪN MỚI ---
 UPLOAD_DIRECTORY_FULL = "static/images/products/full"
-UPLOAD_DIRECTORY_THUMB = "static/images/products/thumbs"
-THUMBNAIL_SIZE = (300, 300) # Kích thước thumbnail (300x300 px)
+THUMBNAIL_SIZE = (300, 300) # Rendition dùng làm thumbnail (300x300 px)
 
 # Tạo các thư mục nếu chúng chưa tồn tại
 os.makedirs(UPLOAD_DIRECTORY_FULL, exist_ok=True)
-os.makedirs(UPLOAD_DIRECTORY_THUMB, exist_ok=True)
 
+# --- CHIẾN LƯỢC EAGER LOADING ---
+# Các relationship trong models.py đều là lazy, nên serialize schemas.Category /
+# schemas.Product sẽ bắn 1 SELECT cho mỗi object (N+1). Các hàm dưới đây tạo
+# loader options để số câu truy vấn chỉ phụ thuộc vào SỐ CẤP, không phụ thuộc
+# vào số lượng bản ghi. Dùng chung cho services.py và async_services.py.
+
+def _loader(strategy: str | None = None):
+    strategy = strategy or settings.EAGER_LOADER
+    if strategy == "joined":
+        return joinedload
+    if strategy == "selectin":
+        return selectinload
+    raise ValueError(f"Unknown loader strategy: {strategy}")
+
+def product_load_options(strategy: str | None = None, parent=None) -> list:
+    """
+    Options để tải sẵn images + categories của Product.
+    `parent`: đường dẫn loader cha (vd: selectinload(Category.products)).
+    """
+    load = _loader(strategy)
+    if parent is None:
+        return [load(Product.images), load(Product.categories)]
+    return [parent.options(load(Product.images), load(Product.categories))]
+
+def category_products_options(strategy: str | None = None) -> list:
+    """
+    Options để tải sẵn products (và images/categories của product) cho các
+    category của cây; children được ghép trong bộ nhớ (category_tree.assemble).
+    """
+    load = _loader(strategy)
+    return [load(Category.products).options(*product_load_options(strategy))]
+
+@cache.invalidates("books")
 def create_book(db: Session, data: BookCreate):
     book_instance = Book(**data.model_dump())
     db.add(book_instance)
-    db.commit()
-    db.refresh(book_instance)
+    uow.commit(db)
     return book_instance
 
-def get_all_book(db: Session):
-    return db.query(Book).all()
+def get_all_book(db: Session, limit: int = 50, cursor: str | None = None,
+                 sort: str = "id", order: str = "asc"):
+    """Lấy sách theo trang (keyset pagination, xem pagination.py)."""
+    stmt = pagination.keyset_paginate(select(Book), Book, sort, order, cursor, limit)
+    return pagination.build_page(db.execute(stmt).scalars().all(), sort, order, limit)
+
+def estimate_total(db: Session, table_name: str) -> int:
+    """Ước lượng số dòng của bảng (không COUNT(*) trên Postgres)."""
+    stmt = pagination.estimate_count_stmt(db.get_bind().dialect.name, table_name)
+    total = db.execute(stmt).scalar()
+    if total is None or total < 0:
+        # bảng chưa từng được ANALYZE -> chưa có thống kê
+        total = db.execute(pagination.estimate_count_stmt("", table_name)).scalar()
+    return total
     
 def get_book(db: Session, book_id: int):
     return db.query(Book).filter(Book.id == book_id).first()
 
+def update_book_stmt(book_id: int, values: dict):
+    """UPDATE ... WHERE id = :id RETURNING * (1 câu, không SELECT trước)."""
+    return update(Book).where(Book.id == book_id).values(**values).returning(Book)
+
+def delete_book_stmt(book_id: int):
+    return delete(Book).where(Book.id == book_id).returning(Book)
+
+@cache.invalidates("books")
 def update_book(db: Session, book: BookCreate, book_id:int):
-    book_queryset = db.query(Book).filter(Book.id==book_id).first()
+    book_queryset = db.execute(update_book_stmt(book_id, book.model_dump())).scalars().first()
     if book_queryset:
-        for key, value in book.model_dump().items():
-            setattr(book_queryset, key, value)
-        db.commit()
-        db.refresh(book_queryset)
+        search.track(db, "books", [book_id])   # ghi bằng câu lệnh, không qua flush
+        uow.commit(db)
     return book_queryset
 
+@cache.invalidates("books")
 def delete_book(db: Session, id: int):
-    book_queryset = db.query(Book).filter(Book.id == id).first()
+    book_queryset = db.execute(delete_book_stmt(id)).scalars().first()
     if book_queryset:
-        db.delete(book_queryset)
-        db.commit()
-        
+        search.track(db, "books", [id])
+        uow.commit(db)
     return book_queryset
 
 # --- THÊM CÁC HÀM CHO Category ---
@@ -59,20 +123,42 @@ UPLOAD_DIRECTORY = "static/images/categories"
 # Tạo thư mục nếu chưa tồn tại
 os.makedirs(UPLOAD_DIRECTORY, exist_ok=True)
 # ==============================
+@cache.invalidates("categories", "products")
 def create_category(db: Session, data: CategoryCreate):
-    category_instance = Category(**data.model_dump())
+    # collection rỗng sẵn: category mới chưa có con / sản phẩm, serialize không cần lazy load
+    category_instance = Category(**data.model_dump(), children=[], products=[])
+    parent_path = _parent_path(db, category_instance.parent_id)
     db.add(category_instance)
-    db.commit()
-    db.refresh(category_instance)
+    # flush để có id, rồi mới tính được path
+    db.flush()
+    category_instance.path = category_tree.build_path(parent_path, category_instance.id)
+    uow.commit(db)
     return category_instance
 
+def _parent_path(db: Session, parent_id: int | None) -> str | None:
+    """Path của category cha (None nếu không có cha); 404 nếu cha không tồn tại."""
+    if parent_id is None:
+        return None
+    parent_path = db.query(Category.path).filter(Category.id == parent_id).scalar()
+    if parent_path is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Parent category not found")
+    return parent_path
+
 # THÊM HÀM NÀY:
-def get_root_categories(db: Session):
+def get_root_categories(db: Session, view: str = "detail"):
     """
     Chỉ lấy các category gốc (không có cha).
-    Các 'children' sẽ được tự động tải nhờ 'relationship'
+    Cả cây được lấy bằng 1 câu SELECT (theo path) rồi ghép 'children' trong bộ nhớ.
+    view="summary": chỉ các cột của CategorySummary (cây dict, không products).
     """
-    return db.query(Category).filter(Category.parent_id == None).all()
+    if view == "summary":
+        return category_tree.assemble_rows(db.execute(category_tree.subtree_rows_stmt()).all())
+    categories = db.execute(category_tree.subtree_stmt()).unique().scalars().all()
+    return category_tree.assemble(categories)
+
+def category_path(db: Session, category_id: int) -> str | None:
+    """Path của category (None nếu không tồn tại); các *_stmt của category_tree nhận path này."""
+    return db.scalar(category_tree.paths_stmt(category_id))
 
 def get_all_category(db: Session):
     return db.query(Category).all()
@@ -80,25 +166,130 @@ def get_all_category(db: Session):
 def get_category(db: Session, category_id: int):
     return db.query(Category).filter(Category.id == category_id).first()
 
+def get_category_tree(db: Session, category_id: int, view: str = "detail"):
+    """Lấy một category kèm toàn bộ cây con (tra path rồi 1 câu SELECT theo path)."""
+    path = category_path(db, category_id)
+    if path is None:
+        return None
+    if view == "summary":
+        rows = db.execute(category_tree.subtree_rows_stmt(path)).all()
+        roots = category_tree.assemble_rows(rows, root_id=category_id)
+        return roots[0] if roots else None
+    categories = db.execute(category_tree.subtree_stmt(path)).unique().scalars().all()
+    roots = category_tree.assemble(categories, root_id=category_id)
+    return roots[0] if roots else None
+
+def get_category_ancestors(db: Session, category_id: int):
+    """Breadcrumb: các tổ tiên từ gốc xuống tới chính category đó."""
+    path = category_path(db, category_id)
+    if path is None:
+        return []
+    return db.execute(category_tree.ancestors_stmt(path)).scalars().all()
+
+def category_products_stmt(path: str, skip: int = 0, limit: int = 10, view: str = "detail"):
+    """SELECT sản phẩm của cả cây category mang `path` (dùng chung cho async)."""
+    if settings.PRODUCT_LISTING_ENABLED:
+        # read model: ảnh + category nằm sẵn trên dòng, không cần tải relationship
+        stmt = select(*listing.columns(PRODUCT_SUMMARY_FIELDS if view == "summary" else None)).where(
+            ProductListing.id.in_(category_tree.descendant_product_ids_stmt(path))
+        ).order_by(ProductListing.id)
+    elif view == "summary":
+        stmt = select(*product_columns(PRODUCT_SUMMARY_FIELDS)).where(
+            Product.id.in_(category_tree.descendant_product_ids_stmt(path))
+        ).order_by(Product.id)
+    else:
+        stmt = category_tree.descendant_products_stmt(path).options(*product_load_options())
+    return stmt.offset(skip).limit(limit)
+
+def get_category_products(db: Session, category_id: int, skip: int = 0, limit: int = 10,
+                          view: str = "detail"):
+    """Sản phẩm thuộc category HOẶC bất kỳ category con cháu nào (có phân trang)."""
+    path = category_path(db, category_id)
+    if path is None:
+        return []
+    result = db.execute(category_products_stmt(path, skip, limit, view))
+    return product_rows(result, PRODUCT_SUMMARY_FIELDS if view == "summary" else None)
+
+def _move_category(db: Session, category: Category, parent_id: int | None):
+    """Đổi cha của category và cập nhật path của cả cây con (1 câu UPDATE)."""
+    parent = db.get(Category, parent_id) if parent_id is not None else None
+    if parent_id is not None and parent is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Parent category not found")
+    parent_path = parent.path if parent else None
+    old_path = category.path
+    new_path = category_tree.build_path(parent_path, category.id)
+    if parent_path is not None and old_path and parent_path.startswith(old_path):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cannot move a category under itself or its descendants"
+        )
+    # gán qua relationship để collection 'children' của cha cũ/mới được đồng bộ
+    category.parent = parent
+    category.path = new_path
+    if old_path and old_path != new_path:
+        db.execute(category_tree.move_subtree_stmt(old_path, new_path))
+
+@cache.invalidates("categories", "products")
 def update_category(db: Session, category: CategoryCreate, category_id: int):
     category_queryset = db.query(Category).filter(Category.id == category_id).first()
     if category_queryset:
-        for key, value in category.model_dump().items():
+        data = category.model_dump()
+        parent_id = data.pop("parent_id", None)
+        for key, value in data.items():
             setattr(category_queryset, key, value)
-        db.commit()
-        db.refresh(category_queryset)
+        if parent_id != category_queryset.parent_id or category_queryset.path is None:
+            _move_category(db, category_queryset, parent_id)
+        uow.commit(db)
     return category_queryset
 
+@cache.invalidates("categories", "products")
 def delete_category(db: Session, category_id: int):
     category_queryset = db.query(Category).filter(Category.id == category_id).first()
     if category_queryset:
+        # Các category con được chuyển lên làm con của cha category bị xóa
+        for child in list(category_queryset.children):
+            _move_category(db, child, category_queryset.parent_id)
         db.delete(category_queryset)
-        db.commit()
+        uow.commit(db)
     return category_queryset
 
+@cache.invalidates("categories", "products")
+def rebuild_category_paths(db: Session) -> int:
+    """
+    Tính lại path cho TẤT CẢ category từ parent_id (dùng khi nâng cấp DB cũ
+    chưa có cột path hoặc khi nghi ngờ chỉ mục bị lệch). Trả về số bản ghi đã sửa.
+    """
+    rows = db.query(Category.id, Category.parent_id, Category.path).all()
+    parent_of = {row.id: row.parent_id for row in rows}
+    paths: dict[int, str] = {}
+
+    def path_of(category_id: int) -> str:
+        chain = []
+        current = category_id
+        while current is not None and current not in paths:
+            if current in chain:
+                raise ValueError(f"Category cycle detected at id={current}")
+            chain.append(current)
+            current = parent_of.get(current)
+        prefix = paths.get(current)
+        for node in reversed(chain):
+            prefix = paths[node] = category_tree.build_path(prefix, node)
+        return paths[category_id]
+
+    changed = [
+        {"id": row.id, "path": path_of(row.id)}
+        for row in rows if path_of(row.id) != row.path
+    ]
+    if changed:
+        db.execute(update(Category), changed)
+        uow.commit(db)
+    return len(changed)
+
+@cache.invalidates("categories", "products")
 async def save_category_image(db: Session, category_id: int, file: UploadFile) -> Category:
     """Lưu ảnh và cập nhật đường dẫn cho category."""
-    db_category = get_category(db, category_id)
+    # Truy vấn DB chạy trong threadpool để không chặn event loop
+    db_category = await run_in_threadpool(get_category, db, category_id)
     if not db_category:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Category not found")
 
@@ -108,26 +299,19 @@ async def save_category_image(db: Session, category_id: int, file: UploadFile) -
     file_name = f"{category_id}_{file.filename}" # Hoặc tạo tên an toàn hơn
     file_path = os.path.join(UPLOAD_DIRECTORY, file_name)
 
-    # Lưu file ảnh
-    try:
-        with open(file_path, "wb") as buffer:
-            # Đọc nội dung file upload theo chunk và ghi vào buffer
-            while content := await file.read(1024): # Đọc 1KB mỗi lần
-                buffer.write(content)
-    except Exception as e:
-        # Xử lý lỗi nếu không lưu được file
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Could not save file: {e}")
-    finally:
-        await file.close() # Đảm bảo file được đóng
+    # Lưu file ảnh (copy trong threadpool với buffer lớn, xem image_io.py)
+    await image_io.save_upload(file, file_path)
 
     # Cập nhật đường dẫn ảnh vào database
     # Lưu đường dẫn tương đối để dễ dàng tạo URL sau này
     relative_path = os.path.join("images", "categories", file_name).replace("\\", "/") # Đảm bảo dùng '/'
-    db_category.image_url = relative_path
-    db.commit()
-    db.refresh(db_category)
 
-    return db_category
+    def _update():
+        db_category.image_url = relative_path
+        uow.commit(db)
+        return db_category
+
+    return await run_in_threadpool(_update)
 
 # --- THÊM CÁC HÀM CHO USER ---
 
@@ -135,11 +319,16 @@ def get_user_by_email(db: Session, email: str) -> User | None:
     """Tìm user bằng email."""
     return db.query(User).filter(User.email == email).first()
 
-def create_user(db: Session, user: UserCreate) -> User:
-    """Tạo user mới (cho chức năng signup)."""
+def create_user(db: Session, user: UserCreate, hashed_password: str | None = None) -> User:
+    """
+    Tạo user mới (cho chức năng signup).
+    `hashed_password`: hash đã tính sẵn (password_hasher, ngoài threadpool);
+    nếu không truyền thì băm ngay tại đây.
+    """
     
     # Băm mật khẩu trước khi lưu
-    hashed_password = auth.get_password_hash(user.password)
+    if hashed_password is None:
+        hashed_password = auth.get_password_hash(user.password)
     
     # Tạo instance User model (chỉ lưu hashed_password)
     db_user = User(
@@ -148,29 +337,220 @@ def create_user(db: Session, user: UserCreate) -> User:
     )
     
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    uow.commit(db)
     return db_user
 
+def update_password_hash_stmt(user_id: int, hashed_password: str):
+    return (
+        update(User).where(User.id == user_id).values(hashed_password=hashed_password)
+        .returning(User.email).execution_options(synchronize_session=False)
+    )
+
+def update_password_hash(db: Session, user_id: int, hashed_password: str):
+    """Lưu hash mới của mật khẩu (rehash-on-login khi tham số bcrypt thay đổi)."""
+    email = db.execute(update_password_hash_stmt(user_id, hashed_password)).scalar()
+    # câu UPDATE không qua ORM events -> tự báo principal_cache xóa user này khi commit
+    principal_cache.track(db, email)
+    uow.commit(db)
+
 
 # ===================================================================
 # --- BẮT ĐẦU CÁC HÀM CHO PRODUCT ---
 # ===================================================================
 
 def get_product(db: Session, product_id: int) -> Product | None:
-    """Lấy một sản phẩm bằng ID."""
-    return db.query(Product).filter(Product.id == product_id).first()
+    """Lấy một sản phẩm bằng ID (kèm images + categories)."""
+    return (
+        db.query(Product)
+        .options(*product_load_options())
+        .filter(Product.id == product_id)
+        .first()
+    )
+
+def get_product_image(db: Session, product_id: int, image_id: int) -> ProductImage | None:
+    """Lấy một ảnh của sản phẩm (để client poll trạng thái xử lý)."""
+    return (
+        db.query(ProductImage)
+        .filter(ProductImage.id == image_id, ProductImage.product_id == product_id)
+        .first()
+    )
 
-def get_all_products(db: Session, skip: int = 0, limit: int = 10):
+def _add_product_views_stmt(counts: dict[int, int]):
+    # view_count = view_count + n: cộng dồn ngay trong DB, không đọc-sửa-ghi
+    return (
+        update(Product)
+        .where(Product.id.in_(list(counts)))
+        .values(view_count=Product.view_count + case(counts, value=Product.id, else_=0))
+        .execution_options(synchronize_session=False)
+    )
+
+def add_product_views(db: Session, counts: dict[int, int]):
+    """
+    Cộng lượt xem cho nhiều sản phẩm bằng 1 câu UPDATE mỗi bảng (Products +
+    ProductListing) và upsert vào bucket giờ / ngày (xem popularity.py).
+    """
+    if counts:
+        db.execute(_add_product_views_stmt(counts))
+        db.execute(listing.add_views_stmt(counts))
+        db.execute(popularity.upsert_views_stmt(db.get_bind().dialect.name), popularity.view_rows(counts))
+        db.commit()
+
+# Trường của ?view=summary (schemas.ProductSummary): toàn cột đơn
+PRODUCT_SUMMARY_FIELDS = tuple(ProductSummary.model_fields)
+
+def product_columns(fields: tuple[str, ...], sort: str = "id") -> list:
+    """Cột cần SELECT cho `fields`: id + cột sắp xếp (cho cursor) + các cột được chọn."""
+    names = ("id", sort, *(f for f in fields if f not in filters.PRODUCT_RELATIONSHIPS))
+    return [getattr(Product, name) for name in dict.fromkeys(names)]
+
+def is_row_projection(fields: tuple[str, ...] | None) -> bool:
+    """
+    True nếu đọc thẳng dòng, không cần ORM object: `fields` không chọn
+    relationship nào, hoặc đọc từ read model (images / categories là cột JSON).
+    """
+    if settings.PRODUCT_LISTING_ENABLED:
+        return True
+    return fields is not None and not filters.PRODUCT_RELATIONSHIPS.intersection(fields)
+
+def product_rows(result, fields: tuple[str, ...] | None) -> list:
+    """
+    Kết quả SELECT sản phẩm -> list để validate theo schema: ORM object, hoặc
+    dict khi là projection chỉ gồm cột (validate từ dict không đi qua thuộc
+    tính ORM nên nhanh hơn nhiều, xem benchmarks/serialization.py).
+    """
+    if is_row_projection(fields):
+        return [row._asdict() for row in result]
+    return result.unique().scalars().all()
+
+def product_projection_options(fields: tuple[str, ...] | None, sort: str = "id") -> list:
+    """
+    Options cho ?fields=: chỉ SELECT các cột được chọn (+ id, cột sắp xếp cho cursor)
+    và chỉ tải images / categories khi được chọn. None = đủ mọi trường.
+    """
+    if fields is None:
+        return product_load_options()
+    load = _loader()
+    options = [load_only(*product_columns(fields, sort))]
+    options += [load(getattr(Product, f)) for f in fields if f in filters.PRODUCT_RELATIONSHIPS]
+    return options
+
+def products_page_stmt(limit: int = 10, cursor: str | None = None, sort: str = "id", order: str = "asc",
+                       fields: tuple[str, ...] | None = None, **filter_args):
+    """SELECT một trang sản phẩm đã lọc (filters.product_clauses) + keyset (dùng chung cho async)."""
+    if settings.PRODUCT_LISTING_ENABLED:
+        # 1 bảng, 1 câu SELECT kể cả khi chọn images / categories (xem listing.py)
+        stmt = select(*listing.columns(fields, sort))
+        stmt = stmt.where(*filters.product_clauses(**filter_args, model=ProductListing))
+        return pagination.keyset_paginate(stmt, ProductListing, sort, order, cursor, limit)
+    if is_row_projection(fields):
+        # chỉ cột đơn: SELECT thẳng các cột, không tạo ORM object / identity map
+        stmt = select(*product_columns(fields, sort))
+    else:
+        stmt = select(Product).options(*product_projection_options(fields, sort))
+    stmt = stmt.where(*filters.product_clauses(**filter_args))
+    return pagination.keyset_paginate(stmt, Product, sort, order, cursor, limit)
+
+def products_page(result, sort: str, order: str, limit: int, fields: tuple[str, ...] | None) -> dict:
+    """Kết quả của products_page_stmt -> {"items", "next_cursor"}."""
+    rows = result.all() if is_row_projection(fields) else result.unique().scalars().all()
+    page = pagination.build_page(rows, sort, order, limit)
+    if is_row_projection(fields):
+        page["items"] = [row._asdict() for row in page["items"]]
+    return page
+
+def get_all_products(db: Session, limit: int = 10, cursor: str | None = None,
+                     sort: str = "id", order: str = "asc", fields: tuple[str, ...] | None = None,
+                     **filter_args):
     """
     Lấy tất cả sản phẩm VỚI PHÂN TRANG.
+    Dùng keyset (cursor) thay cho offset/limit: trang sâu không chậm dần.
+    filter_args: category_ids, min_price, max_price, in_stock, name_prefix (xem filters.py).
+    Trả về {"items": [...], "next_cursor": ...}.
     """
-    # Sửa lại hàm này
-    # return db.query(Product).all() # <-- Bỏ dòng cũ
-    
-    # --- THAY BẰNG DÒNG NÀY ---
-    return db.query(Product).offset(skip).limit(limit).all()
+    category_ids = filter_args.pop("category_ids", None)
+    if category_ids:
+        filter_args["category_paths"] = db.scalars(category_tree.paths_stmt(*category_ids)).all()
+    stmt = products_page_stmt(limit, cursor, sort, order, fields, **filter_args)
+    return products_page(db.execute(stmt), sort, order, limit, fields)
+
+def _search_hits(db: Session, model, hits: list[tuple[int, float]], options=(), columns=None) -> list[dict]:
+    """
+    (id, điểm) -> [{"score", "item"}] giữ đúng thứ tự xếp hạng (1 câu SELECT ... IN).
+    columns: chỉ SELECT các cột này, item là dict thay vì ORM object.
+    """
+    if not hits:
+        return []
+    ids = [item_id for item_id, _ in hits]
+    if columns is not None:
+        rows = db.execute(select(*columns).where(model.id.in_(ids)))
+        items = {row.id: row._asdict() for row in rows}
+    else:
+        stmt = select(model).where(model.id.in_(ids)).options(*options)
+        items = {item.id: item for item in db.execute(stmt).unique().scalars()}
+    return [{"score": score, "item": items[item_id]} for item_id, score in hits if item_id in items]
+
+def search_products(db: Session, q: str, category_id: int | None = None,
+                    min_price: int | None = None, max_price: int | None = None,
+                    in_stock: bool | None = None, limit: int = 20, offset: int = 0,
+                    facets: bool = True, view: str = "detail") -> dict:
+    """
+    Tìm sản phẩm theo từ khóa (khớp cả tiền tố), xếp theo độ liên quan.
+    category_id lọc cả các category con cháu. Xem search.py.
+    """
+    criteria = {"category_id": category_id, "min_price": min_price, "max_price": max_price, "in_stock": in_stock}
+    result = search.run(db, "products", q, criteria, limit, offset, facets)
+    if settings.PRODUCT_LISTING_ENABLED:
+        columns = listing.columns(PRODUCT_SUMMARY_FIELDS if view == "summary" else None)
+        result["hits"] = _search_hits(db, ProductListing, result["hits"], columns=columns)
+    elif view == "summary":
+        result["hits"] = _search_hits(db, Product, result["hits"], columns=product_columns(PRODUCT_SUMMARY_FIELDS))
+    else:
+        result["hits"] = _search_hits(db, Product, result["hits"], product_load_options())
+    return result
+
+def popular_products_stmt(window: str, category_id: int | None = None, limit: int = 20):
+    """
+    SELECT top `limit` của bảng xếp hạng đã tính sẵn (K dòng liên tiếp theo PK)
+    kèm các cột summary của sản phẩm (dùng chung cho async).
+    """
+    if settings.PRODUCT_LISTING_ENABLED:
+        model, columns = ProductListing, listing.columns(PRODUCT_SUMMARY_FIELDS)
+    else:
+        model, columns = Product, product_columns(PRODUCT_SUMMARY_FIELDS)
+    return (
+        select(*columns, ProductRanking.views, ProductRanking.computed_at)
+        .select_from(ProductRanking)
+        .join(model, model.id == ProductRanking.product_id)
+        .where(
+            ProductRanking.period == window,
+            ProductRanking.category_id == (popularity.ALL_CATEGORIES if category_id is None else category_id),
+        )
+        .order_by(ProductRanking.rank)
+        .limit(limit)
+    )
 
+def popular_products(result, window: str, category_id: int | None) -> dict:
+    """Kết quả của popular_products_stmt -> schemas.PopularProducts."""
+    items = [row._asdict() for row in result]
+    # mọi dòng cùng 1 lần tính
+    computed_at = [item.pop("computed_at") for item in items]
+    return {
+        "window": window, "category_id": category_id, "items": items,
+        "computed_at": datetime.fromtimestamp(computed_at[0], timezone.utc) if computed_at else None,
+    }
+
+def get_popular_products(db: Session, window: str, category_id: int | None = None, limit: int = 20) -> dict:
+    """Sản phẩm xem nhiều nhất trong `window` (của category_id, gồm cả category con cháu)."""
+    result = db.execute(popular_products_stmt(window, category_id, limit))
+    return popular_products(result, window, category_id)
+
+def search_books(db: Session, q: str, limit: int = 20, offset: int = 0) -> dict:
+    """Tìm sách theo tiêu đề / tác giả / mô tả."""
+    result = search.run(db, "books", q, None, limit, offset, with_facets=False)
+    result["hits"] = _search_hits(db, Book, result["hits"])
+    return result
+
+@cache.invalidates("products", "categories")
 def create_product(db: Session, data: ProductCreate) -> Product:
     """
     Tạo một sản phẩm mới và liên kết nó với các category.
@@ -184,8 +564,8 @@ def create_product(db: Session, data: ProductCreate) -> Product:
     #    (Vì 'categories' không phải là cột trong bảng Product)
     product_data = data.model_dump(exclude={"categories"})
     
-    # 3. Tạo instance Product
-    product_instance = Product(**product_data)
+    # 3. Tạo instance Product (collection rỗng sẵn: serialize không cần lazy load)
+    product_instance = Product(**product_data, images=[], categories=[])
     
     # 4. Tìm các đối tượng Category từ list ID
     if category_ids:
@@ -200,78 +580,331 @@ def create_product(db: Session, data: ProductCreate) -> Product:
     
     # 6. Lưu sản phẩm vào DB
     db.add(product_instance)
-    db.commit()
-    db.refresh(product_instance)
+    uow.commit(db)
     
     return product_instance
 
 
-def _create_thumbnail(original_path: str, thumb_path: str, size: tuple):
-    """
-    Hàm nội bộ (private) để tạo thumbnail từ ảnh gốc.
-    """
-    try:
-        with Image.open(original_path) as img:
-            img.thumbnail(size) # <-- Phương thức 'thumbnail' của Pillow
-            img.save(thumb_path)
-    except IOError as e:
-        print(f"Không thể tạo thumbnail cho {original_path}. Lỗi: {e}")
-        # Xử lý lỗi (ví dụ: log lại)
-
+@cache.invalidates("products", "categories")
 async def save_product_image(db: Session, product_id: int, file: UploadFile) -> ProductImage:
     """
-    Lưu ảnh cho sản phẩm, tạo thumbnail, và cập nhật thumbnail cho Product
-    nếu đây là ảnh đầu tiên.
+    Lưu ảnh gốc cho sản phẩm và trả về NGAY với status="pending".
+    Các rendition (kích thước / định dạng) được tạo nền bởi image_pipeline;
+    client poll ảnh tới khi status là "ready" hoặc "failed".
     """
     
-    # 1. Kiểm tra sản phẩm có tồn tại không
-    db_product = get_product(db, product_id)
+    # 1. Kiểm tra sản phẩm có tồn tại không (trong threadpool)
+    db_product = await run_in_threadpool(get_product, db, product_id)
     if not db_product:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
 
-    # 2. Tạo tên file ngẫu nhiên và an toàn
+    # 2. Hàng đợi xử lý ảnh đầy -> 503 trước khi ghi gì xuống đĩa
+    image_pipeline.admit()
+
+    # 3. Tạo tên file ngẫu nhiên và an toàn
     #    Ví dụ: 8a3f2b... .jpg
     file_extension = os.path.splitext(file.filename)[1]
     random_hex = secrets.token_hex(16)
     file_name = random_hex + file_extension
     
-    # 3. Định nghĩa các đường dẫn (paths)
+    # 4. Định nghĩa các đường dẫn (paths)
     full_path_on_disk = os.path.join(UPLOAD_DIRECTORY_FULL, file_name)
-    thumb_path_on_disk = os.path.join(UPLOAD_DIRECTORY_THUMB, file_name)
-    
     # Đường dẫn tương đối để lưu vào DB (dùng / thay vì \ )
     relative_path_full = os.path.join("images", "products", "full", file_name).replace("\\", "/")
-    relative_path_thumb = os.path.join("images", "products", "thumbs", file_name).replace("\\", "/")
 
-    # 4. Lưu ảnh gốc (bất đồng bộ)
-    try:
-        with open(full_path_on_disk, "wb") as buffer:
-            while content := await file.read(1024):
-                buffer.write(content)
-    except Exception as e:
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Could not save file: {e}")
-    finally:
-        await file.close()
-
-    # 5. Tạo thumbnail (đồng bộ, vì Pillow không hỗ trợ async)
-    #    Việc này nhanh nên có thể chấp nhận được
-    _create_thumbnail(full_path_on_disk, thumb_path_on_disk, THUMBNAIL_SIZE)
-
-    # 6. Tạo record trong DB cho ảnh mới
-    db_image = ProductImage(
-        image_url=relative_path_full, # Lưu đường dẫn ảnh GỐC
-        product_id=product_id
-    )
-    db.add(db_image)
-    
-    # 7. Cập nhật thumbnail cho Product (nếu chưa có)
-    if not db_product.thumbnail_url:
-        db_product.thumbnail_url = relative_path_thumb # Lưu đường dẫn THUMBNAIL
-    
-    db.commit()
-    db.refresh(db_image)
+    # 5. Lưu ảnh gốc (copy trong threadpool với buffer lớn, xem image_io.py)
+    await image_io.save_upload(file, full_path_on_disk)
+
+    # 6. Tạo record ảnh ở trạng thái pending (trong threadpool)
+    def _attach():
+        db_image = ProductImage(
+            image_url=relative_path_full, # Lưu đường dẫn ảnh GỐC
+            product_id=product_id,
+            status="pending",
+            claimed_at=time.time(), # worker này xử lý (xem image_pipeline._recover)
+        )
+        db.add(db_image)
+        uow.commit(db)
+        return db_image
     
+    db_image = await run_in_threadpool(_attach)
+
+    # 7. Xếp job tạo rendition (không chờ)
+    image_pipeline.submit(db_image.id, db_image.image_url)
     return db_image
 
+def _thumbnail_from(renditions: dict | None) -> str | None:
+    """Chọn rendition làm Product.thumbnail_url (JPEG, gần THUMBNAIL_SIZE nhất)."""
+    if not renditions:
+        return None
+    target = THUMBNAIL_SIZE[0]
+    size = min(renditions, key=lambda s: abs(int(s) - target))
+    formats = renditions[size]
+    return formats.get("jpeg") or next(iter(formats.values()), None)
+
+def finish_image_stmt(image_id: int, status: str, renditions: dict | None):
+    return (
+        update(ProductImage).where(ProductImage.id == image_id)
+        .values(status=status, renditions=renditions).returning(ProductImage)
+    )
+
+def set_thumbnail_stmt(product_id: int, thumbnail_url: str):
+    """Đặt thumbnail cho sản phẩm nếu chưa có (điều kiện nằm trong WHERE, không SELECT trước)."""
+    return (
+        update(Product)
+        .where(Product.id == product_id, or_(Product.thumbnail_url.is_(None), Product.thumbnail_url == ""))
+        .values(thumbnail_url=thumbnail_url)
+    )
+
+@cache.invalidates("products", "categories")
+def finish_product_image(db: Session, image_id: int, status: str, renditions: dict | None) -> ProductImage | None:
+    """
+    Ghi kết quả xử lý nền của ảnh (gọi từ image_pipeline): status, renditions và
+    thumbnail cho Product nếu chưa có.
+    """
+    db_image = db.execute(finish_image_stmt(image_id, status, renditions)).scalars().first()
+    if db_image is None:
+        # Ảnh đã bị xóa trong lúc đang xử lý
+        return None
+    thumbnail_url = _thumbnail_from(renditions)
+    if thumbnail_url:
+        db.execute(set_thumbnail_stmt(db_image.product_id, thumbnail_url)) # Lưu đường dẫn THUMBNAIL
+    listing.track(db, [db_image.product_id])   # ghi bằng câu lệnh, không qua flush
+    uow.commit(db)
+    return db_image
+
+
+# ===================================================================
+# --- GHI HÀNG LOẠT (BULK) ---
+# ===================================================================
+# Mỗi handler nhận 1 LÔ item dạng (index, payload) và KHÔNG commit:
+#   create: payload = schema *Create
+#   update: payload = (id, schema *Update: chỉ các trường được gửi lên)
+#   delete: payload = id
+# và trả về (ok: [(index, id)], errors: [(index, lỗi)]). Thay vì 1 INSERT +
+# COMMIT + SELECT (refresh) cho mỗi item, cả lô dùng executemany:
+# INSERT ... VALUES (...), (...) RETURNING id (insertmanyvalues của SQLAlchemy)
+# và UPDATE theo khóa chính; các dòng của bảng trung gian cũng chèn theo lô.
+
+def _existing_ids(db: Session, model, ids) -> set[int]:
+    if not ids:
+        return set()
+    return set(db.execute(select(model.id).where(model.id.in_(set(ids)))).scalars())
+
+def _insert_returning_ids(db: Session, model, rows: list[dict]) -> list[int]:
+    stmt = insert(model).returning(model.id, sort_by_parameter_order=True)
+    return list(db.execute(stmt, rows).scalars())
+
+def _link_categories(db: Session, links: dict[int, list[int]]):
+    """Chèn theo lô các dòng (product_id, category_id); bỏ qua category không tồn tại
+    (giống create_product)."""
+    existing = _existing_ids(db, Category, [cid for ids in links.values() for cid in ids])
+    rows = [
+        {"product_id": product_id, "category_id": category_id}
+        for product_id, category_ids in links.items()
+        for category_id in dict.fromkeys(category_ids) if category_id in existing
+    ]
+    if rows:
+        db.execute(insert(product_category_table), rows)
+
+def _split_missing(db: Session, model, items):
+    """Tách các item update/delete có id không tồn tại thành lỗi "not found"."""
+    ids = [payload[0] if isinstance(payload, tuple) else payload for _, payload in items]
+    existing = _existing_ids(db, model, ids)
+    found, errors = [], []
+    for (index, payload), item_id in zip(items, ids):
+        if item_id in existing:
+            found.append((index, payload))
+        else:
+            errors.append((index, f"{model.__name__} {item_id} not found"))
+    return found, errors
+
+# --- Book ---
+
+def _bulk_create_books(db: Session, items):
+    ids = _insert_returning_ids(db, Book, [data.model_dump() for _, data in items])
+    return [(index, new_id) for (index, _), new_id in zip(items, ids)], []
+
+def _bulk_update_books(db: Session, items):
+    found, errors = _split_missing(db, Book, items)
+    rows = [
+        {"id": book_id, **fields} for _, (book_id, data) in found
+        if (fields := data.model_dump(exclude_unset=True))
+    ]
+    if rows:
+        db.execute(update(Book), rows)
+    return [(index, book_id) for index, (book_id, _) in found], errors
+
+def _bulk_delete_books(db: Session, items):
+    found, errors = _split_missing(db, Book, items)
+    ids = [book_id for _, book_id in found]
+    if ids:
+        db.execute(delete(Book).where(Book.id.in_(ids)))
+    return found, errors
+
+# --- Product ---
+
+def _bulk_create_products(db: Session, items):
+    rows = [data.model_dump(exclude={"categories"}) for _, data in items]
+    ids = _insert_returning_ids(db, Product, rows)
+    _link_categories(db, {new_id: data.categories for (_, data), new_id in zip(items, ids)})
+    return [(index, new_id) for (index, _), new_id in zip(items, ids)], []
+
+def _bulk_update_products(db: Session, items):
+    found, errors = _split_missing(db, Product, items)
+    rows, links = [], {}
+    for _, (product_id, data) in found:
+        # chỉ ghi các trường client gửi lên (không xóa thumbnail_url, view_count...)
+        fields = data.model_dump(exclude_unset=True, exclude={"categories"})
+        if fields:
+            rows.append({"id": product_id, **fields})
+        if "categories" in data.model_fields_set:
+            links[product_id] = data.categories
+    if rows:
+        db.execute(update(Product), rows)
+    if links:
+        db.execute(
+            delete(product_category_table).where(product_category_table.c.product_id.in_(list(links)))
+        )
+        _link_categories(db, links)
+    return [(index, product_id) for index, (product_id, _) in found], errors
+
+def _bulk_delete_products(db: Session, items):
+    found, errors = _split_missing(db, Product, items)
+    ids = [product_id for _, product_id in found]
+    if ids:
+        # file ảnh trên đĩa được giữ lại; chỉ xóa các dòng tham chiếu tới sản phẩm
+        db.execute(delete(product_category_table).where(product_category_table.c.product_id.in_(ids)))
+        db.execute(delete(ProductImage).where(ProductImage.product_id.in_(ids)))
+        db.execute(delete(Product).where(Product.id.in_(ids)))
+    return found, errors
+
+# --- Category ---
+
+def _bulk_create_categories(db: Session, items):
+    parent_ids = {data.parent_id for _, data in items if data.parent_id is not None}
+    parent_paths = dict(
+        db.execute(select(Category.id, Category.path).where(Category.id.in_(parent_ids))).all()
+    ) if parent_ids else {}
+    valid, errors = [], []
+    for index, data in items:
+        if data.parent_id is not None and data.parent_id not in parent_paths:
+            errors.append((index, "Parent category not found"))
+        else:
+            valid.append((index, data))
+    if not valid:
+        return [], errors
+    ids = _insert_returning_ids(db, Category, [data.model_dump() for _, data in valid])
+    # path cần id vừa sinh -> UPDATE theo lô ngay sau INSERT
+    db.execute(update(Category), [
+        {"id": new_id, "path": category_tree.build_path(parent_paths.get(data.parent_id), new_id)}
+        for (_, data), new_id in zip(valid, ids)
+    ])
+    return [(index, new_id) for (index, _), new_id in zip(valid, ids)], errors
+
+def _bulk_update_categories(db: Session, items):
+    # Đổi cha phải ghi lại path của cả cây con -> đi qua ORM từng category
+    found, errors = _split_missing(db, Category, items)
+    categories = {c.id: c for c in db.query(Category).filter(Category.id.in_([p[0] for _, p in found]))}
+    ok = []
+    for index, (category_id, data) in found:
+        category = categories[category_id]
+        try:
+            if "name" in data.model_fields_set:
+                category.name = data.name
+            parent_id = data.parent_id if "parent_id" in data.model_fields_set else category.parent_id
+            if parent_id != category.parent_id or category.path is None:
+                _move_category(db, category, parent_id)
+            db.flush()
+        except HTTPException as e:
+            errors.append((index, e.detail))
+            continue
+        ok.append((index, category_id))
+    return ok, errors
+
+def _bulk_delete_categories(db: Session, items):
+    found, errors = _split_missing(db, Category, items)
+    deleted = {c.id: c for c in db.query(Category).filter(Category.id.in_([i for _, i in found]))}
+
+    def surviving_parent(category: Category) -> int | None:
+        parent_id = category.parent_id
+        while parent_id in deleted:
+            parent_id = deleted[parent_id].parent_id
+        return parent_id
+
+    for category in deleted.values():
+        # giống delete_category: con được chuyển lên làm con của tổ tiên gần nhất còn lại
+        for child in list(category.children):
+            if child.id not in deleted:
+                _move_category(db, child, surviving_parent(category))
+                # UPDATE path của cây con không đồng bộ các object đã nạp -> nạp lại
+                db.flush()
+                db.expire_all()
+    for category in deleted.values():
+        db.delete(category)
+    db.flush()
+    return found, errors
+
+_BULK_HANDLERS = {
+    ("books", "create"): _bulk_create_books,
+    ("books", "update"): _bulk_update_books,
+    ("books", "delete"): _bulk_delete_books,
+    ("products", "create"): _bulk_create_products,
+    ("products", "update"): _bulk_update_products,
+    ("products", "delete"): _bulk_delete_products,
+    ("categories", "create"): _bulk_create_categories,
+    ("categories", "update"): _bulk_update_categories,
+    ("categories", "delete"): _bulk_delete_categories,
+}
+
+# Namespace cache bị ảnh hưởng khi ghi từng loại
+BULK_CACHE_NAMESPACES = {
+    "books": ("books",),
+    "products": ("products", "categories"),
+    "categories": ("categories", "products"),
+}
+
+def _bulk_apply(db: Session, handler, items: list):
+    """
+    Chạy handler cho cả lô trong 1 SAVEPOINT. Nếu DB từ chối (vd: trùng tên
+    unique, sai kiểu) thì chia đôi lô và thử lại từng nửa, tới khi cô lập được item lỗi:
+    k item lỗi trong lô n item chỉ tốn khoảng k*log2(n) lần thử thay vì n.
+    """
+    try:
+        with db.begin_nested():
+            return handler(db, items)
+    except (IntegrityError, DataError) as e:
+        # chỉ lỗi do DỮ LIỆU của item mới được cô lập; lỗi kết nối / lock -> raise
+        if len(items) == 1:
+            return [], [(items[0][0], str(getattr(e, "orig", e)).splitlines()[0])]
+    middle = len(items) // 2
+    ok_left, errors_left = _bulk_apply(db, handler, items[:middle])
+    ok_right, errors_right = _bulk_apply(db, handler, items[middle:])
+    return ok_left + ok_right, errors_left + errors_right
+
+def bulk_write(db: Session, entity: str, op: str, items: list, commit: bool = True) -> dict:
+    """
+    Ghi 1 lô item (lỗi của từng item được trả về, không làm hỏng cả lô).
+    commit=False: để transaction mở cho các lô sau (chế độ transaction="all").
+    """
+    ok, errors = _bulk_apply(db, _BULK_HANDLERS[(entity, op)], items)
+    # ghi bằng Core không qua ORM events -> báo cho index tìm kiếm trong bộ nhớ
+    search.track(db, entity, [item_id for _, item_id in ok])
+    if entity == "products":
+        # ... và cho read model ProductListing (tính lại khi commit)
+        listing.track(db, [item_id for _, item_id in ok])
+    if commit:
+        db.commit()
+        cache.invalidate(*BULK_CACHE_NAMESPACES[entity])
+    return {"ok": ok, "errors": errors}
+
+def bulk_finish(db: Session, entity: str, commit: bool):
+    """Kết thúc chế độ transaction="all": commit tất cả hoặc rollback tất cả."""
+    if commit:
+        db.commit()
+        cache.invalidate(*BULK_CACHE_NAMESPACES[entity])
+    else:
+        db.rollback()
+
 
 # Tác dụng chính: Chứa logic nghiệp vụ (business logic) hay còn gọi là các hàm CRUD (Create, Read, Update, Delete).
\ No newline at end of file
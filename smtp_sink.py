@@ -0,0 +1,182 @@
+# smtp_sink.py
+# SMTP server giả lập chạy local (asyncio, không cần thư viện ngoài): nhận
+# email và giữ trong bộ nhớ thay vì gửi đi. Dùng khi phát triển / kiểm thử
+# mailer.py mà không cần tài khoản SMTP thật:
+#
+#   python -m smtp_sink --port 1025
+#   MAIL_SERVER=127.0.0.1 MAIL_PORT=1025 MAIL_STARTTLS=false MAIL_USE_CREDENTIALS=false uvicorn main:app
+#
+# hoặc trong code:
+#
+#   async with SMTPSink() as sink:       # cổng ngẫu nhiên: sink.port
+#       ...
+#       sink.messages, sink.connections
+#
+# Giả lập lỗi theo địa chỉ người nhận: "reject...@" -> 550 (lỗi vĩnh viễn),
+# "tempfail...@" -> 451 ở lần đầu rồi nhận ở lần sau (để thử retry),
+# "closing...@" -> 421 và đóng phiên ở lần đầu (server sắp tắt) rồi nhận ở lần sau.
+import argparse
+import asyncio
+import email
+import email.policy
+from dataclasses import dataclass
+from email.message import EmailMessage
+
+
+@dataclass
+class ReceivedMessage:
+    sender: str
+    recipients: list[str]
+    data: bytes
+
+    @property
+    def message(self) -> EmailMessage:
+        """Parse khi cần (parse mọi email làm sink chậm khi thử tải)."""
+        return email.message_from_bytes(self.data, policy=email.policy.default)
+
+
+def _address(argument: str) -> str:
+    """'FROM:<a@b.c> SIZE=123' -> 'a@b.c'."""
+    value = argument.split(":", 1)[1].strip() if ":" in argument else argument
+    return value.split(" ", 1)[0].strip("<>")
+
+
+class SMTPSink:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, verbose: bool = False):
+        self.host = host
+        self.port = port
+        self.verbose = verbose
+        self.messages: list[ReceivedMessage] = []
+        self.connections = 0          # số phiên SMTP đã mở (kiểm tra connection pool)
+        self._tempfailed: set[str] = set()
+        self._writers: set[asyncio.StreamWriter] = set()
+        self._server: asyncio.AbstractServer | None = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        """Ngừng nhận kết nối mới và ngắt các phiên đang mở (giả lập server bị tắt)."""
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._writers):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    def _check_recipient(self, address: str) -> str:
+        local = address.split("@", 1)[0].lower()
+        if local.startswith("reject"):
+            return "550 5.1.1 Mailbox unavailable"
+        if local.startswith("tempfail") and address not in self._tempfailed:
+            self._tempfailed.add(address)
+            return "451 4.3.0 Try again later"
+        if local.startswith("closing") and address not in self._tempfailed:
+            self._tempfailed.add(address)
+            return "421 4.3.2 Service shutting down"
+        return "250 2.1.5 OK"
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        self._writers.add(writer)
+
+        def reply(*lines: str):
+            writer.write("".join(line + "\r\n" for line in lines).encode())
+
+        sender, recipients = None, []
+        reply("220 localhost smtp-sink ready")
+        try:
+            while True:
+                await writer.drain()
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode("utf-8", "replace").rstrip("\r\n")
+                verb, _, argument = command.partition(" ")
+                verb = verb.upper()
+                if verb == "EHLO":
+                    reply("250-localhost", "250-PIPELINING", "250-8BITMIME", "250 SMTPUTF8")
+                elif verb == "HELO":
+                    reply("250 localhost")
+                elif verb == "MAIL":
+                    sender, recipients = _address(argument), []
+                    reply("250 2.1.0 OK")
+                elif verb == "RCPT":
+                    address = _address(argument)
+                    response = self._check_recipient(address)
+                    if response.startswith("250"):
+                        recipients.append(address)
+                    reply(response)
+                    if response.startswith("421"):
+                        await writer.drain()
+                        break
+                elif verb == "DATA":
+                    if sender is None or not recipients:
+                        reply("503 5.5.1 Bad sequence of commands")
+                        continue
+                    reply("354 End data with <CR><LF>.<CR><LF>")
+                    await writer.drain()
+                    data = bytearray()
+                    while True:
+                        chunk = await reader.readline()
+                        if not chunk or chunk in (b".\r\n", b".\n"):
+                            break
+                        data += chunk[1:] if chunk.startswith(b"..") else chunk
+                    received = ReceivedMessage(sender, recipients, bytes(data))
+                    self.messages.append(received)
+                    if self.verbose:
+                        print(f"{sender} -> {', '.join(recipients)}: {received.message['Subject']} ({len(data)} bytes)")
+                    sender, recipients = None, []
+                    reply("250 2.0.0 OK: queued")
+                elif verb == "RSET":
+                    sender, recipients = None, []
+                    reply("250 2.0.0 OK")
+                elif verb == "NOOP":
+                    reply("250 2.0.0 OK")
+                elif verb == "QUIT":
+                    reply("221 2.0.0 Bye")
+                    await writer.drain()
+                    break
+                else:
+                    reply("502 5.5.2 Command not implemented")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+
+async def _serve(host: str, port: int):
+    sink = SMTPSink(host, port, verbose=True)
+    await sink.start()
+    print(f"SMTP sink đang chạy tại {sink.host}:{sink.port} (Ctrl+C để dừng)")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await sink.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SMTP server giả lập (không gửi email đi)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    args = parser.parse_args()
+    try:
+        asyncio.run(_serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
+
+
+# Tác dụng chính: SMTP server giả lập trong bộ nhớ để phát triển / kiểm thử việc gửi email.
@@ -0,0 +1,60 @@
+# tests/conftest.py
+# Cấu hình chung cho test: SQLite tạm (sync), tắt cache / scheduler để số câu
+# SQL của mỗi request là số thật. Biến môi trường phải được đặt TRƯỚC khi
+# import config (settings đọc lúc import).
+import os
+import sys
+import tempfile
+
+import pytest
+
+_WORKDIR = tempfile.mkdtemp(prefix="book_fastapi_tests_")
+_DB_PATH = os.path.join(_WORKDIR, "test.db")
+
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{_DB_PATH}",
+    "ASYNC_DATABASE_URL": f"sqlite+aiosqlite:///{_DB_PATH}",
+    "USE_ASYNC_DB": "false",
+    "CACHE_ENABLED": "false",
+    "SCHEDULER_MODE": "off",
+    # lượt xem chỉ ghi xuống DB khi tắt ứng dụng, không chen vào lúc đếm câu SQL
+    "VIEW_COUNT_FLUSH_INTERVAL": "3600",
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def logged_in(client):
+    """Bỏ qua xác thực JWT cho các endpoint cần đăng nhập (user giả)."""
+    import auth
+    import main
+    import schemas
+
+    user = schemas.User(id=1, email="test@example.com")
+    main.app.dependency_overrides[auth.get_current_user] = lambda: user
+    yield user
+    main.app.dependency_overrides.pop(auth.get_current_user, None)
+
+
+@pytest.fixture
+def seed_catalog(client):
+    """seed_catalog(products=..., categories=..., depth=...): ghi lại catalog (xóa dữ liệu cũ)."""
+    from benchmarks import seed
+    from db import SessionLocal
+
+    def _seed(**sizes):
+        sizes.setdefault("books", 0)
+        return seed.seed(SessionLocal, reset=True, **sizes)
+    return _seed
+
+
+# Tác dụng chính: Fixture dùng chung cho test (app trên SQLite tạm, seed catalog).
@@ -0,0 +1,85 @@
+# tests/support.py
+# Công cụ dùng chung cho các test: đếm số câu SQL của một khối code, xem
+# kế hoạch thực thi (EXPLAIN) của một câu SELECT.
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+import db
+
+
+class QueryCounter:
+    """Kết quả của count_queries(): số câu SQL và nội dung từng câu."""
+    def __init__(self):
+        self.statements: list[str] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+
+@contextmanager
+def count_queries(bind=None, max_queries: int | None = None):
+    """
+    Đếm số câu SQL chạy trên engine trong khối `with`.
+    Nếu truyền `max_queries` thì raise AssertionError khi vượt quá
+    (dùng để kiểm tra một endpoint không bị N+1):
+
+        with count_queries(max_queries=10) as counter:
+            client.get("/categories/")
+    """
+    target = bind if bind is not None else db.engine
+    if isinstance(target, type(db.async_engine)):
+        target = target.sync_engine
+    counter = QueryCounter()
+
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        counter.statements.append(statement)
+
+    event.listen(target, "before_cursor_execute", _before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(target, "before_cursor_execute", _before_cursor_execute)
+    if max_queries is not None and counter.count > max_queries:
+        raise AssertionError(
+            f"Expected at most {max_queries} queries, got {counter.count}:\n" + "\n".join(counter.statements)
+        )
+
+
+def explain(stmt, bind=None) -> str:
+    """
+    Kế hoạch thực thi (EXPLAIN) của câu SELECT `stmt`, dạng text.
+    Postgres: tắt seq scan trong transaction để bảng ít dữ liệu (dev / CI) vẫn cho
+    thấy planner CÓ THỂ dùng index nào; SQLite: EXPLAIN QUERY PLAN.
+    """
+    target = bind if bind is not None else db.engine
+    if isinstance(target, type(db.async_engine)):
+        target = target.sync_engine
+    sql = str(stmt.compile(dialect=target.dialect, compile_kwargs={"literal_binds": True}))
+    with target.connect() as conn:
+        if target.dialect.name == "postgresql":
+            conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+            rows = conn.exec_driver_sql("EXPLAIN " + sql).all()
+            plan = "\n".join(row[0] for row in rows)
+        else:
+            rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql).all()
+            plan = "\n".join(str(row[-1]) for row in rows)
+        conn.rollback()
+    return plan
+
+
+def assert_uses_index(stmt, *index_names: str, bind=None) -> str:
+    """
+    Raise AssertionError nếu kế hoạch của `stmt` không dùng index nào trong
+    `index_names` (kiểm tra một access path có index phục vụ):
+
+        assert_uses_index(services.products_page_stmt(sort="price"), "ix_Products_price_id")
+    """
+    plan = explain(stmt, bind)
+    if not any(name in plan for name in index_names):
+        raise AssertionError(f"Expected one of {', '.join(index_names)} in plan:\n{plan}")
+    return plan
+
+
+# Tác dụng chính: Công cụ hỗ trợ test (đếm câu SQL để phát hiện N+1, kiểm tra index bằng EXPLAIN).
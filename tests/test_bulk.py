@@ -0,0 +1,38 @@
+# tests/test_bulk.py
+# PUT /bulk/{entity}: cập nhật một phần, chỉ các trường được gửi lên bị ghi.
+
+
+def test_partial_product_update(client, seed_catalog, logged_in):
+    seed_catalog(products=3, categories=2, depth=1)
+    before = client.get("/products/1").json()
+    response = client.put("/bulk/products", json=[{"id": 1, "price": 999}])
+    assert response.status_code == 200
+    assert response.json()["succeeded"] == 1, response.json()
+    after = client.get("/products/1").json()
+    assert after["price"] == 999
+    assert {k: v for k, v in after.items() if k not in ("price", "view_count")} == \
+        {k: v for k, v in before.items() if k not in ("price", "view_count")}
+
+
+def test_partial_book_update(client, seed_catalog, logged_in):
+    seed_catalog(books=2, products=0, categories=0)
+    before = client.get("/books/1").json()
+    response = client.put("/bulk/books", json=[{"id": 1, "year": 2001}])
+    assert response.json()["succeeded"] == 1, response.json()
+    assert client.get("/books/1").json() == {**before, "year": 2001}
+
+
+def test_partial_category_update_keeps_parent(client, seed_catalog, logged_in):
+    seed_catalog(products=0, categories=4, depth=2)
+    before = client.get("/categories/3").json()
+    response = client.put("/bulk/categories", json=[{"id": 3, "name": "renamed"}])
+    assert response.json()["succeeded"] == 1, response.json()
+    after = client.get("/categories/3").json()
+    assert after["name"] == "renamed" and after["parent_id"] == before["parent_id"]
+
+
+def test_explicit_null_for_required_field_is_rejected(client, seed_catalog, logged_in):
+    seed_catalog(products=1, categories=1, depth=1)
+    response = client.put("/bulk/products", json=[{"id": 1, "price": None}])
+    body = response.json()
+    assert body["succeeded"] == 0 and body["errors"][0]["index"] == 0
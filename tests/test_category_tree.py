@@ -0,0 +1,87 @@
+# tests/test_category_tree.py
+# Các truy vấn theo materialized path (category_tree.py): cây con, breadcrumb,
+# sản phẩm của cả cây và bộ lọc ?category_ids= khớp với cây tính trong Python.
+import pytest
+from sqlalchemy import select
+
+SIZES = dict(products=40, categories=12, depth=3, images=0, categories_per_product=2)
+
+
+@pytest.fixture
+def catalog(client, seed_catalog):
+    """Seed catalog; trả về (parent_of, products_of) đọc thẳng từ DB."""
+    from db import SessionLocal
+    from models import Category, product_category_table
+
+    seed_catalog(**SIZES)
+    with SessionLocal() as db:
+        parent_of = dict(db.execute(select(Category.id, Category.parent_id)).all())
+        products_of: dict[int, set[int]] = {}
+        for product_id, category_id in db.execute(
+            select(product_category_table.c.product_id, product_category_table.c.category_id)
+        ):
+            products_of.setdefault(category_id, set()).add(product_id)
+    return parent_of, products_of
+
+
+def _subtree(parent_of: dict, root: int) -> set[int]:
+    found = {root}
+    while True:
+        more = {c for c, p in parent_of.items() if p in found} - found
+        if not more:
+            return found
+        found |= more
+
+
+def _deepest(parent_of: dict) -> int:
+    def depth(c):
+        return 0 if parent_of[c] is None else 1 + depth(parent_of[c])
+    return max(parent_of, key=depth)
+
+
+def test_subtree(client, catalog):
+    parent_of, _ = catalog
+    root = next(c for c, p in parent_of.items() if p is None)
+
+    def ids(node):
+        return {node["id"]} | {i for child in node["children"] for i in ids(child)}
+
+    response = client.get(f"/categories/{root}", params={"view": "summary"})
+    assert response.status_code == 200, response.text
+    assert ids(response.json()) == _subtree(parent_of, root)
+    assert client.get("/categories/999999").status_code == 404
+
+
+def test_ancestors(client, catalog):
+    parent_of, _ = catalog
+    leaf = _deepest(parent_of)
+    expected = [leaf]
+    while parent_of[expected[0]] is not None:
+        expected.insert(0, parent_of[expected[0]])
+    assert len(expected) > 1
+
+    response = client.get(f"/categories/{leaf}/ancestors")
+    assert response.status_code == 200, response.text
+    assert [c["id"] for c in response.json()] == expected
+
+
+def test_products_of_subtree(client, catalog):
+    parent_of, products_of = catalog
+    root = next(c for c, p in parent_of.items() if p is None)
+    expected = set().union(*(products_of.get(c, set()) for c in _subtree(parent_of, root)))
+    assert expected
+
+    response = client.get(f"/categories/{root}/products", params={"limit": 100})
+    assert response.status_code == 200, response.text
+    assert {p["id"] for p in response.json()} == expected
+
+    response = client.get("/products/", params={"category_ids": [root, 999999], "limit": 100, "fields": "name"})
+    assert response.status_code == 200, response.text
+    assert {p["id"] for p in response.json()["items"]} == expected
+
+    response = client.get("/products/", params={"category_ids": [999999], "fields": "name"})
+    assert response.status_code == 200, response.text
+    assert response.json()["items"] == []
+
+
+# Tác dụng chính: Kiểm tra cây con / breadcrumb / sản phẩm của cả cây theo materialized path.
@@ -0,0 +1,78 @@
+# tests/test_export.py
+# GET /export/{entity} (export.py): CSV / NDJSON theo stream nhiều lô, category_ids,
+# trường lạ -> 400, gzip giải nén được.
+import csv
+import gzip
+import io
+import json
+
+import pytest
+from sqlalchemy import select
+
+from config import settings
+
+SIZES = dict(products=10, categories=4, depth=2, images=0, categories_per_product=2)
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    # nhiều lô cho mỗi lần xuất: tiêu đề CSV chỉ 1 lần, category_ids ghép đúng từng lô
+    monkeypatch.setattr(settings, "EXPORT_CHUNK_SIZE", 3)
+
+
+def _category_ids() -> dict[int, list[int]]:
+    from db import SessionLocal
+    from models import Product, product_category_table as link
+
+    with SessionLocal() as db:
+        expected = {product_id: [] for product_id in db.scalars(select(Product.id))}
+        for product_id, category_id in db.execute(select(link.c.product_id, link.c.category_id)):
+            expected[product_id].append(category_id)
+    return {product_id: sorted(ids) for product_id, ids in expected.items()}
+
+
+def test_csv_of_empty_table_has_header(client, seed_catalog):
+    seed_catalog(products=0, categories=0)
+    response = client.get("/export/products", params={"format": "csv", "fields": "id,name", "gzip": False})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.text == "id,name\r\n"
+
+
+def test_ndjson_category_ids(client, seed_catalog, small_chunks):
+    seed_catalog(**SIZES)
+    response = client.get("/export/products", params={"fields": "id,category_ids", "gzip": False})
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert {row["id"]: row["category_ids"] for row in rows} == _category_ids()
+
+
+def test_csv_category_ids(client, seed_catalog, small_chunks):
+    seed_catalog(**SIZES)
+    response = client.get("/export/products", params={"format": "csv", "fields": "name,category_ids", "gzip": False})
+    assert response.status_code == 200
+    header, *rows = list(csv.reader(io.StringIO(response.text)))
+    assert header == ["name", "category_ids"]
+    expected = _category_ids()
+    assert len(rows) == len(expected)
+    # không chọn id: id chỉ dùng để ghép category_ids, không xuất ra
+    assert sorted(row[1] for row in rows) == sorted(" ".join(map(str, ids)) for ids in expected.values())
+
+
+def test_unknown_field_is_rejected(client):
+    response = client.get("/export/products", params={"fields": "id,password"})
+    assert response.status_code == 400
+    assert "password" in response.json()["detail"]
+
+
+def test_gzip_output_decompresses(client, seed_catalog, small_chunks):
+    seed_catalog(**SIZES)
+    params = {"format": "csv", "fields": "id,name,category_ids"}
+    plain = client.get("/export/products", params={**params, "gzip": False}).content
+    with client.stream("GET", "/export/products", params={**params, "gzip": True}) as response:
+        assert response.headers["content-encoding"] == "gzip"
+        raw = b"".join(response.iter_raw())
+    assert raw != plain and gzip.decompress(raw) == plain
+
+
+# Tác dụng chính: Kiểm tra xuất catalog theo stream (CSV / NDJSON, category_ids, gzip).
@@ -0,0 +1,60 @@
+# tests/test_image_pipeline.py
+# Khởi động nhiều worker cùng lúc: mỗi ảnh pending chỉ được đúng 1 worker nhận;
+# ảnh chưa xử lý xong khi dừng được trả lại để lần khởi động sau nhận ngay.
+import asyncio
+import time
+
+from sqlalchemy import insert, select
+
+from image_pipeline import ImagePipeline
+
+
+def test_recover_claims_each_pending_image_once(client, seed_catalog):
+    from db import SessionLocal
+    from models import ProductImage
+
+    seed_catalog(products=2, categories=1, depth=1, images=0)
+    with SessionLocal() as db:
+        db.execute(insert(ProductImage), [
+            {"product_id": 1, "image_url": f"images/products/full/{i}.jpg", "status": "pending",
+             "claimed_at": claimed_at}
+            for i, claimed_at in enumerate([None, None, time.time() - 3600, time.time()])
+        ])
+        db.commit()
+
+    workers = [ImagePipeline() for _ in range(3)]
+
+    async def recover_all():
+        return await asyncio.gather(*(worker._recover() for worker in workers))
+
+    recovered = asyncio.run(recover_all())
+    # 2 chưa ai nhận + 1 đã quá IMAGE_CLAIM_TIMEOUT; ảnh vừa được nhận thì không
+    assert sum(recovered) == 3
+    queued = [job.image_url for worker in workers for job in worker._get_queue()._queue]
+    assert len(queued) == len(set(queued)) == 3
+
+
+def test_stop_releases_unfinished_images(client, seed_catalog):
+    from db import SessionLocal
+    from models import ProductImage
+
+    seed_catalog(products=1, categories=1, depth=1, images=0)
+    with SessionLocal() as db:
+        image_ids = db.scalars(insert(ProductImage).returning(ProductImage.id), [
+            {"product_id": 1, "image_url": f"images/products/full/{i}.jpg", "status": "pending",
+             "claimed_at": time.time()}
+            for i in range(2)
+        ]).all()
+        db.commit()
+
+    worker = ImagePipeline()
+    queued, in_flight = image_ids
+    worker.submit(queued, "images/products/full/0.jpg")
+    worker._in_flight.add(in_flight)
+    asyncio.run(worker.stop())
+
+    with SessionLocal() as db:
+        claimed = db.scalars(select(ProductImage.claimed_at).where(ProductImage.id.in_(image_ids))).all()
+    assert claimed == [None, None]
+    # khởi động lại ngay (chưa quá IMAGE_CLAIM_TIMEOUT) vẫn nhận lại cả 2 ảnh
+    assert asyncio.run(ImagePipeline()._recover()) == 2
@@ -0,0 +1,50 @@
+# tests/test_indexes.py
+# Kiểm tra bằng EXPLAIN rằng mỗi cách lọc / sắp xếp của GET /products/ được một
+# index phục vụ (xem filters.py, models.Product.__table_args__ và
+# models.ProductListing). Chạy trên Postgres thật: TEST_POSTGRES_URL (mặc định
+# là DATABASE_URL mặc định của config); bỏ qua nếu không kết nối được.
+import os
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+
+from config import Settings, settings
+from tests.support import assert_uses_index
+
+# (tên, tham số của services.products_page_stmt, index mong đợi)
+# {table}: bảng mà danh sách đọc (Products hoặc ProductListing)
+CASES = [
+    ("sort=price", dict(sort="price"), ("ix_{table}_price_id",)),
+    ("sort=price&order=desc", dict(sort="price", order="desc"), ("ix_{table}_price_id",)),
+    ("sort=view_count&order=desc", dict(sort="view_count", order="desc"), ("ix_{table}_view_count_id",)),
+    ("in_stock=true&sort=price", dict(sort="price", in_stock=True), ("ix_{table}_in_stock_price",)),
+    # category_ids=1: services tra path của category 1 rồi lọc theo prefix hằng số
+    ("category_ids=1", dict(category_paths=["/1/"]), ("ix_middleTableProductCategory_category",)),
+    ("category_ids=1 (cây con)", dict(category_paths=["/1/"]), ("ix_Categories_path",)),
+    ("name_prefix=ab", dict(name_prefix="ab"), ("ix_{table}_name_lower",)),
+]
+
+
+@pytest.fixture(scope="module")
+def postgres_engine():
+    url = os.environ.get("TEST_POSTGRES_URL", Settings.model_fields["DATABASE_URL"].default)
+    engine = create_engine(url)
+    try:
+        with engine.connect():
+            pass
+    except OperationalError as e:
+        engine.dispose()
+        pytest.skip(f"Postgres không khả dụng ({url}): {e.orig}")
+    from models import Base
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+@pytest.mark.parametrize("name, args, indexes", CASES, ids=[case[0] for case in CASES])
+def test_products_access_path_uses_index(postgres_engine, name, args, indexes):
+    import services
+    table = "ProductListing" if settings.PRODUCT_LISTING_ENABLED else "Products"
+    stmt = services.products_page_stmt(limit=20, fields=("id", "name", "price"), **args)
+    assert_uses_index(stmt, *(index.format(table=table) for index in indexes), bind=postgres_engine)
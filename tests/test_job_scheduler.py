@@ -0,0 +1,31 @@
+# tests/test_job_scheduler.py
+# Lease bầu leader: hết hạn theo đồng hồ của DB, không theo đồng hồ của từng worker.
+import time
+
+from sqlalchemy import delete, update
+
+from job_scheduler import LeaderLease
+
+
+def test_lease_expiry_uses_database_clock(client, monkeypatch):
+    from db import engine
+    from models import SchedulerLease
+
+    first, second = LeaderLease(engine, "test"), LeaderLease(engine, "test")
+    first.ensure()
+    try:
+        assert first.try_acquire()
+        assert not second.try_acquire()
+        # đồng hồ của worker thứ 2 chạy nhanh 1 giờ: lease của worker 1 vẫn còn hạn
+        real_time = time.time
+        monkeypatch.setattr(time, "time", lambda: real_time() + 3600)
+        assert not second.try_acquire()
+        monkeypatch.undo()
+        # lease thật sự hết hạn -> worker khác tiếp quản
+        with engine.begin() as conn:
+            conn.execute(update(SchedulerLease).where(SchedulerLease.name == "test").values(expires_at=0))
+        assert second.try_acquire()
+        assert not first.try_acquire()
+    finally:
+        with engine.begin() as conn:
+            conn.execute(delete(SchedulerLease).where(SchedulerLease.name == "test"))
@@ -0,0 +1,103 @@
+# tests/test_mailer.py
+# mailer.Mailer gửi qua smtp_sink.SMTPSink (SMTP giả lập local): dùng lại
+# connection, gửi lại lỗi tạm thời (4xx, 421) với backoff, bỏ lỗi vĩnh viễn (5xx).
+import asyncio
+
+import pytest
+
+from config import settings
+import mailer as mailer_module
+from mailer import Mailer, OutgoingEmail, compose, encode_body, shared_headers
+from smtp_sink import SMTPSink
+
+
+@pytest.fixture
+def mail_settings(monkeypatch):
+    """Mailer trỏ tới sink local: không TLS / AUTH, retry gần như ngay lập tức."""
+    values = dict(MAIL_SERVER="127.0.0.1", MAIL_STARTTLS=False, MAIL_SSL_TLS=False, MAIL_USE_CREDENTIALS=False,
+                  MAIL_TIMEOUT=5, MAIL_POOL_SIZE=1, MAIL_BATCH_SIZE=5, MAIL_MAX_MESSAGES_PER_CONNECTION=500,
+                  MAIL_RETRY_BASE_DELAY=0.01, MAIL_RETRY_MAX_DELAY=0.05, MAIL_MAX_RETRIES=3)
+    for name, value in values.items():
+        monkeypatch.setattr(settings, name, value)
+    return settings
+
+
+def _deliver(monkeypatch, recipients: list[str]) -> SMTPSink:
+    """Gửi 1 email cho mỗi người nhận qua Mailer thật, chờ xong (kể cả gửi lại); trả về sink."""
+    async def scenario():
+        async with SMTPSink() as sink:
+            monkeypatch.setattr(settings, "MAIL_PORT", sink.port)
+            mailer = Mailer()
+            await mailer.start(precompile=False)
+            headers, body = shared_headers("test"), encode_body("<p>hello</p>")
+            for to in recipients:
+                await mailer._get_queue().put(OutgoingEmail(to, compose(to, headers, body)))
+            await asyncio.wait_for(mailer.join(), timeout=10)
+            await mailer.stop()
+            return sink
+    return asyncio.run(scenario())
+
+
+def _delivered(sink: SMTPSink) -> list[str]:
+    return [to for message in sink.messages for to in message.recipients]
+
+
+def test_batches_reuse_one_connection(mail_settings, monkeypatch):
+    recipients = [f"user{i}@example.com" for i in range(12)]
+    sink = _deliver(monkeypatch, recipients)
+    assert sorted(_delivered(sink)) == sorted(recipients)
+    assert sink.connections == 1
+
+
+def test_connection_replaced_after_max_messages(mail_settings, monkeypatch):
+    monkeypatch.setattr(settings, "MAIL_MAX_MESSAGES_PER_CONNECTION", 5)
+    sink = _deliver(monkeypatch, [f"user{i}@example.com" for i in range(12)])
+    assert len(sink.messages) == 12
+    # lô 5 + 5 + 2: đóng phiên sau mỗi lô đủ 5 email
+    assert sink.connections == 3
+
+
+def test_temporary_failure_is_retried(mail_settings, monkeypatch):
+    sink = _deliver(monkeypatch, ["a@example.com", "tempfail@example.com", "b@example.com"])
+    assert sorted(_delivered(sink)) == ["a@example.com", "b@example.com", "tempfail@example.com"]
+    # 451 chỉ làm hỏng 1 email: phần còn lại của lô đi tiếp trên cùng phiên
+    assert sink.connections == 1
+
+
+def test_permanent_failure_is_dropped(mail_settings, monkeypatch):
+    sink = _deliver(monkeypatch, ["a@example.com", "reject@example.com", "b@example.com"])
+    assert _delivered(sink) == ["a@example.com", "b@example.com"]
+
+
+def test_421_reopens_connection_and_retries_rest_of_batch(mail_settings, monkeypatch):
+    sink = _deliver(monkeypatch, ["a@example.com", "closing@example.com", "b@example.com"])
+    assert sorted(_delivered(sink)) == ["a@example.com", "b@example.com", "closing@example.com"]
+    # phiên bị server đóng không được trả lại pool
+    assert sink.connections == 2
+
+
+def test_backoff_is_exponential_with_jitter_and_bounded(mail_settings, monkeypatch):
+    monkeypatch.setattr(settings, "MAIL_RETRY_BASE_DELAY", 1)
+    monkeypatch.setattr(settings, "MAIL_RETRY_MAX_DELAY", 3)
+    delays = []
+
+    async def record(self, item, delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(mailer_module.Mailer, "_retry_later", record)
+
+    async def scenario():
+        mailer, item = Mailer(), OutgoingEmail("a@example.com", b"")
+        for _ in range(settings.MAIL_MAX_RETRIES + 1):
+            mailer._failed(item, Exception("451"), permanent=False)
+        mailer._failed(OutgoingEmail("b@example.com", b""), Exception("550"), permanent=True)
+        await asyncio.gather(*mailer._retries)
+
+    asyncio.run(scenario())
+    # lần 1..3: trong [d/2, d] với d = 1, 2, min(4, 3); lần 4 (quá MAIL_MAX_RETRIES) và 5xx: không gửi lại
+    assert len(delays) == 3
+    for delay, bound in zip(delays, (1, 2, 3)):
+        assert bound / 2 <= delay <= bound
+
+
+# Tác dụng chính: Kiểm tra Mailer (pool kết nối, retry / backoff, xử lý 421 và 5xx) với SMTP giả lập.
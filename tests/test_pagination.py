@@ -0,0 +1,30 @@
+# tests/test_pagination.py
+# Cursor sai dạng (thiếu khóa, sai kiểu) -> 400 "Invalid cursor", không phải 500.
+import pytest
+
+import pagination
+
+BAD_CURSORS = [
+    {"s": "id", "o": "asc"},                         # thiếu id
+    {"s": "price", "o": "asc", "id": 3},             # thiếu v
+    {"s": "id", "o": "asc", "id": "3"},              # id không phải số nguyên
+    {"s": "id", "o": "asc", "id": True},
+    {"s": "price", "o": "asc", "id": 3, "v": [1]},   # v không phải giá trị cột
+    {"s": "id", "o": "sideways", "id": 3},
+    ["s", "o", "id"],
+]
+
+
+@pytest.mark.parametrize("data", BAD_CURSORS)
+def test_malformed_cursor_is_rejected(client, data):
+    response = client.get("/products/", params={"cursor": pagination.encode_cursor(data)})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_cursor_from_previous_page_is_accepted(client, seed_catalog):
+    seed_catalog(products=5, categories=2, depth=1)
+    first = client.get("/products/", params={"limit": 2, "sort": "price"}).json()
+    response = client.get("/products/", params={"limit": 2, "sort": "price", "cursor": first["next_cursor"]})
+    assert response.status_code == 200
+    assert {item["id"] for item in response.json()["items"]}.isdisjoint(item["id"] for item in first["items"])
@@ -0,0 +1,95 @@
+# tests/test_popularity.py
+# Bảng xếp hạng sản phẩm phổ biến (popularity.py): ranh giới window, top-k theo
+# category (cộng dồn lên tổ tiên theo materialized path), refresh + prune trên SQLite.
+import pytest
+from sqlalchemy import insert, select
+
+import popularity
+from popularity import ALL_CATEGORIES, top_k, window_start
+
+HOUR, DAY = 3600, 86400
+# giữa giờ 12 của ngày thứ 100 (epoch UTC)
+NOW = 100 * DAY + 12 * HOUR + 1800
+
+
+@pytest.mark.parametrize("window, expected", [
+    ("1h", 100 * DAY + 11 * HOUR),
+    ("24h", 99 * DAY + 12 * HOUR),
+    ("7d", 93 * DAY),
+    ("30d", 70 * DAY),
+])
+def test_window_start_counts_full_buckets_before_the_current_one(window, expected):
+    assert window_start(window, NOW) == expected
+    # ngay đầu bucket hiện tại: vẫn cùng kết quả (bucket đang dở bắt đầu ở đó)
+    granularity, _ = popularity.WINDOWS[window]
+    assert window_start(window, popularity.bucket_start(granularity, NOW)) == expected
+
+
+def test_top_k_rolls_up_to_ancestors():
+    # 1 -> 2 -> 3, 4 là gốc riêng
+    ancestors = {1: [1], 2: [1, 2], 3: [1, 2, 3], 4: [4]}
+    # sản phẩm 13 thuộc 2 category cùng nhánh: chỉ tính 1 lần cho mỗi tổ tiên
+    links = [(10, 3), (11, 2), (12, 4), (13, 3), (13, 2), (14, 99)]
+    scores = {10: 5, 11: 7, 12: 9, 13: 5, 14: 1, 15: 6}
+
+    rankings = top_k(scores, links, ancestors, k=10)
+
+    assert rankings[ALL_CATEGORIES] == [(12, 9), (11, 7), (15, 6), (10, 5), (13, 5), (14, 1)]
+    assert rankings[1] == rankings[2] == [(11, 7), (10, 5), (13, 5)]
+    assert rankings[3] == [(10, 5), (13, 5)]
+    assert rankings[4] == [(12, 9)]
+    # category không có trong ancestors (chưa có path): chỉ tính cho chính nó
+    assert rankings[99] == [(14, 1)]
+
+
+def test_top_k_keeps_k_and_breaks_ties_by_smaller_id():
+    rankings = top_k({3: 5, 1: 5, 2: 5, 4: 1}, [], {}, k=2)
+    assert rankings == {ALL_CATEGORIES: [(1, 5), (2, 5)]}
+
+
+def test_refresh_round_trip(client, seed_catalog):
+    from config import settings
+    from db import SessionLocal
+    from models import Category, Product, ProductRanking, ProductViewBucket, product_category_table
+
+    seed_catalog(products=0, categories=0)
+    with SessionLocal() as db:
+        db.execute(insert(Category), [{"id": 1, "name": "root", "path": "/1/"},
+                                      {"id": 2, "name": "child", "parent_id": 1, "path": "/1/2/"}])
+        db.execute(insert(Product), [
+            {"id": i, "name": f"p{i}", "description": "", "price": 1, "stock_quantity": 1, "view_count": 0}
+            for i in (1, 2, 3)
+        ])
+        db.execute(insert(product_category_table), [{"product_id": 1, "category_id": 2},
+                                                    {"product_id": 2, "category_id": 1}])
+        upsert = popularity.upsert_views_stmt("sqlite")
+        # giờ hiện tại; 2 giờ trước (cùng ngày); 99 = sản phẩm đã bị xóa
+        db.execute(upsert, popularity.view_rows({1: 5, 2: 3, 3: 8, 99: 50}, NOW))
+        db.execute(upsert, popularity.view_rows({2: 10}, NOW - 2 * HOUR))
+        # quá hạn giữ bucket theo giờ -> bị prune
+        expired = popularity.bucket_start("hour", NOW) - (settings.POPULARITY_HOURLY_RETENTION + 1) * HOUR
+        db.execute(insert(ProductViewBucket), [{"granularity": "hour", "bucket_start": expired,
+                                                "product_id": 1, "views": 1}])
+        db.commit()
+
+        written = popularity.refresh(db, now=NOW)
+
+        rows = db.execute(select(ProductRanking.period, ProductRanking.category_id,
+                                 ProductRanking.product_id, ProductRanking.views)
+                          .order_by(ProductRanking.period, ProductRanking.category_id, ProductRanking.rank)).all()
+        hourly_starts = set(db.scalars(select(ProductViewBucket.bucket_start)
+                                       .where(ProductViewBucket.granularity == "hour")))
+
+    ranking = {}
+    for period, category_id, product_id, views in rows:
+        ranking.setdefault((period, category_id), []).append((product_id, views))
+    assert ranking[("1h", ALL_CATEGORIES)] == [(3, 8), (1, 5), (2, 3)]
+    assert ranking[("1h", 1)] == [(1, 5), (2, 3)]
+    assert ranking[("1h", 2)] == [(1, 5)]
+    assert ranking[("24h", ALL_CATEGORIES)] == [(2, 13), (3, 8), (1, 5)]
+    assert ranking[("7d", 1)] == [(2, 13), (1, 5)]
+    assert written == {"1h": 6, "24h": 6, "7d": 6, "30d": 6}
+    assert expired not in hourly_starts and len(hourly_starts) == 2
+
+
+# Tác dụng chính: Kiểm tra window / top-k / refresh + prune của bảng xếp hạng sản phẩm phổ biến.
@@ -0,0 +1,45 @@
+# tests/test_principal_cache.py
+# Đổi hash mật khẩu (rehash-on-login) phải xóa user khỏi principal_cache sau khi commit.
+# Rollback một SAVEPOINT không được làm mất việc xóa cache của transaction ngoài.
+import principal_cache
+import services
+from models import User
+
+
+def test_password_rehash_invalidates_cached_principal(client, monkeypatch):
+    from db import SessionLocal
+
+    with SessionLocal() as db:
+        user = User(email="rehash@example.com", hashed_password="old-hash")
+        db.add(user)
+        db.commit()
+        user_id = user.id
+
+    invalidated = []
+    monkeypatch.setattr(principal_cache.principal_cache, "invalidate_user", invalidated.append)
+    with SessionLocal() as db:
+        services.update_password_hash(db, user_id, "new-hash")
+    assert invalidated == ["rehash@example.com"]
+
+
+def test_savepoint_rollback_keeps_outer_invalidations(client, monkeypatch):
+    from db import SessionLocal
+
+    with SessionLocal() as db:
+        db.add_all([User(email="outer@example.com", hashed_password="h"),
+                    User(email="inner@example.com", hashed_password="h")])
+        db.commit()
+
+    invalidated = []
+    monkeypatch.setattr(principal_cache.principal_cache, "invalidate_user", invalidated.append)
+    with SessionLocal() as db:
+        outer = db.query(User).filter_by(email="outer@example.com").one()
+        outer.hashed_password = "changed"
+        db.flush()
+        savepoint = db.begin_nested()
+        inner = db.query(User).filter_by(email="inner@example.com").one()
+        inner.hashed_password = "changed"
+        db.flush()
+        savepoint.rollback()
+        db.commit()
+    assert "outer@example.com" in invalidated
@@ -0,0 +1,33 @@
+# tests/test_query_count.py
+# Số câu SQL của các endpoint đọc catalog KHÔNG phụ thuộc vào kích thước dữ
+# liệu (không N+1): seed 2 catalog khác cỡ, số câu phải bằng nhau.
+import pytest
+
+from tests.support import count_queries
+
+SMALL = dict(products=5, categories=4, depth=2, images=1, categories_per_product=1)
+LARGE = dict(products=60, categories=30, depth=4, images=3, categories_per_product=3)
+
+ENDPOINTS = [
+    "/categories/",
+    "/products/?limit=50",
+    "/products/1",
+]
+
+
+def _query_counts(client, seed_catalog, sizes: dict) -> dict[str, int]:
+    seed_catalog(**sizes)
+    counts = {}
+    for path in ENDPOINTS:
+        with count_queries() as counter:
+            response = client.get(path)
+        assert response.status_code == 200, response.text
+        counts[path] = counter.count
+    return counts
+
+
+@pytest.mark.parametrize("path", ENDPOINTS)
+def test_query_count_does_not_grow_with_catalog(client, seed_catalog, path):
+    small = _query_counts(client, seed_catalog, SMALL)
+    large = _query_counts(client, seed_catalog, LARGE)
+    assert large[path] == small[path], f"{path}: {small[path]} câu SQL (nhỏ) -> {large[path]} câu (lớn)"
@@ -0,0 +1,43 @@
+# tests/test_response_models.py
+# Response của các endpoint có ?view= / ?fields= được serialize bởi
+# cache.cached_response (TypeAdapter dựng 1 lần cho mỗi schema); OpenAPI phải
+# khai báo đủ các dạng có thể trả về.
+import pytest
+
+import cache
+import schemas
+
+
+def test_type_adapter_built_once_per_schema():
+    projection = schemas.product_projection(("id", "name"))
+    assert cache.type_adapter(schemas.Page[projection]) is cache.type_adapter(schemas.Page[projection])
+    assert cache.type_adapter(list[schemas.Product]) is cache.type_adapter(list[schemas.Product])
+
+
+def _response_refs(spec: dict, path: str) -> str:
+    return str(spec["paths"][path]["get"]["responses"]["200"]["content"]["application/json"]["schema"])
+
+
+@pytest.mark.parametrize("path, variants", [
+    ("/products/", ("ProductSummary", "ProductProjection")),
+    ("/categories/", ("CategorySummary",)),
+    ("/categories/{id}", ("CategorySummary",)),
+    ("/categories/{id}/products", ("ProductSummary",)),
+    ("/search/products", ("ProductSummary",)),
+])
+def test_openapi_declares_view_and_fields_variants(client, path, variants):
+    spec = client.get("/openapi.json").json()
+    refs = _response_refs(spec, path)
+    for variant in variants:
+        assert variant in refs, f"{path}: thiếu {variant} trong {refs}"
+
+
+def test_projected_items_only_carry_selected_fields(client, seed_catalog):
+    seed_catalog(products=3, categories=2, depth=1, images=1, categories_per_product=1)
+    summary = client.get("/products/", params={"view": "summary"}).json()["items"][0]
+    assert set(summary) == set(schemas.ProductSummary.model_fields)
+    projected = client.get("/products/", params={"fields": "name,price"}).json()["items"][0]
+    assert set(projected) == {"id", "name", "price"}
+
+
+# Tác dụng chính: Kiểm tra TypeAdapter dùng lại và response_model (OpenAPI) của các biến thể ?view= / ?fields=.
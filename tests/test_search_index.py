@@ -0,0 +1,14 @@
+# tests/test_search_index.py
+# Index tìm kiếm trong bộ nhớ (search.InvertedIndex): cập nhật tăng dần không làm
+# phình _vocabulary bằng term trùng.
+import search
+
+
+def test_repeated_upserts_keep_vocabulary_unique():
+    index = search.InvertedIndex("products")
+    row = {"id": 1, "name": "alpha beta", "description": "gamma", "price": 1, "stock_quantity": 1}
+    index.load([row])
+    for _ in range(5):
+        index.upsert([row], ids=[1])
+    assert index._vocabulary == sorted(set(index._vocabulary))
+    assert index._vocabulary.count("alpha") == 1
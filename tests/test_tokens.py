@@ -0,0 +1,26 @@
+# tests/test_tokens.py
+# Token giả / sai định dạng phải bị từ chối bằng TokenError (-> 401), không phải lỗi 500.
+import base64
+import json
+
+import pytest
+
+import tokens
+
+
+def _segment(data: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).rstrip(b"=").decode()
+
+
+@pytest.mark.parametrize("backend_name", sorted(tokens.BACKENDS))
+@pytest.mark.parametrize("kid", [["k1"], {"k": 1}, 1])
+def test_non_string_kid_is_rejected(backend_name, kid):
+    token = _segment({"alg": "HS256", "typ": "JWT", "kid": kid}) + "." + _segment({"sub": "a@b.com"}) + ".sig"
+    with pytest.raises(tokens.TokenError):
+        tokens.BACKENDS[backend_name]().decode(token, tokens.signing_keys(), "HS256")
+
+
+def test_forged_kid_returns_401(client):
+    token = _segment({"alg": "HS256", "typ": "JWT", "kid": ["k1"]}) + "." + _segment({"sub": "a@b.com"}) + ".sig"
+    response = client.get("/users/me", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 401
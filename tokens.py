@@ -0,0 +1,252 @@
+# tokens.py
+# Phát hành / xác thực JWT (access + refresh) cho auth.py.
+#
+# - Nhiều khóa với "kid" (JWT_KEYS) để xoay vòng khóa: token mới ký bằng
+#   JWT_ACTIVE_KID; token cũ (kid khác, hoặc không có kid -> SECRET_KEY) vẫn
+#   xác thực được cho tới khi khóa cũ bị gỡ khỏi JWT_KEYS.
+# - LRU các claims ĐÃ xác thực, key = sha256(token), hết hạn theo "exp": cùng
+#   một token không phải parse + kiểm tra chữ ký lại mỗi request.
+# - Refresh token (type="refresh", sống REFRESH_TOKEN_EXPIRE_DAYS ngày) để
+#   access token có thể ngắn hạn mà client không phải /signin (bcrypt) lại.
+#   Refresh token mang "pwd" = dấu vân tay của hashed_password: đổi mật khẩu
+#   là mọi refresh token cũ mất hiệu lực, không cần bảng lưu token.
+# - Backend thay được (JWT_BACKEND): "jose" (python-jose, mặc định) hoặc "hmac"
+#   (HS256/384/512 tự cài bằng hmac + hashlib của stdlib, nhanh hơn vì không qua
+#   lớp trừu tượng JWK; chưa được kiểm định như thư viện nên chỉ dùng để so
+#   sánh). Xem benchmarks/jwt_backends.py.
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from config import settings
+import metrics
+
+TOKEN_VERIFICATIONS = metrics.Counter("token_verifications_total", "Số lần xác thực token", ("result",))
+
+LEGACY_KID = None   # token phát hành trước khi có kid -> ký bằng SECRET_KEY
+
+
+class TokenError(Exception):
+    """Token sai định dạng, sai chữ ký, sai loại hoặc đã hết hạn."""
+
+
+# ===================================================================
+# --- KHÓA ---
+# ===================================================================
+
+def signing_keys() -> dict[str | None, bytes]:
+    """kid -> secret. Luôn có SECRET_KEY cho token không có kid."""
+    keys = {kid: secret.get_secret_value().encode() for kid, secret in settings.JWT_KEYS.items()}
+    keys[LEGACY_KID] = settings.SECRET_KEY.get_secret_value().encode()
+    return keys
+
+
+def active_kid() -> str | None:
+    if settings.JWT_ACTIVE_KID is not None and settings.JWT_ACTIVE_KID not in settings.JWT_KEYS:
+        raise RuntimeError(f"JWT_ACTIVE_KID={settings.JWT_ACTIVE_KID!r} không có trong JWT_KEYS")
+    return settings.JWT_ACTIVE_KID
+
+
+# ===================================================================
+# --- BACKENDS ---
+# ===================================================================
+
+class JoseBackend:
+    name = "jose"
+
+    def encode(self, claims: dict, key: bytes, kid: str | None, algorithm: str) -> str:
+        from jose import jwt
+        headers = {"kid": kid} if kid is not None else None
+        return jwt.encode(claims, key.decode(), algorithm=algorithm, headers=headers)
+
+    def decode(self, token: str, keys: dict, algorithm: str) -> dict:
+        from jose import JWTError, jwt
+        try:
+            kid = _key_id(jwt.get_unverified_header(token))
+            if kid not in keys:
+                raise TokenError("Unknown key id")
+            return jwt.decode(token, keys[kid].decode(), algorithms=[algorithm])
+        except JWTError as e:
+            raise TokenError(str(e))
+
+
+def _key_id(header: dict) -> str | None:
+    """kid trong header; kid không phải chuỗi (vd: list -> không hash được) là token giả."""
+    kid = header.get("kid")
+    if kid is not None and not isinstance(kid, str):
+        raise TokenError("Invalid key id")
+    return kid
+
+
+def _b64encode(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+def _b64decode(data: bytes) -> bytes:
+    return base64.urlsafe_b64decode(data + b"=" * (-len(data) % 4))
+
+
+class HmacBackend:
+    """JWT HS256/384/512 tối giản: chỉ những gì ứng dụng cần (kid, exp, nbf)."""
+    name = "hmac"
+    _digests = {"HS256": hashlib.sha256, "HS384": hashlib.sha384, "HS512": hashlib.sha512}
+
+    def _sign(self, signing_input: bytes, key: bytes, algorithm: str) -> bytes:
+        try:
+            digest = self._digests[algorithm]
+        except KeyError:
+            raise TokenError(f"Unsupported algorithm {algorithm}")
+        return hmac.new(key, signing_input, digest).digest()
+
+    def encode(self, claims: dict, key: bytes, kid: str | None, algorithm: str) -> str:
+        header = {"alg": algorithm, "typ": "JWT"}
+        if kid is not None:
+            header["kid"] = kid
+        signing_input = (
+            _b64encode(json.dumps(header, separators=(",", ":")).encode())
+            + b"."
+            + _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+        )
+        signature = _b64encode(self._sign(signing_input, key, algorithm))
+        return (signing_input + b"." + signature).decode()
+
+    def decode(self, token: str, keys: dict, algorithm: str) -> dict:
+        try:
+            raw = token.encode()
+            signing_input, signature = raw.rsplit(b".", 1)
+            header_segment, payload_segment = signing_input.split(b".")
+            header = json.loads(_b64decode(header_segment))
+        except (ValueError, UnicodeError):
+            raise TokenError("Malformed token")
+        if not isinstance(header, dict) or header.get("alg") != algorithm:
+            raise TokenError("Unexpected algorithm")
+        kid = _key_id(header)
+        if kid not in keys:
+            raise TokenError("Unknown key id")
+        try:
+            expected = self._sign(signing_input, keys[kid], algorithm)
+            valid = hmac.compare_digest(expected, _b64decode(signature))
+        except ValueError:
+            valid = False
+        if not valid:
+            raise TokenError("Signature verification failed")
+        try:
+            claims = json.loads(_b64decode(payload_segment))
+        except ValueError:
+            raise TokenError("Malformed token")
+        if not isinstance(claims, dict):
+            raise TokenError("Malformed token")
+        now = time.time()
+        if "exp" in claims and not (isinstance(claims["exp"], (int, float)) and now < claims["exp"]):
+            raise TokenError("Signature has expired")
+        if "nbf" in claims and not (isinstance(claims["nbf"], (int, float)) and now >= claims["nbf"]):
+            raise TokenError("The token is not yet valid")
+        return claims
+
+
+BACKENDS = {"jose": JoseBackend, "hmac": HmacBackend}
+backend = BACKENDS[settings.JWT_BACKEND]()
+
+
+# ===================================================================
+# --- LRU CLAIMS ĐÃ XÁC THỰC ---
+# ===================================================================
+
+class VerifiedClaimsCache:
+    """sha256(token) -> claims; entry hết hạn cùng lúc với token (thread-safe)."""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._data: OrderedDict[str, dict] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            claims = self._data.get(key)
+            if claims is None:
+                return None
+            if claims.get("exp", float("inf")) <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return claims
+
+    def set(self, key: str, claims: dict):
+        with self._lock:
+            self._data[key] = claims
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+verified_claims = VerifiedClaimsCache(settings.JWT_CLAIMS_CACHE_SIZE)
+
+
+# ===================================================================
+# --- API ---
+# ===================================================================
+
+def _timestamp(value) -> int:
+    return int(value.timestamp()) if isinstance(value, datetime) else int(value)
+
+
+def encode(claims: dict) -> str:
+    """Ký `claims` bằng khóa đang hoạt động (datetime trong exp/iat/nbf -> epoch)."""
+    claims = dict(claims)
+    for name in ("exp", "iat", "nbf"):
+        if name in claims:
+            claims[name] = _timestamp(claims[name])
+    kid = active_kid()
+    return backend.encode(claims, signing_keys()[kid], kid, settings.ALGORITHM)
+
+
+def decode(token: str, expected_type: str = "access", use_cache: bool = True) -> dict:
+    """
+    Xác thực chữ ký + hạn của token và trả về claims.
+    Token không có "type" được coi là access token (phát hành trước khi có refresh).
+    """
+    key = hashlib.sha256(token.encode()).hexdigest() if use_cache else None
+    claims = verified_claims.get(key) if key else None
+    if claims is not None:
+        TOKEN_VERIFICATIONS.inc(result="cached")
+    else:
+        try:
+            claims = backend.decode(token, signing_keys(), settings.ALGORITHM)
+        except TokenError:
+            TOKEN_VERIFICATIONS.inc(result="invalid")
+            raise
+        TOKEN_VERIFICATIONS.inc(result="verified")
+        if key:
+            verified_claims.set(key, claims)
+    if claims.get("type", "access") != expected_type:
+        raise TokenError("Wrong token type")
+    return claims
+
+
+def password_fingerprint(hashed_password: str) -> str:
+    """Dấu vân tay ngắn của hash mật khẩu (không lộ hash) để gắn vào refresh token."""
+    return hashlib.sha256(hashed_password.encode()).hexdigest()[:16]
+
+
+def create_refresh_token(subject: str, hashed_password: str) -> str:
+    expire = datetime.now(timezone.utc) + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+    return encode({
+        "sub": subject,
+        "exp": expire,
+        "type": "refresh",
+        "jti": secrets.token_hex(8),
+        "pwd": password_fingerprint(hashed_password),
+    })
+
+
+# Tác dụng chính: Ký / xác thực JWT có xoay vòng khóa, cache claims và refresh token.
@@ -0,0 +1,110 @@
+# uow.py
+# Unit of work: gom nhiều thao tác ghi của services / async_services vào 1 transaction.
+#
+# Mặc định mỗi hàm ghi tự kết thúc transaction của nó (như trước). Trong khối
+# unit_of_work các hàm ghi chỉ flush (xem commit()); khối ngoài cùng commit 1
+# lần khi thoát, hoặc rollback nếu có lỗi. Khối lồng nhau nhập vào khối ngoài.
+#
+#   with uow.unit_of_work(db):
+#       category = services.create_category(db, CategoryCreate(name="Sách"))
+#       services.create_product(db, ProductCreate(..., categories=[category.id]))
+#
+#   async with uow.unit_of_work_async(db):
+#       ...   # async_services, cùng cách dùng
+#
+# Không có câu SELECT nào sau khi ghi:
+#   - commit KHÔNG expire các object đã nạp (expire_on_commit=False cho riêng lần
+#     commit đó) -> không cần db.refresh() / lazy load lại để trả response;
+#   - id và giá trị mặc định phía server có sẵn từ INSERT ... RETURNING
+#     (eager_defaults của SQLAlchemy);
+#   - sửa / xóa theo id là 1 câu UPDATE / DELETE ... WHERE id = :id RETURNING *.
+# Cache (cache.invalidates) của các hàm ghi trong khối chỉ bị vô hiệu hóa sau
+# khi transaction commit.
+from contextlib import asynccontextmanager, contextmanager
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+_DEPTH_KEY = "unit_of_work_depth"
+
+
+def active(db: Session | AsyncSession) -> bool:
+    """True nếu `db` đang ở trong một khối unit_of_work."""
+    return db.info.get(_DEPTH_KEY, 0) > 0
+
+
+@contextmanager
+def _keep_loaded(db: Session | AsyncSession):
+    """Tắt expire_on_commit trong lúc commit: object vừa ghi vẫn dùng được ngay."""
+    session = db.sync_session if isinstance(db, AsyncSession) else db
+    expire = session.expire_on_commit
+    session.expire_on_commit = False
+    try:
+        yield
+    finally:
+        session.expire_on_commit = expire
+
+
+# ===================================================================
+# --- KẾT THÚC 1 THAO TÁC GHI (dùng trong services) ---
+# ===================================================================
+
+def commit(db: Session):
+    """Trong unit of work: chỉ flush. Ngoài: commit (không expire object)."""
+    if active(db):
+        db.flush()
+        return
+    with _keep_loaded(db):
+        db.commit()
+
+
+async def commit_async(db: AsyncSession):
+    """Như commit() cho AsyncSession."""
+    if active(db):
+        await db.flush()
+        return
+    with _keep_loaded(db):
+        await db.commit()
+
+
+# ===================================================================
+# --- KHỐI UNIT OF WORK (dùng ở nơi gọi) ---
+# ===================================================================
+
+@contextmanager
+def unit_of_work(db: Session):
+    depth = db.info.get(_DEPTH_KEY, 0)
+    db.info[_DEPTH_KEY] = depth + 1
+    try:
+        yield db
+        if depth == 0:
+            db.info[_DEPTH_KEY] = 0
+            with _keep_loaded(db):
+                db.commit()
+    except BaseException:
+        if depth == 0:
+            db.rollback()
+        raise
+    finally:
+        db.info[_DEPTH_KEY] = depth
+
+
+@asynccontextmanager
+async def unit_of_work_async(db: AsyncSession):
+    depth = db.info.get(_DEPTH_KEY, 0)
+    db.info[_DEPTH_KEY] = depth + 1
+    try:
+        yield db
+        if depth == 0:
+            db.info[_DEPTH_KEY] = 0
+            with _keep_loaded(db):
+                await db.commit()
+    except BaseException:
+        if depth == 0:
+            await db.rollback()
+        raise
+    finally:
+        db.info[_DEPTH_KEY] = depth
+
+
+# Tác dụng chính: Gom nhiều thao tác ghi vào 1 transaction và commit không kèm SELECT lại (refresh).
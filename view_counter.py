@@ -0,0 +1,232 @@
+# view_counter.py
+# Gom lượt xem sản phẩm trong bộ nhớ rồi ghi xuống DB theo lô, thay vì
+# mỗi GET /products/{id} là một transaction UPDATE + COMMIT + SELECT.
+#
+#   GET  -> view_counter.record(product_id)           (chỉ tăng bộ đếm, không IO)
+#   định kỳ / khi đủ ngưỡng -> flush():
+#       UPDATE "Products" SET view_count = view_count + CASE id WHEN .. THEN .. END
+#       WHERE id IN (...)                               (1 câu, cộng dồn nguyên tử)
+#
+# Backend giữ số lượt chưa ghi có thể thay thế: mặc định là bộ nhớ của từng
+# worker; dùng RedisCounterBackend để nhiều worker chia sẻ chung một bộ đếm.
+import asyncio
+import threading
+import uuid
+from collections import Counter
+
+from fastapi.concurrency import run_in_threadpool
+
+from config import settings
+import metrics
+
+VIEW_FLUSHES = metrics.Counter("view_counter_flushes_total", "Số lần ghi lượt xem xuống DB", ("result",))
+VIEW_FLUSHED_ROWS = metrics.Counter("view_counter_flushed_views_total", "Tổng lượt xem đã ghi xuống DB")
+VIEW_PENDING = metrics.Gauge(
+    "view_counter_pending_views", "Số lượt xem đang chờ ghi",
+    callback=lambda: {(): view_counter.backend.total()},
+)
+
+
+class CounterBackend:
+    """Giao diện backend lưu các lượt xem chưa được ghi xuống DB."""
+
+    def incr(self, key: int, amount: int = 1) -> int:
+        """Tăng bộ đếm của key; trả về TỔNG số lượt đang chờ (mọi key)."""
+        raise NotImplementedError
+
+    def get(self, key: int) -> int:
+        raise NotImplementedError
+
+    def total(self) -> int:
+        raise NotImplementedError
+
+    def drain(self) -> dict[int, int]:
+        """Lấy ra và xóa TOÀN BỘ số đếm đang chờ (nguyên tử)."""
+        raise NotImplementedError
+
+    def merge(self, counts: dict[int, int]):
+        """Trả lại số đếm (khi flush thất bại) để không mất lượt xem."""
+        for key, amount in counts.items():
+            self.incr(key, amount)
+
+
+class InMemoryCounterBackend(CounterBackend):
+    """Bộ đếm trong bộ nhớ của một worker (thread-safe)."""
+
+    def __init__(self):
+        self._counts: Counter = Counter()
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def incr(self, key: int, amount: int = 1) -> int:
+        with self._lock:
+            self._counts[key] += amount
+            self._total += amount
+            return self._total
+
+    def get(self, key: int) -> int:
+        return self._counts.get(key, 0)
+
+    def total(self) -> int:
+        return self._total
+
+    def drain(self) -> dict[int, int]:
+        with self._lock:
+            counts, self._counts, self._total = dict(self._counts), Counter(), 0
+        return counts
+
+
+class RedisCounterBackend(CounterBackend):
+    """
+    Bộ đếm dùng chung giữa các worker, lưu trong một Redis hash; tổng số lượt
+    đang chờ giữ ở key riêng (`<key>:total`) để incr() không phải đọc cả hash.
+    `client`: redis.Redis (hoặc object tương thích: pipeline/hget/get/rename/hgetall/delete/decrby).
+    """
+
+    def __init__(self, client, key: str = "product_views"):
+        self.client = client
+        self.key = key
+        self.total_key = f"{key}:total"
+
+    def incr(self, key: int, amount: int = 1) -> int:
+        # hash + tổng trong 1 MULTI / EXEC (1 round-trip)
+        pipe = self.client.pipeline()
+        pipe.hincrby(self.key, str(key), amount)
+        pipe.incrby(self.total_key, amount)
+        return int(pipe.execute()[1])
+
+    def get(self, key: int) -> int:
+        value = self.client.hget(self.key, str(key))
+        return int(value) if value else 0
+
+    def total(self) -> int:
+        value = self.client.get(self.total_key)
+        return max(int(value), 0) if value else 0
+
+    def drain(self) -> dict[int, int]:
+        # RENAME là nguyên tử: các lượt xem mới sẽ vào hash mới, không bị mất.
+        # Tên đích riêng cho mỗi lần drain: 2 worker flush cùng lúc không ghi đè hash của nhau
+        draining = f"{self.key}:draining:{uuid.uuid4().hex}"
+        try:
+            self.client.rename(self.key, draining)
+        except Exception:
+            # hash chưa tồn tại -> không có gì để ghi
+            return {}
+        pipe = self.client.pipeline()
+        pipe.hgetall(draining)
+        pipe.delete(draining)
+        raw, _ = pipe.execute()
+        counts = {int(k): int(v) for k, v in raw.items()}
+        if counts:
+            self.client.decrby(self.total_key, sum(counts.values()))
+        return counts
+
+
+def _make_backend() -> CounterBackend:
+    if settings.VIEW_COUNT_REDIS_URL:
+        import redis  # thư viện tùy chọn, chỉ cần khi dùng backend Redis
+        return RedisCounterBackend(redis.Redis.from_url(settings.VIEW_COUNT_REDIS_URL))
+    return InMemoryCounterBackend()
+
+
+class ViewCounter:
+    def __init__(self, backend: CounterBackend | None = None):
+        self.backend = backend or InMemoryCounterBackend()
+        self._task: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._wakeup: asyncio.Event | None = None
+
+    # --- Ghi nhận / đọc ---
+
+    def record(self, product_id: int, amount: int = 1):
+        """Ghi nhận lượt xem (không đụng tới DB). An toàn khi gọi từ thread khác."""
+        total = self.backend.incr(product_id, amount)
+        if total >= settings.VIEW_COUNT_FLUSH_THRESHOLD and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def pending(self, product_id: int) -> int:
+        """Số lượt xem của sản phẩm chưa được ghi xuống DB."""
+        return self.backend.get(product_id)
+
+    def apply(self, products):
+        """Cộng số lượt đang chờ vào view_count của các schema Product trả về."""
+        for product in products:
+            product.view_count += self.pending(product.id)
+        return products
+
+    # --- Ghi xuống DB ---
+
+    def flush_sync(self, session_factory=None) -> int:
+        """Ghi toàn bộ lượt đang chờ bằng 1 câu UPDATE (engine sync)."""
+        import services
+        from db import SessionLocal
+        counts = self.backend.drain()
+        if not counts:
+            return 0
+        try:
+            with (session_factory or SessionLocal)() as db:
+                services.add_product_views(db, counts)
+        except Exception:
+            self.backend.merge(counts)
+            VIEW_FLUSHES.inc(result="error")
+            raise
+        VIEW_FLUSHES.inc(result="ok")
+        VIEW_FLUSHED_ROWS.inc(sum(counts.values()))
+        return len(counts)
+
+    async def flush(self) -> int:
+        """Ghi lượt đang chờ theo chế độ DB hiện tại (asyncpg hoặc threadpool)."""
+        if not settings.USE_ASYNC_DB:
+            return await run_in_threadpool(self.flush_sync)
+        import async_services
+        from db import AsyncSessionLocal
+        counts = self.backend.drain()
+        if not counts:
+            return 0
+        try:
+            async with AsyncSessionLocal() as db:
+                await async_services.add_product_views(db, counts)
+        except Exception:
+            self.backend.merge(counts)
+            VIEW_FLUSHES.inc(result="error")
+            raise
+        VIEW_FLUSHES.inc(result="ok")
+        VIEW_FLUSHED_ROWS.inc(sum(counts.values()))
+        return len(counts)
+
+    # --- Vòng lặp nền (khởi động / dừng trong lifespan) ---
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.VIEW_COUNT_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Không thể ghi lượt xem: {e}")
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Dừng vòng lặp nền và ghi nốt các lượt xem còn lại."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._loop = None
+        await self.flush()
+
+
+view_counter = ViewCounter(_make_backend())
+
+
+# Tác dụng chính: Đếm lượt xem sản phẩm theo lô thay vì commit mỗi lần GET.